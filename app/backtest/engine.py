@@ -0,0 +1,266 @@
+"""
+Vectorized backtest of feed_daily picks: buy at close, sell at next open or close.
+
+All picks of all filters are simulated in one pass over dense arrays, there is
+no per-trade or per-day python loop.
+"""
+
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+from pandas import DataFrame, Series
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.backtest.panel import PricePanel, load_price_panel
+from app.db.models import FeedDaily
+from app.filter.misc import StockFilter, get_filter_id
+from app.profile.tracer import trace_elapsed
+
+
+EXIT_NEXT_OPEN = 'next_open'
+EXIT_NEXT_CLOSE = 'next_close'
+
+# calendar days loaded past end_day so that the last picks can exit
+EXIT_LOOKAHEAD_DAYS = 30
+
+
+@dataclass
+class BacktestConfig:
+    capital:            float   = 1_000_000.0
+    # fraction of capital committed to each pick
+    position_size:      float   = 0.1
+    # at most this many buys per filter per day, ranked by collection performance
+    max_positions:      int     = 10
+    # A-share board lot
+    lot_size:           int     = 100
+    commission_rate:    float   = 0.00025
+    min_commission:     float   = 5.0
+    # sell side only
+    stamp_tax_rate:     float   = 0.0005
+    exit:               str     = EXIT_NEXT_OPEN
+
+    def __post_init__(self):
+        if self.exit not in (EXIT_NEXT_OPEN, EXIT_NEXT_CLOSE):
+            raise ValueError(f"exit {self.exit} not supported")
+        if self.position_size * self.max_positions > 1.0:
+            raise ValueError("position_size * max_positions must not exceed 1.0")
+
+
+@dataclass
+class BacktestResult:
+    filter_id:  int
+    trades:     DataFrame
+    equity:     Series
+    stats:      Dict[str, float] = field(default_factory=dict)
+
+
+def load_feed_picks(
+    engine: Engine,
+    start_day: date,
+    end_day: date,
+    filter_ids: Optional[List[int]] = None,
+) -> DataFrame:
+    stmt = (
+        select(
+            FeedDaily.filter_id,
+            FeedDaily.trade_day,
+            FeedDaily.code,
+            FeedDaily.collection_performance,
+        )
+        .where(FeedDaily.trade_day.between(start_day, end_day))
+    )
+    if filter_ids is not None:
+        stmt = stmt.where(FeedDaily.filter_id.in_(filter_ids))
+
+    with Session(engine) as session:
+        result = session.execute(stmt)
+        return DataFrame(result.all(), columns=list(result.keys()))
+
+
+def simulate_trades(picks: DataFrame, panel: PricePanel, config: BacktestConfig) -> DataFrame:
+    '''
+    Turns picks of (filter_id, trade_day, code, collection_performance) into trades.
+
+    T+1 is respected by construction, a position bought at the close of day t is
+    sold at the first bar strictly after t. Suspended stocks are held until they
+    trade again, positions with no later bar in the panel are left open and
+    marked to the last close.
+    '''
+
+    picks = picks.sort_values(
+        ['filter_id', 'trade_day', 'collection_performance'],
+        ascending=[True, True, False],
+        na_position='last',
+    )
+    rank = picks.groupby(['filter_id', 'trade_day'], sort=False).cumcount().to_numpy()
+
+    day_idx = panel.day_index(picks['trade_day'])
+    code_idx = panel.code_index(picks['code'])
+    T = len(panel.days)
+
+    keep = (rank < config.max_positions) & (day_idx >= 0) & (code_idx >= 0)
+    buy_price = np.full(len(picks), np.nan)
+    buy_price[keep] = panel.close[day_idx[keep], code_idx[keep]]
+    keep &= ~np.isnan(buy_price)
+
+    picks = picks[keep]
+    day_idx, code_idx, buy_price = day_idx[keep], code_idx[keep], buy_price[keep]
+
+    # sizing
+    notional = config.capital * config.position_size
+    shares = np.floor(notional / (buy_price * config.lot_size)) * config.lot_size
+
+    # exit
+    exit_field = 'open' if config.exit == EXIT_NEXT_OPEN else 'close'
+    exit_idx = panel.next_valid_index(exit_field)[day_idx, code_idx]
+    closed = exit_idx < T
+
+    # still open positions are marked to the last close available
+    last_close_idx = T - 1 - np.argmax(~np.isnan(panel.close[::-1]), axis=0)
+    mark_idx = np.where(closed, exit_idx, last_close_idx[code_idx])
+    sell_price = np.where(
+        closed,
+        panel.fields[exit_field][np.minimum(exit_idx, T - 1), code_idx],
+        panel.close[mark_idx, code_idx],
+    )
+
+    # fees
+    buy_value = shares * buy_price
+    sell_value = shares * sell_price
+    buy_fee = np.maximum(buy_value * config.commission_rate, config.min_commission)
+    sell_fee = (
+        np.maximum(sell_value * config.commission_rate, config.min_commission)
+        + sell_value * config.stamp_tax_rate
+    )
+    buy_fee = np.where(shares > 0, buy_fee, 0.0)
+    sell_fee = np.where(shares > 0, sell_fee, 0.0)
+
+    pnl = sell_value - buy_value - buy_fee - sell_fee
+    cost = buy_value + buy_fee
+    ret = np.divide(pnl, cost, out=np.zeros_like(pnl), where=cost > 0)
+
+    return DataFrame({
+        'filter_id':    picks['filter_id'].to_numpy(),
+        'code':         picks['code'].to_numpy(),
+        'buy_day':      panel.days[day_idx],
+        'sell_day':     panel.days[mark_idx],
+        'buy_idx':      day_idx,
+        'sell_idx':     mark_idx,
+        'closed':       closed,
+        'shares':       shares,
+        'buy_price':    buy_price,
+        'sell_price':   sell_price,
+        'fee':          buy_fee + sell_fee,
+        'pnl':          pnl,
+        'return':       ret,
+    })
+
+
+def summarize(trades: DataFrame, panel: PricePanel, config: BacktestConfig) -> Dict[int, BacktestResult]:
+    '''
+    Aggregates trades into one daily equity curve and stats per filter.
+    '''
+
+    results: Dict[int, BacktestResult] = {}
+    T = len(panel.days)
+    if trades.shape[0] == 0:
+        return results
+
+    filter_values, filter_pos = np.unique(trades['filter_id'].to_numpy(), return_inverse=True)
+    F = len(filter_values)
+
+    # realized on the sell day, one bincount for all filters
+    traded = trades['shares'].to_numpy() > 0
+    flat = filter_pos * T + trades['sell_idx'].to_numpy()
+    daily_pnl = np.bincount(flat[traded], weights=trades['pnl'].to_numpy()[traded], minlength=F * T).reshape(F, T)
+    equity = config.capital + np.cumsum(daily_pnl, axis=1)
+
+    running_max = np.maximum.accumulate(equity, axis=1)
+    drawdown = 1.0 - equity / running_max
+    daily_ret = daily_pnl / config.capital
+    ret_std = daily_ret.std(axis=1)
+    sharpe = np.divide(daily_ret.mean(axis=1), ret_std, out=np.zeros(F), where=ret_std > 0) * np.sqrt(250)
+
+    n_trades = np.bincount(filter_pos[traded], minlength=F)
+    n_wins = np.bincount(filter_pos[traded & (trades['pnl'].to_numpy() > 0)], minlength=F)
+    sum_ret = np.bincount(filter_pos[traded], weights=trades['return'].to_numpy()[traded], minlength=F)
+    fees = np.bincount(filter_pos[traded], weights=trades['fee'].to_numpy()[traded], minlength=F)
+
+    for i, filter_id in enumerate(filter_values.tolist()):
+        results[filter_id] = BacktestResult(
+            filter_id=filter_id,
+            trades=trades[filter_pos == i].reset_index(drop=True),
+            equity=Series(equity[i], index=panel.days, name='equity'),
+            stats={
+                'trades':           int(n_trades[i]),
+                'win_rate':         float(n_wins[i] / n_trades[i]) if n_trades[i] else 0.0,
+                'avg_return':       float(sum_ret[i] / n_trades[i]) if n_trades[i] else 0.0,
+                'total_return':     float(equity[i, -1] / config.capital - 1.0) if T else 0.0,
+                'max_drawdown':     float(drawdown[i].max()) if T else 0.0,
+                'sharpe':           float(sharpe[i]),
+                'fees':             float(fees[i]),
+            },
+        )
+
+    return results
+
+
+def run_backtest(picks: DataFrame, panel: PricePanel, config: Optional[BacktestConfig] = None) -> Dict[int, BacktestResult]:
+    if config is None:
+        config = BacktestConfig()
+
+    trades = simulate_trades(picks, panel, config)
+    return summarize(trades, panel, config)
+
+
+@trace_elapsed(unit='s')
+def backtest_feed_daily(
+    engine: Engine,
+    start_day: date,
+    end_day: date,
+    filter_ids: Optional[List[int]] = None,
+    config: Optional[BacktestConfig] = None,
+) -> Dict[int, BacktestResult]:
+    '''
+    Backtests every registered filter, or the given ones, over [start_day, end_day].
+    '''
+
+    if filter_ids is None:
+        filter_ids = [get_filter_id(sf) for sf in StockFilter]
+
+    picks = load_feed_picks(engine, start_day, end_day, filter_ids)
+    if picks.shape[0] == 0:
+        logger.warning(f"No picks in feed_daily from {start_day} to {end_day}")
+        return {}
+
+    panel = load_price_panel(
+        engine,
+        start_day,
+        end_day + timedelta(days=EXIT_LOOKAHEAD_DAYS),
+        codes=sorted(set(picks['code'])),
+        fields=('open', 'close'),
+    )
+    results = run_backtest(picks, panel, config)
+
+    for filter_id, result in results.items():
+        logger.success(f"Backtest of filter {filter_id} from {start_day} to {end_day}: {result.stats}")
+
+    return results
+
+
+if __name__ == '__main__':
+    from app.db.engine import engine_from_env
+
+    results = backtest_feed_daily(
+        engine_from_env(),
+        start_day=date(2025, 1, 2),
+        end_day=date(2025, 3, 10),
+    )
+    for filter_id, result in results.items():
+        print(filter_id, result.stats)
+        print(result.trades.head(10))
@@ -3,13 +3,15 @@ from typing import List, Optional
 
 from loguru import logger
 from pandas import DataFrame
-from sqlalchemy import delete, insert
+from sqlalchemy import delete, insert, select
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
 
 from app.constant.schedule import previous_trade_day
 from app.db.models import FeedDaily
-from app.profile.tracer import trace_elapsed
+from app.db.version import bump_version, snapshot
+from app.filter.tail_scraper import filter_inputs
+from app.profile.tracer import annotate, trace_elapsed
 
 
 @trace_elapsed()
@@ -17,7 +19,12 @@ def refresh_feed_daily_table(
     engine: Engine,
     fds: List[FeedDaily],
     trade_day: Optional[date] = None,
+    materialized: Optional[bool] = True,
 ) -> DataFrame:
+    '''
+    Replaces the day's picks, recording the versions of what the filter read,
+    materialized or not, see filter_inputs.
+    '''
     if trade_day is None:
         trade_day = previous_trade_day(date.today(), inclusive=True)
 
@@ -29,20 +36,35 @@ def refresh_feed_daily_table(
     data = df.to_dict(orient="records")
 
     with Session(engine) as session:
-        delete_stmt = delete(FeedDaily).where(FeedDaily.trade_day == trade_day)
-        insert_stmt = insert(FeedDaily).values(data)
-
-        session.execute(delete_stmt)
-        session.execute(insert_stmt)
+        session.execute(delete(FeedDaily).where(FeedDaily.trade_day == trade_day))
+        # a day without picks is recorded all the same
+        if data:
+            session.execute(insert(FeedDaily).values(data))
+        # the versions the picks were filtered from
+        bump_version(session, FeedDaily.__tablename__, [trade_day], inputs=snapshot(session, filter_inputs(trade_day, materialized)))
 
         session.commit()
         logger.success(
             f"A total {df.shape[0]} of matching records committed into feed_daily"
         )
+    annotate(trade_day=trade_day.isoformat(), rows=df.shape[0])
 
     return df
 
 
+def read_feed_daily(engine: Engine, trade_day: date) -> DataFrame:
+    '''
+    The day's picks of every filter as refresh_feed_daily_table returned them, in the filter's order.
+    '''
+    with Session(engine) as session:
+        fds = session.execute(
+            select(FeedDaily)
+            .where(FeedDaily.trade_day == trade_day)
+            .order_by(FeedDaily.filter_id, FeedDaily.collection_performance.desc(), FeedDaily.collection_name.desc())
+        ).scalars().all()
+        return FeedDaily.to_dataframe(list(fds))
+
+
 if __name__ == "__main__":
     from app.db.engine import engine_from_env
     from app.filter.tail_scraper import filter_desired
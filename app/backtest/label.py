@@ -0,0 +1,130 @@
+"""
+Labels feed_daily picks with what happened afterwards: next open/close, forward
+returns over several horizons and the max drawdown within the longest horizon.
+
+Everything is done in one UPDATE ... FROM over a window-function pass of
+stock_daily. Picks whose longest horizon is already labeled are skipped, so
+re-runs only touch newly matured picks. A pick still short of its longest
+horizon LABEL_GRACE_DAYS trade days after it should have matured, a delisted
+or long suspended stock, keeps its partial labels and is not scanned again.
+"""
+
+from datetime import date
+from typing import Tuple
+
+from loguru import logger
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.constant.schedule import trade_calendar
+from app.db.models import FeedDaily
+from app.profile.tracer import trace_elapsed
+
+
+LABEL_HORIZONS: Tuple[int, ...] = (1, 3, 5, 10, 20)
+# trade days past the longest horizon a pick is still relabeled
+LABEL_GRACE_DAYS = 20
+LABEL_COLUMNS = (
+    ['next_open', 'next_close']
+    + [f'return_{h}d' for h in LABEL_HORIZONS]
+    + ['max_drawdown']
+)
+
+
+def build_label_sql(horizons: Tuple[int, ...] = LABEL_HORIZONS) -> str:
+    longest = max(horizons)
+
+    lead_closes = ",\n".join(
+        f"                {f'LEAD(close, {h}) OVER w':48}AS close_{h}d"
+        for h in horizons
+    )
+    set_returns = ",\n".join(
+        f"        {f'return_{h}d':16}= 100.0 * fwd.close_{h}d / fd.close - 100.0"
+        for h in horizons
+    )
+
+    # the CTE inside FROM, a statement starting with WITH reports no rowcount on sqlite
+    return f"""
+UPDATE feed_daily AS fd
+SET
+        next_open       = fwd.next_open,
+        next_close      = fwd.next_close,
+{set_returns},
+        max_drawdown    = CASE WHEN fwd.min_low < fd.close THEN 100.0 - 100.0 * fwd.min_low / fd.close ELSE 0.0 END,
+        last_updated    = CURRENT_TIMESTAMP
+FROM
+(
+        WITH pending AS
+        (
+                SELECT code, MIN(trade_day) AS trade_day
+                FROM feed_daily
+                WHERE return_{longest}d IS NULL AND trade_day >= :since
+                GROUP BY code
+        )
+        SELECT
+                sd.code,
+                sd.trade_day,
+                LEAD(open, 1) OVER w                            AS next_open,
+                LEAD(close, 1) OVER w                           AS next_close,
+{lead_closes},
+                MIN(low) OVER (w ROWS BETWEEN 1 FOLLOWING AND {longest} FOLLOWING) AS min_low
+        FROM stock_daily sd
+        JOIN pending p ON sd.code = p.code AND sd.trade_day >= p.trade_day
+        WINDOW w AS (PARTITION BY sd.code ORDER BY sd.trade_day)
+) AS fwd
+WHERE
+        fd.code = fwd.code AND
+        fd.trade_day = fwd.trade_day AND
+        fd.return_{longest}d IS NULL AND
+        fd.trade_day >= :since AND
+        fwd.next_close IS NOT NULL;
+"""
+
+
+LABEL_FEED_DAILY_SQL = build_label_sql()
+
+
+def ensure_label_columns(engine: Engine) -> bool:
+    '''
+    Adds the label columns to a feed_daily created before they existed.
+    Whether anything was added.
+    '''
+    table = FeedDaily.__table__
+
+    with Session(engine) as session:
+        inspector = inspect(session.connection())
+        if not inspector.has_table(table.name):
+            return False
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        missing = [name for name in LABEL_COLUMNS if name not in existing]
+        for name in missing:
+            column_type = table.c[name].type.compile(dialect=session.get_bind().dialect)     # type: ignore
+            session.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}"))
+        session.commit()
+
+    return len(missing) > 0
+
+
+def label_since(trade_day: date, horizons: Tuple[int, ...] = LABEL_HORIZONS) -> date:
+    '''
+    Earliest pick still labeled on trade_day.
+    '''
+    return trade_calendar().offset(trade_day, -(max(horizons) + LABEL_GRACE_DAYS))
+
+
+@trace_elapsed(unit='s')
+def label_feed_daily(engine: Engine, trade_day: date) -> int:
+    with Session(engine) as session:
+        result = session.execute(text(LABEL_FEED_DAILY_SQL), {'since': label_since(trade_day)})
+        session.commit()
+
+    logger.success(f"Labeled a total of {result.rowcount} picks in feed_daily")
+    return result.rowcount
+
+
+if __name__ == '__main__':
+    from app.db.engine import engine_from_env
+
+    print(LABEL_FEED_DAILY_SQL)
+    label_feed_daily(engine_from_env(), date.today())
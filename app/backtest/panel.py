@@ -0,0 +1,180 @@
+"""
+Dense (trade_day x code) price panel built from stock_daily, for vectorized backtests.
+Days archived into Parquet are read along, see app.db.archive.
+
+Loaded panels are kept in a small cache keyed by the version of their
+stock_daily range, see app.db.version, so repeated loads of unchanged days,
+e.g. by the serve daemon or walk-forward reruns, skip the query.
+"""
+
+import os
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Hashable, Iterable, List, Optional
+
+import numpy as np
+from loguru import logger
+from pandas import DataFrame
+from sqlalchemy.engine import Engine
+
+from app.db.archive import read_stock_daily
+from app.db.models import StockDaily
+from app.db.version import snapshot
+from app.profile.tracer import trace_elapsed
+
+
+PANEL_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class PricePanel:
+    '''
+    Prices aligned as dense float64 arrays of shape (len(days), len(codes)).
+
+    Missing bars (suspension, not yet listed, delisted) are NaN.
+    '''
+
+    def __init__(self, days: np.ndarray, codes: np.ndarray, fields: Dict[str, np.ndarray]):
+        self.days = days
+        self.codes = codes
+        self.fields = fields
+
+        self._day_index = {d: i for i, d in enumerate(days.tolist())}
+        self._code_index = {c: i for i, c in enumerate(codes.tolist())}
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        fields = self.__dict__.get('fields', {})
+        if name in fields:
+            return fields[name]
+        raise AttributeError(name)
+
+    @property
+    def shape(self):
+        return (len(self.days), len(self.codes))
+
+    def day_index(self, days: Iterable[date]) -> np.ndarray:
+        '''
+        Row index of each day, -1 if the day is not in the panel.
+        '''
+        return np.fromiter((self._day_index.get(d, -1) for d in days), dtype=np.int64)
+
+    def code_index(self, codes: Iterable[str]) -> np.ndarray:
+        '''
+        Column index of each code, -1 if the code is not in the panel.
+        '''
+        return np.fromiter((self._code_index.get(c, -1) for c in codes), dtype=np.int64)
+
+    def next_valid_index(self, field: str = 'close') -> np.ndarray:
+        '''
+        For every (t, n), the smallest t' > t where `field` has a bar, len(days) if none.
+        '''
+        values = self.fields[field]
+        T = values.shape[0]
+
+        candidate = np.where(np.isnan(values), T, np.arange(T)[:, None])
+        # suffix minimum from row t + 1 onwards
+        suffix_min = np.minimum.accumulate(candidate[::-1], axis=0)[::-1]
+        next_valid = np.full_like(candidate, T)
+        next_valid[:-1] = suffix_min[1:]
+
+        return next_valid
+
+    def slice_days(self, start: int, stop: int) -> 'PricePanel':
+        '''
+        Rows [start, stop) as a panel of views, no copy of the underlying arrays.
+        '''
+        return PricePanel(
+            days=self.days[start:stop],
+            codes=self.codes,
+            fields={f: arr[start:stop] for f, arr in self.fields.items()},
+        )
+
+    def save(self, path: str) -> None:
+        '''
+        Writes one .npy per field so that workers can memory-map them read-only.
+        '''
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'days.npy'), np.array(self.days.tolist(), dtype='datetime64[D]'))
+        np.save(os.path.join(path, 'codes.npy'), np.array(self.codes.tolist(), dtype=str))
+        for f, arr in self.fields.items():
+            np.save(os.path.join(path, f'{f}.npy'), np.ascontiguousarray(arr, dtype=np.float64))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'PricePanel':
+        mmap_mode = 'r' if mmap else None
+        days = np.load(os.path.join(path, 'days.npy')).astype(object)
+        codes = np.load(os.path.join(path, 'codes.npy')).astype(object)
+        fields = {
+            name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+            for name in sorted(os.listdir(path))
+            if name.endswith('.npy') and name not in ('days.npy', 'codes.npy')
+        }
+        return cls(days=days, codes=codes, fields=fields)
+
+    @classmethod
+    def from_frame(cls, df: DataFrame, fields: Iterable[str] = PANEL_FIELDS) -> 'PricePanel':
+        '''
+        Builds a panel from long format rows of (code, trade_day, *fields).
+        '''
+
+        fields = [f for f in fields if f in df.columns]
+        if df.shape[0] == 0:
+            return cls(
+                days=np.array([], dtype=object),
+                codes=np.array([], dtype=object),
+                fields={f: np.empty((0, 0), dtype=np.float64) for f in fields},
+            )
+
+        day_values, day_idx = np.unique(df['trade_day'].to_numpy(), return_inverse=True)
+        code_values, code_idx = np.unique(df['code'].to_numpy().astype(str), return_inverse=True)
+
+        shape = (len(day_values), len(code_values))
+        arrays = {}
+        for f in fields:
+            arr = np.full(shape, np.nan, dtype=np.float64)
+            arr[day_idx, code_idx] = df[f].to_numpy(dtype=np.float64, na_value=np.nan)
+            arrays[f] = arr
+
+        return cls(
+            days=day_values.astype(object),
+            codes=code_values.astype(object),
+            fields=arrays,
+        )
+
+
+PANEL_CACHE_SIZE = 4
+
+_panel_cache: OrderedDict[Hashable, PricePanel] = OrderedDict()
+
+
+@trace_elapsed()
+def load_price_panel(
+    engine: Engine,
+    start_day: date,
+    end_day: date,
+    codes: Optional[List[str]] = None,
+    fields: Iterable[str] = PANEL_FIELDS,
+) -> PricePanel:
+    fields = list(fields)
+
+    # 0 when the range was written before versions were recorded, not cached
+    version = snapshot(engine, {StockDaily.__tablename__: (start_day, end_day)})[StockDaily.__tablename__]
+    key = (engine, start_day, end_day, tuple(codes) if codes is not None else None, tuple(fields), version)
+    if version and key in _panel_cache:
+        _panel_cache.move_to_end(key)
+        panel = _panel_cache[key]
+        logger.debug(f"Price panel of {panel.shape} from {start_day} to {end_day} from cache")
+        # callers may add fields, the arrays are shared
+        return PricePanel(days=panel.days, codes=panel.codes, fields=dict(panel.fields))
+
+    # archived days included
+    df = read_stock_daily(engine, start_day, end_day, fields, codes=codes)
+
+    panel = PricePanel.from_frame(df, fields=fields)
+    logger.debug(f"Loaded price panel of {panel.shape} from {start_day} to {end_day}")
+
+    if version:
+        _panel_cache[key] = PricePanel(days=panel.days, codes=panel.codes, fields=dict(panel.fields))
+        while len(_panel_cache) > PANEL_CACHE_SIZE:
+            _panel_cache.popitem(last=False)
+
+    return panel
@@ -0,0 +1,259 @@
+"""
+Incremental backtest, persisted per filter and parameter hash in backtest_state.
+
+After each run only the newest trade days are simulated: positions still open
+are closed with the new bars and the day's picks are opened. The history is
+recomputed only for new parameters or when stock_daily or feed_daily rows
+already covered by the state changed, detected by their versions, see
+app.db.version.
+"""
+
+import hashlib
+import json
+from dataclasses import asdict
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+from pandas import DataFrame, concat
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.backtest.engine import BacktestConfig, load_feed_picks, simulate_trades
+from app.backtest.panel import load_price_panel
+from app.constant.schedule import trade_calendar
+from app.db.models import BacktestState, FeedDaily, StockDaily
+from app.db.version import Inputs, snapshot
+from app.filter.misc import StockFilter, get_filter_id
+from app.profile.tracer import trace_elapsed
+
+
+POSITION_COLUMNS = ['filter_id', 'trade_day', 'code', 'collection_performance']
+
+# of simulate_trades, read by apply_trades
+TRADE_COLUMNS = ['filter_id', 'code', 'buy_day', 'sell_day', 'closed', 'shares', 'fee', 'pnl', 'return']
+
+
+def params_hash(filter_id: int, config: BacktestConfig) -> str:
+    payload = json.dumps({'filter_id': filter_id, **asdict(config)}, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def empty_state() -> Dict[str, Any]:
+    return {
+        'positions':        [],
+        'equity':           [],
+        'stats': {
+            'trades':       0,
+            'wins':         0,
+            'sum_return':   0.0,
+            'fees':         0.0,
+            'days':         0,
+            'sum_ret':      0.0,
+            'sum_sq_ret':   0.0,
+            'peak':         None,
+            'max_drawdown': 0.0,
+        },
+    }
+
+
+def state_stats(state: Dict[str, Any], config: BacktestConfig) -> Dict[str, float]:
+    '''
+    The same stats as BacktestResult, computed from the cumulative sums.
+    '''
+
+    s = state['stats']
+    mean = s['sum_ret'] / s['days'] if s['days'] else 0.0
+    var = s['sum_sq_ret'] / s['days'] - mean ** 2 if s['days'] else 0.0
+    equity = state['equity'][-1][1] if state['equity'] else config.capital
+
+    return {
+        'trades':           s['trades'],
+        'win_rate':         s['wins'] / s['trades'] if s['trades'] else 0.0,
+        'avg_return':       s['sum_return'] / s['trades'] if s['trades'] else 0.0,
+        'total_return':     equity / config.capital - 1.0,
+        'max_drawdown':     s['max_drawdown'],
+        'sharpe':           float(mean / np.sqrt(var) * np.sqrt(250)) if var > 0 else 0.0,
+        'fees':             s['fees'],
+        'open_positions':   len(state['positions']),
+    }
+
+
+def apply_trades(
+    state: Dict[str, Any],
+    trades: DataFrame,
+    days: List[date],
+    config: BacktestConfig,
+) -> Dict[str, Any]:
+    '''
+    Folds simulated trades into the state for the new trade days, in order.
+
+    Closed trades are realized on their sell day, the rest become open positions.
+    '''
+
+    s = state['stats']
+    closed = trades[trades['closed'] & (trades['shares'] > 0)]
+    still_open = trades[~trades['closed'] & (trades['shares'] > 0)]
+
+    daily_pnl = closed.groupby('sell_day')['pnl'].sum().to_dict()
+    equity = state['equity'][-1][1] if state['equity'] else config.capital
+    peak = s['peak'] if s['peak'] is not None else config.capital
+
+    for day in days:
+        pnl = float(daily_pnl.get(day, 0.0))
+        equity += pnl
+        peak = max(peak, equity)
+        ret = pnl / config.capital
+
+        state['equity'].append([day.isoformat(), equity])
+        s['days'] += 1
+        s['sum_ret'] += ret
+        s['sum_sq_ret'] += ret * ret
+        s['max_drawdown'] = max(s['max_drawdown'], 1.0 - equity / peak)
+    s['peak'] = peak
+
+    s['trades'] += int(closed.shape[0])
+    s['wins'] += int((closed['pnl'] > 0).sum())
+    s['sum_return'] += float(closed['return'].sum())
+    s['fees'] += float(closed['fee'].sum())
+
+    state['positions'] = [
+        {
+            'filter_id':                int(row.filter_id),
+            'trade_day':                row.buy_day.isoformat(),
+            'code':                     row.code,
+            'collection_performance':   None,
+        }
+        for row in still_open.itertuples()
+    ]
+
+    return state
+
+
+def _positions_frame(state: Dict[str, Any]) -> DataFrame:
+    df = DataFrame(state['positions'], columns=POSITION_COLUMNS)
+    df['trade_day'] = df['trade_day'].map(date.fromisoformat)
+    return df
+
+
+def state_inputs(start_day: date, end_day: date) -> Inputs:
+    '''
+    Ranges a state through end_day is built from, prices and picks.
+    '''
+    return {
+        StockDaily.__tablename__: (start_day, end_day),
+        FeedDaily.__tablename__: (start_day, end_day),
+    }
+
+
+def _simulate(
+    engine: Engine,
+    state: Dict[str, Any],
+    filter_id: int,
+    since: Optional[date],
+    trade_day: date,
+    config: BacktestConfig,
+    start_day: date,
+) -> Dict[str, Any]:
+    '''
+    Simulates open positions plus picks of (since, trade_day] and folds them into state.
+    '''
+
+    first_pick_day = start_day if since is None else date.fromordinal(since.toordinal() + 1)
+    picks = load_feed_picks(engine, first_pick_day, trade_day, [filter_id])
+    positions = _positions_frame(state)
+    if positions.shape[0]:
+        picks = concat([positions, picks], ignore_index=True)
+
+    # every trade day is on the equity curve, days without picks or positions flat
+    days = trade_calendar().range(first_pick_day, trade_day)
+    if picks.shape[0] == 0:
+        return apply_trades(state, DataFrame(columns=TRADE_COLUMNS), days, config)
+
+    panel = load_price_panel(
+        engine,
+        min(picks['trade_day']),
+        trade_day,
+        codes=sorted(set(picks['code'])),
+        fields=('open', 'close'),
+    )
+    trades = simulate_trades(picks, panel, config)
+
+    return apply_trades(state, trades, days, config)
+
+
+@trace_elapsed(unit='s')
+def extend_backtest_state(
+    engine: Engine,
+    trade_day: date,
+    filter_id: Optional[int] = None,
+    config: Optional[BacktestConfig] = None,
+    start_day: Optional[date] = None,
+) -> Dict[str, float]:
+    '''
+    Brings the persisted state of a filter up to trade_day and returns its stats.
+
+    A start_day other than the state's recomputes it from start_day, None
+    keeps the state's, or the filter's first pick for a new state.
+    '''
+
+    if filter_id is None:
+        filter_id = get_filter_id(StockFilter.TAIL_SCRAPER)
+    if config is None:
+        config = BacktestConfig()
+    key = params_hash(filter_id, config)
+
+    with Session(engine) as session:
+        row = session.get(BacktestState, (filter_id, key))
+
+        recompute = row is None
+        if row is not None and start_day is not None and start_day != row.start_day:
+            logger.info(f"Backtest state of filter {filter_id} starts at {row.start_day}, recomputing from {start_day}")
+            recompute = True
+        elif row is not None:
+            versions = snapshot(session, state_inputs(row.start_day, row.last_trade_day))
+            if row.data_versions is not None and versions != row.data_versions:
+                logger.info(f"stock_daily or feed_daily changed since backtest state of filter {filter_id} was built, recomputing")
+                recompute = True
+            elif trade_day <= row.last_trade_day:
+                logger.info(f"Backtest state of filter {filter_id} already at {row.last_trade_day}")
+                return state_stats(row.state, config)
+
+        if recompute:
+            if start_day is None:
+                start_day = session.execute(
+                    select(func.min(FeedDaily.trade_day)).where(FeedDaily.filter_id == filter_id)
+                ).scalar()
+            if start_day is None:
+                logger.warning(f"No picks of filter {filter_id} in feed_daily")
+                return {}
+
+            state = _simulate(engine, empty_state(), filter_id, None, trade_day, config, start_day)
+            row = BacktestState(
+                filter_id=filter_id,
+                params_hash=key,
+                params=asdict(config),
+                start_day=start_day,
+            )
+        else:
+            assert row is not None
+            # copy so that the JSON column is flagged as changed
+            state = _simulate(engine, json.loads(json.dumps(row.state)), filter_id, row.last_trade_day, trade_day, config, row.start_day)
+
+        row.state = state
+        row.last_trade_day = trade_day
+        row.data_versions = snapshot(session, state_inputs(row.start_day, trade_day))
+        session.merge(row)
+        session.commit()
+
+    stats = state_stats(state, config)
+    logger.success(f"Backtest state of filter {filter_id} extended to {trade_day}: {stats}")
+    return stats
+
+
+if __name__ == '__main__':
+    from app.db.engine import engine_from_env
+
+    print(extend_backtest_state(engine_from_env(), date(2025, 3, 10)))
@@ -0,0 +1,299 @@
+"""
+Walk-forward evaluation of the tail scraper thresholds.
+
+History is split into rolling (train, test) windows. In each window the
+thresholds with the best objective on the train span are picked, then
+evaluated out of sample on the following test span. Windows run in a process
+pool, every worker memory-maps the same read-only panel written once to disk.
+"""
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import product
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+from pandas import DataFrame
+
+from app.backtest.engine import BacktestConfig, run_backtest
+from app.backtest.panel import PricePanel, load_price_panel
+from app.constant.schedule import trade_calendar
+from app.db.trade_calendar import min_window_rows
+from app.filter.misc import StockFilter, get_filter_id
+from app.profile.tracer import trace_elapsed
+
+
+WALK_FORWARD_FIELDS = (
+    'open',
+    'low',
+    'close',
+    'volume',
+    'quantity_relative_ratio',
+    'turnover_rate',
+    'circulation_capital',
+)
+
+# trade days of history needed before the first window for ma250
+LOOKBACK_DAYS = 250
+
+# train stats maximized, higher is better, see main's walk-forward --objective
+OBJECTIVES = ('sharpe', 'total_return', 'win_rate', 'avg_return')
+
+# thresholds of T1 ~ T3 explored on each training span, defaults of the sql filter included
+DEFAULT_GRID: Dict[str, Tuple[float, ...]] = {
+    'gain_low':         (2.0, 3.0, 4.0),
+    'gain_high':        (5.0, 6.0, 7.0),
+    'qrr_min':          (1.0, 1.5),
+    'turnover_min':     (3.0, 5.0, 8.0),
+}
+
+
+def rolling_mean(values: np.ndarray, window: int, min_rows: Optional[int] = None) -> np.ndarray:
+    '''
+    Trailing mean over `window` rows including the current one, NaN unless
+    min_rows of them, by default all, have a bar.
+    '''
+
+    if min_rows is None:
+        min_rows = window
+
+    valid = ~np.isnan(values)
+    csum = np.cumsum(np.where(valid, values, 0.0), axis=0)
+    ccount = np.cumsum(valid, axis=0)
+
+    total = csum.copy()
+    count = ccount.copy()
+    total[window:] -= csum[:-window]
+    count[window:] -= ccount[:-window]
+
+    return np.where(count >= min_rows, total / np.maximum(count, 1), np.nan)
+
+
+def shift_down(values: np.ndarray, periods: int = 1) -> np.ndarray:
+    shifted = np.full_like(values, np.nan)
+    shifted[periods:] = values[:-periods]
+    return shifted
+
+
+def add_derived_fields(panel: PricePanel) -> PricePanel:
+    '''
+    Parameter free inputs of the tail scraper, computed once before fanning out.
+    '''
+
+    # the rule of stock_daily.ma_250, so research and production pick alike
+    panel.fields['ma250'] = rolling_mean(panel.close, 250, min_rows=min_window_rows(250))
+    panel.fields['ma5_volume'] = rolling_mean(panel.volume, 5)
+    panel.fields['previous_close'] = shift_down(panel.close)
+    panel.fields['previous_volume'] = shift_down(panel.volume)
+    return panel
+
+
+def tail_scraper_picks(panel: PricePanel, params: Dict[str, float], start: int, stop: int) -> DataFrame:
+    '''
+    Array version of the tail scraper T1 ~ T8 on rows [start, stop) of a panel with derived fields.
+
+    Stock names (T6) and collections are not part of the panel, picks are ranked by gain instead.
+    '''
+
+    rows = slice(start, stop)
+    close = panel.close[rows]
+    previous_close = panel.previous_close[rows]
+    volume = panel.volume[rows]
+    ma5_volume = panel.ma5_volume[rows]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        gain = 100.0 * (close / previous_close - 1)
+        mask = (
+            # T1
+            (gain >= params['gain_low']) & (gain <= params['gain_high'])
+            # T2
+            & (panel.quantity_relative_ratio[rows] >= params['qrr_min'])
+            # T3
+            & (panel.turnover_rate[rows] > params['turnover_min'])
+            # T4
+            & (panel.circulation_capital[rows] >= 2_0000_0000)
+            & (panel.circulation_capital[rows] <= 200_0000_0000)
+            # T5
+            & (panel.previous_volume[rows] < ma5_volume) & (volume > ma5_volume)
+            # T7
+            & (panel.low[rows] > panel.ma250[rows])
+            # T8
+            & (close > panel.open[rows])
+        )
+
+    t_idx, n_idx = np.nonzero(mask)
+    return DataFrame({
+        'filter_id':                get_filter_id(StockFilter.TAIL_SCRAPER),
+        'trade_day':                panel.days[start + t_idx],
+        'code':                     panel.codes[n_idx],
+        'collection_performance':   gain[t_idx, n_idx],
+    })
+
+
+def param_grid(grid: Dict[str, Tuple[float, ...]]) -> List[Dict[str, float]]:
+    keys = list(grid.keys())
+    combos = [dict(zip(keys, values)) for values in product(*grid.values())]
+    return [p for p in combos if p.get('gain_low', -np.inf) < p.get('gain_high', np.inf)]
+
+
+def split_windows(n_days: int, start: int, train: int, test: int, step: Optional[int] = None) -> List[Tuple[int, int, int]]:
+    '''
+    Returns (train_start, test_start, test_stop) row indices of rolling windows.
+    '''
+
+    step = step or test
+    windows = []
+    train_start = start
+    while train_start + train + test <= n_days:
+        windows.append((train_start, train_start + train, train_start + train + test))
+        train_start += step
+    return windows
+
+
+def _evaluate_span(panel: PricePanel, params: Dict[str, float], start: int, stop: int, config: BacktestConfig) -> Dict[str, float]:
+    picks = tail_scraper_picks(panel, params, start, stop)
+    # one extra row so that the last day's picks can be sold
+    results = run_backtest(picks, panel.slice_days(start, min(stop + 1, len(panel.days))), config)
+    if not results:
+        return {'trades': 0, 'total_return': 0.0, 'sharpe': 0.0, 'max_drawdown': 0.0, 'win_rate': 0.0, 'avg_return': 0.0}
+    return next(iter(results.values())).stats
+
+
+def evaluate_window(
+    panel_path: str,
+    window: Tuple[int, int, int],
+    grid: List[Dict[str, float]],
+    config: BacktestConfig,
+    objective: str = 'sharpe',
+) -> Dict[str, Any]:
+    '''
+    Worker entry, picks the best params on the train span and scores them on the test span.
+    '''
+
+    panel = PricePanel.load(panel_path, mmap=True)
+    train_start, test_start, test_stop = window
+
+    best_params, best_stats = grid[0], None
+    for params in grid:
+        stats = _evaluate_span(panel, params, train_start, test_start, config)
+        if best_stats is None or stats[objective] > best_stats[objective]:
+            best_params, best_stats = params, stats
+    assert best_stats is not None
+
+    test_stats = _evaluate_span(panel, best_params, test_start, test_stop, config)
+
+    return {
+        'train_start':  panel.days[train_start],
+        'train_end':    panel.days[test_start - 1],
+        'test_start':   panel.days[test_start],
+        'test_end':     panel.days[test_stop - 1],
+        **{f'param_{k}': v for k, v in best_params.items()},
+        **{f'train_{k}': v for k, v in best_stats.items()},
+        **{f'test_{k}': v for k, v in test_stats.items()},
+    }
+
+
+def check_objective(objective: str) -> None:
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Objective {objective} not supported, use one of {', '.join(OBJECTIVES)}")
+
+
+def walk_forward(
+    panel: PricePanel,
+    train_days: int = 120,
+    test_days: int = 20,
+    step_days: Optional[int] = None,
+    grid: Optional[Dict[str, Tuple[float, ...]]] = None,
+    config: Optional[BacktestConfig] = None,
+    objective: str = 'sharpe',
+    workers: Optional[int] = None,
+) -> DataFrame:
+    check_objective(objective)
+    if config is None:
+        config = BacktestConfig()
+    params_list = param_grid(grid or DEFAULT_GRID)
+
+    add_derived_fields(panel)
+    windows = split_windows(len(panel.days), min(LOOKBACK_DAYS, len(panel.days)), train_days, test_days, step_days)
+    if not windows:
+        logger.warning(f"Not enough history of {len(panel.days)} trade days for a single window")
+        return DataFrame()
+
+    with tempfile.TemporaryDirectory(prefix='walk-forward-') as tmp:
+        path = os.path.join(tmp, 'panel')
+        panel.save(path)
+        logger.info(f"Evaluating {len(windows)} windows x {len(params_list)} params with {workers or os.cpu_count()} workers")
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(evaluate_window, path, window, params_list, config, objective)
+                for window in windows
+            ]
+            rows = [future.result() for future in futures]
+
+    return DataFrame(rows)
+
+
+def summarize_walk_forward(report: DataFrame) -> Dict[str, float]:
+    '''
+    Stitches out of sample windows together.
+    '''
+
+    if report.shape[0] == 0:
+        return {}
+    return {
+        'windows':              int(report.shape[0]),
+        'test_trades':          int(report['test_trades'].sum()),
+        'test_total_return':    float(np.prod(1 + report['test_total_return']) - 1),
+        'test_mean_sharpe':     float(report['test_sharpe'].mean()),
+        'test_worst_drawdown':  float(report['test_max_drawdown'].max()),
+        'train_mean_sharpe':    float(report['train_sharpe'].mean()),
+    }
+
+
+@trace_elapsed(unit='s')
+def walk_forward_from_db(
+    engine,
+    start_day: date,
+    end_day: date,
+    report_path: Optional[str] = None,
+    **kwargs,
+) -> DataFrame:
+    '''
+    Loads the panel from stock_daily, with LOOKBACK_DAYS trade days of lookback for ma250, and runs the walk-forward.
+    '''
+    # before the panel loads
+    check_objective(kwargs.get('objective', 'sharpe'))
+
+    panel = load_price_panel(
+        engine,
+        trade_calendar().offset(start_day, -LOOKBACK_DAYS),
+        end_day,
+        fields=WALK_FORWARD_FIELDS,
+    )
+    report = walk_forward(panel, **kwargs)
+
+    summary = summarize_walk_forward(report)
+    logger.success(f"Walk-forward from {start_day} to {end_day}: {summary}")
+
+    if report_path is None:
+        report_path = f"reports/walk-forward-{start_day}-{end_day}.csv"
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    report.to_csv(report_path, index=False)
+    logger.info(f"Walk-forward report wrote to {report_path}")
+
+    return report
+
+
+if __name__ == '__main__':
+    from app.db.engine import engine_from_env
+
+    report = walk_forward_from_db(
+        engine_from_env(),
+        start_day=date(2024, 1, 2),
+        end_day=date(2025, 3, 10),
+    )
+    print(report)
@@ -15,6 +15,13 @@ MARKET_SUPPORTED = set([SEX_SHANGHAI, SEX_SHENZHEN, SEX_BEIJING])
 MARKET_UNSUPPORTED = set([SEX_HONGKONG])
 
 
+# session times in the market table are local to the exchange, by market.country
+COUNTRY_TIMEZONE = {
+    'CN':   'Asia/Shanghai',
+    'HK':   'Asia/Hong_Kong',
+}
+
+
 BAD_STOCKS = set([
     '600631', # 百联股份 退市
     '600832', # 东方明珠 退市
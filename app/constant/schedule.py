@@ -1,183 +1,227 @@
+"""
+Trade calendar.
+
+Trade days are weekdays that are not exchange holidays. Holidays are read
+from holidays.csv (day, market, name), so a new year is added by appending
+its rows, no code change needed. The calendar starts with the first year of
+the file; a later year without rows is weekdays only, logged as an error
+when first reached, and covers() tells a caller whether to trust it.
+
+The calendar keeps every trade day, as ordinals, in a sorted list, so
+lookups are a bisect and "250 trade days ago" is index arithmetic:
+
+    calendar = trade_calendar()
+    calendar.offset(date(2025, 3, 10), -250)
+    calendar.count(date(2025, 1, 1), date(2025, 3, 10))
+"""
+
+import csv
+import os
+import threading
+from bisect import bisect_left, bisect_right
 from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Set
 
+from loguru import logger
 
-CHINA_MAINLAND_HOLIDAYS = set([
-    # New Year's Day
-    date(2022, 12, 31),
-    date(2023,  1,  1),
-    date(2023,  1,  2),
-
-    # Chinese New Year
-    date(2023,  1, 21),
-    date(2023,  1, 22),
-    date(2023,  1, 23),
-    date(2023,  1, 24),
-    date(2023,  1, 25),
-    date(2023,  1, 26),
-    date(2023,  1, 27),
-    date(2023,  1, 28),
-    date(2023,  1, 29),
-    
-    # Qingming Festival
-    date(2023,  4,  5),
-
-    # Chinese Laybor Day
-    date(2023,  4, 23),
-    date(2023,  4, 29),
-    date(2023,  4, 30),
-    date(2023,  5,  1),
-    date(2023,  5,  2),
-    date(2023,  5,  3),
-    date(2023,  5,  6),
-    
-    # Dragon Boat Festival
-    date(2023,  6, 22),
-    date(2023,  6, 23),
-    
-    # China's National Day and Mid-Autumn Festival
-    date(2023,  9, 29),
-    date(2023,  9, 30),
-    date(2023, 10,  1),
-    date(2023, 10,  2),
-    date(2023, 10,  3),
-    date(2023, 10,  4),
-    date(2023, 10,  5),
-    date(2023, 10,  6),
-    date(2023, 10,  7),
-    date(2023, 10,  8),
-    
-    ####################################################################################
-    
-    # New Year's Day
-    date(2023, 12, 31),
-    date(2024,  1,  1),
-
-    # Chinese New Year    
-    date(2024,  2,  4),
-    date(2024,  2,  9),
-    date(2024,  2, 10),
-    date(2024,  2, 11),
-    date(2024,  2, 12),
-    date(2024,  2, 13),
-    date(2024,  2, 14),
-    date(2024,  2, 15),
-    date(2024,  2, 16),
-    date(2024,  2, 17),
-    date(2024,  2, 18),
-
-    # Qingming Festival
-    date(2024,  4,  4),
-    date(2024,  4,  5),
-    date(2024,  4,  6),
-    date(2024,  4,  7),
-
-    # Chinese Laybor Day
-    date(2024,  4, 28),
-    date(2024,  5,  1),
-    date(2024,  5,  2),
-    date(2024,  5,  3),
-    date(2024,  5,  4),
-    date(2024,  5,  5),
-    date(2024,  5,  11),
-    
-    # Dragon Boat Festival
-    date(2024,  6, 10),
-    
-    # Mid-Autumn Festival
-    date(2024,  9, 14),
-    date(2024,  9, 15),
-    date(2024,  9, 17),
-    
-    # China's National Day
-    date(2024,  9, 29),
-    date(2024, 10,  1),
-    date(2024, 10,  2),
-    date(2024, 10,  3),
-    date(2024, 10,  4),
-    date(2024, 10,  5),
-    date(2024, 10,  6),
-    date(2024, 10,  7),
-    date(2024, 10, 12),
-    
-    ####################################################################################
-    
-    # New Year's Day
-    date(2025,  1,  1),
-
-    # Chinese New Year    
-    date(2025,  1, 26),
-    date(2025,  1, 28),
-    date(2025,  1, 29),
-    date(2025,  1, 30),
-    date(2025,  1, 31),
-    date(2025,  2,  1),
-    date(2025,  2,  2),
-    date(2025,  2,  3),
-    date(2025,  2,  4),
-    date(2025,  2,  8),
-
-    # Qingming Festival
-    date(2025,  4,  4),
-    date(2025,  4,  5),
-    date(2025,  4,  6),
-
-    # Chinese Laybor Day
-    date(2025,  4, 27),
-    date(2025,  5,  1),
-    date(2025,  5,  2),
-    date(2025,  5,  3),
-    date(2025,  5,  4),
-    date(2025,  5,  5),
-    
-    # Dragon Boat Festival
-    date(2025,  5, 31),
-    date(2025,  6,  1),
-    date(2025,  6,  2),
-    
-    # China's National Day and Mid-Autumn Festival
-    date(2025,  9, 28),
-    date(2025, 10,  1),
-    date(2025, 10,  2),
-    date(2025, 10,  3),
-    date(2025, 10,  4),
-    date(2025, 10,  5),
-    date(2025, 10,  6),
-    date(2025, 10,  7),
-    date(2025, 10,  8),
-    date(2025, 10, 11),
-])
-
-
-def is_stock_market_open(day: date):
+
+HOLIDAYS_CSV_FILE = os.path.join(os.path.dirname(__file__), 'holidays.csv')
+
+# market column of holidays.csv
+CHINA_MAINLAND = 'CN'
+
+
+def load_holidays(path: str = HOLIDAYS_CSV_FILE, market: str = CHINA_MAINLAND) -> Dict[date, str]:
     '''
-    Checks from 2023-01-01 to 2025-12-31.
+    Holiday names by day of a market.
     '''
+    with open(path, newline='') as csvfile:
+        return {
+            date.fromisoformat(row['day']): row['name']
+            for row in csv.DictReader(csvfile)
+            if row['market'] == market
+        }
 
-    return day.weekday() < 5 and day not in CHINA_MAINLAND_HOLIDAYS
 
+class TradeCalendar:
+    '''
+    Sorted trade days with O(log n) lookup and trade-day ordinals.
 
-def previous_trade_day(day: date, inclusive = True) -> date:
-    if not inclusive:
-        day = day - timedelta(days=1)
+    A day's ordinal is the position of the last trade day on or before it,
+    counted from first_year, so offsets and counts from non-trade days are
+    taken from that trade day. Days past last_year extend the calendar by
+    whole years, weekdays only if a year is not in covered_years.
+    '''
 
-    while not is_stock_market_open(day):
-        day = day - timedelta(days=1)
-    
-    return day
+    def __init__(
+        self,
+        holidays: Iterable[date],
+        first_year: Optional[int] = None,
+        last_year: Optional[int] = None,
+        covered_years: Optional[Iterable[int]] = None,
+    ):
+        self.holidays: Set[date] = set(holidays)
+        # years with holiday data, a year counts once it has a row
+        self.covered_years: Set[int] = set(covered_years) if covered_years is not None else {d.year for d in self.holidays}
+        if first_year is None:
+            first_year = min(self.covered_years, default=date.today().year)
+        if last_year is None:
+            last_year = max(self.covered_years, default=first_year)
+        self.first_year = first_year
+        self.last_year = first_year - 1
+        self._lock = threading.Lock()
+        self._ordinals: List[int] = []
+        self._extend(last_year)
+
+    @classmethod
+    def from_csv(cls, path: str = HOLIDAYS_CSV_FILE, market: str = CHINA_MAINLAND) -> 'TradeCalendar':
+        return cls(load_holidays(path, market).keys())
+
+    @classmethod
+    def from_trade_days(cls, days: Iterable[date]) -> 'TradeCalendar':
+        '''
+        From a complete list of trade days over whole years, e.g. the trade_calendar table.
+        '''
+        days = sorted(days)
+        ordinals = {d.toordinal() for d in days}
+        start, end = date(days[0].year, 1, 1).toordinal(), date(days[-1].year, 12, 31).toordinal()
+        holidays = [date.fromordinal(o) for o in range(start, end + 1) if (o - 1) % 7 < 5 and o not in ordinals]
+        years = range(days[0].year, days[-1].year + 1)
+        return cls(holidays, first_year=years[0], last_year=years[-1], covered_years=years)
+
+    def _extend(self, last_year: int) -> None:
+        '''
+        Appends the trade days up to the end of last_year, ordinals of earlier days stay put.
+        '''
+        with self._lock:
+            if last_year <= self.last_year:
+                return
+            for year in range(self.last_year + 1, last_year + 1):
+                if year not in self.covered_years:
+                    logger.error(f"No holiday data for {year}, its trade days are weekdays only until its rows are added to holidays.csv")
+            start = date(self.last_year + 1, 1, 1).toordinal()
+            end = date(last_year, 12, 31).toordinal()
+            holidays = {d.toordinal() for d in self.holidays}
+            # date.fromordinal(1) is a monday
+            self._ordinals = self._ordinals + [o for o in range(start, end + 1) if (o - 1) % 7 < 5 and o not in holidays]
+            self.last_year = last_year
+
+    def _check(self, day: date) -> None:
+        if day.year < self.first_year:
+            raise ValueError(f"{day} is before the trade calendar, which starts in {self.first_year}")
+        if day.year > self.last_year:
+            self._extend(day.year)
+
+    def covers(self, day: date) -> bool:
+        '''
+        Whether day's year has holiday data, i.e. its trade days are known.
+        '''
+        return day.year in self.covered_years
+
+    def __len__(self) -> int:
+        return len(self._ordinals)
+
+    @property
+    def days(self) -> List[date]:
+        return [date.fromordinal(o) for o in self._ordinals]
+
+    def is_open(self, day: date) -> bool:
+        return day.weekday() < 5 and day not in self.holidays
+
+    def ordinal(self, day: date) -> int:
+        '''
+        Position of the last trade day on or before day.
+        '''
+        self._check(day)
+        return bisect_right(self._ordinals, day.toordinal()) - 1
+
+    def day(self, ordinal: int) -> date:
+        '''
+        The trade day at an ordinal.
+        '''
+        if ordinal < 0:
+            raise ValueError(f"Trade day ordinal {ordinal} is before the trade calendar, which starts in {self.first_year}")
+        while ordinal >= len(self._ordinals):
+            self._extend(self.last_year + 1)
+        return date.fromordinal(self._ordinals[ordinal])
+
+    def previous(self, day: date, inclusive: bool = True) -> date:
+        '''
+        Last trade day before, or on if inclusive, day.
+        '''
+        if not inclusive:
+            day = day - timedelta(days=1)
+        return self.day(self.ordinal(day))
+
+    def next(self, day: date, inclusive: bool = True) -> date:
+        '''
+        First trade day after, or on if inclusive, day.
+        '''
+        if inclusive and self.is_open(day):
+            return day
+        return self.day(self.ordinal(day) + 1)
+
+    def offset(self, day: date, n: int) -> date:
+        '''
+        The trade day n trade days from the last trade day on or before day,
+        e.g. offset(day, -250) is 250 trade days before it.
+        '''
+        return self.day(self.ordinal(day) + n)
+
+    def range(self, start_day: date, end_day: date) -> List[date]:
+        '''
+        Trade days from start_day to end_day, inclusive.
+        '''
+        self._check(start_day)
+        self._check(end_day)
+        lo = bisect_left(self._ordinals, start_day.toordinal())
+        hi = bisect_right(self._ordinals, end_day.toordinal())
+        return [date.fromordinal(o) for o in self._ordinals[lo:hi]]
+
+    def count(self, start_day: date, end_day: date) -> int:
+        '''
+        Number of trade days from start_day to end_day, inclusive.
+        '''
+        self._check(start_day)
+        self._check(end_day)
+        return max(bisect_right(self._ordinals, end_day.toordinal()) - bisect_left(self._ordinals, start_day.toordinal()), 0)
+
+
+_calendar: Optional[TradeCalendar] = None
+
+
+def trade_calendar() -> TradeCalendar:
+    '''
+    The China mainland calendar from holidays.csv, loaded once.
+    '''
+    global _calendar
+    if _calendar is None:
+        _calendar = TradeCalendar.from_csv()
+    return _calendar
 
 
-def next_trade_day(day: date, inclusive = True) -> date:
-    if not inclusive:
-        day = day + timedelta(days=1)
+def set_trade_calendar(calendar: Optional[TradeCalendar]) -> None:
+    '''
+    Replaces the process calendar, None to reload holidays.csv on next use.
+    '''
+    global _calendar
+    _calendar = calendar
+
+
+def is_stock_market_open(day: date) -> bool:
+    return trade_calendar().is_open(day)
+
 
-    while not is_stock_market_open(day):
-        day = day + timedelta(days=1)
-    
-    return day
+def previous_trade_day(day: date, inclusive = True) -> date:
+    return trade_calendar().previous(day, inclusive)
+
+
+def next_trade_day(day: date, inclusive = True) -> date:
+    return trade_calendar().next(day, inclusive)
 
 
 if __name__ == '__main__':
     assert not is_stock_market_open(date(2024, 8, 4))
     assert not is_stock_market_open(date(2024, 9, 17))
     assert not is_stock_market_open(date(2025, 2, 4))
-    assert not is_stock_market_open(date(2025, 2, 8))
\ No newline at end of file
+    assert not is_stock_market_open(date(2025, 2, 8))
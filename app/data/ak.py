@@ -1,7 +1,8 @@
 from datetime import date
 from decimal import Decimal
 
-import akshare as ak # type: ignore
+from functools import lru_cache
+
 from pandas import DataFrame, notna
 
 from app.constant.collection import CollectionType
@@ -14,15 +15,22 @@ from app.constant.exchange import (
 )
 
 
+# akshare function names, resolved on first pull since importing akshare is slow
 market_map = {
-    SEX_CHINA_MAINLAND: ak.stock_zh_a_spot_em,
-    SEX_SHANGHAI:       ak.stock_sh_a_spot_em,
-    SEX_SHENZHEN:       ak.stock_sz_a_spot_em,
-    SEX_BEIJING:        ak.stock_bj_a_spot_em,
-    SEX_HONGKONG:       ak.stock_hk_spot_em,
+    SEX_CHINA_MAINLAND: 'stock_zh_a_spot_em',
+    SEX_SHANGHAI:       'stock_sh_a_spot_em',
+    SEX_SHENZHEN:       'stock_sz_a_spot_em',
+    SEX_BEIJING:        'stock_bj_a_spot_em',
+    SEX_HONGKONG:       'stock_hk_spot_em',
 }
 
 
+@lru_cache(maxsize=None)
+def akshare():
+    import akshare as ak # type: ignore
+    return ak
+
+
 def pull_stocks(exchange: str) -> DataFrame:
     '''
     Pulls basic stocks info for a given market.
@@ -35,7 +43,7 @@ def pull_stocks(exchange: str) -> DataFrame:
         '代码': 'code',
         '名称': 'name',
     }
-    df = market_map[exchange]()
+    df = getattr(akshare(), market_map[exchange])()
     df = df.rename(columns=column_mapping)[list(column_mapping.values())]
 
     return df
@@ -49,7 +57,7 @@ def pull_collections(cType: CollectionType) -> DataFrame:
 
     match cType:
         case CollectionType.INDUSTRY_BOARD:
-            df = ak.stock_board_industry_name_em()
+            df = akshare().stock_board_industry_name_em()
 
         case _:
             raise Exception("Not implemented yet!")
@@ -65,7 +73,7 @@ def pull_stocks_in_collection(cType: CollectionType, symbol: str) -> DataFrame:
 
     match cType:
         case CollectionType.INDUSTRY_BOARD:
-            df = ak.stock_board_industry_cons_em(symbol=symbol)
+            df = akshare().stock_board_industry_cons_em(symbol=symbol)
 
         case _:
             raise Exception("Not implemented yet!")
@@ -107,7 +115,7 @@ def pull_stock_daily() -> DataFrame:
         'turnover_rate':            lambda x: round(x, 3) if notna(x) else x,
     }
 
-    df = ak.stock_zh_a_spot_em()
+    df = akshare().stock_zh_a_spot_em()
     df = df.rename(columns=column_mapping)[list(column_mapping.values())]
     df = df[df['close'].notna() & df['volume'].notna()]
     for col, func in transformations.items():
@@ -142,7 +150,7 @@ def pull_stock_daily_hist(symbol: str, start_date: date, end_date: date, adjust:
         'turnover':                 lambda x: round(x) if notna(x) else x,
     }
 
-    df = ak.stock_zh_a_hist(
+    df = akshare().stock_zh_a_hist(
         symbol=symbol,
         period="daily",
         start_date=start_date.strftime('%Y%m%d'),
@@ -186,7 +194,7 @@ def pull_collection_daily(cType: CollectionType) -> DataFrame:
 
     match cType:
         case CollectionType.INDUSTRY_BOARD:
-            df = ak.stock_board_industry_name_em()
+            df = akshare().stock_board_industry_name_em()
 
         case _:
             raise Exception("Not implemented yet!")
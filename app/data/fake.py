@@ -0,0 +1,241 @@
+"""
+Offline data provider.
+
+Serves a deterministic synthetic market (app.data.synthetic), or frames
+recorded from another provider with RecordingProvider, with configurable
+latency and injected errors, so ingest can be load tested and its concurrency
+tuned without the internet. Configured from .env when DATA_PROVIDER=fake:
+
+    FAKE_PROVIDER_CODES=5000
+    FAKE_PROVIDER_LATENCY_MS=80
+    FAKE_PROVIDER_ERROR_RATE=0.01
+
+Injected errors are decided per call from the seed, the pull and its
+arguments and the attempt, so runs are reproducible and a retry may succeed.
+"""
+
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import date
+from decimal import Decimal
+from typing import Callable, Iterable, Optional, Tuple
+
+import numpy as np
+from pandas import DataFrame, notna, read_parquet
+
+from app.constant.collection import CollectionType
+from app.constant.exchange import (
+    SEX_BEIJING,
+    SEX_CHINA_MAINLAND,
+    SEX_HONGKONG,
+    SEX_SHANGHAI,
+    SEX_SHENZHEN,
+)
+from app.constant.schedule import previous_trade_day
+from app.data.provider import DataProvider, ProviderError
+from app.data.synthetic import SyntheticMarket
+
+
+# market ids of app.data.synthetic
+EXCHANGE_MARKET_IDS = {
+    SEX_SHANGHAI:   (1,),
+    SEX_SHENZHEN:   (2,),
+    SEX_BEIJING:    (3,),
+    SEX_CHINA_MAINLAND: (1, 2, 3),
+    SEX_HONGKONG:   (),
+}
+
+
+def _as_decimal(df: DataFrame, columns: Iterable[str]) -> DataFrame:
+    '''
+    Prices as Decimal, like app.data.ak hands them out.
+    '''
+    for col in columns:
+        df[col] = df[col].map(lambda x: Decimal(format(x, '.3f')) if notna(x) else x)
+    return df
+
+
+def _record_name(method: str, args: Tuple) -> str:
+    key = '-'.join(str(a.name if isinstance(a, CollectionType) else a) for a in args)
+    return re.sub(r'[^\w.-]+', '_', f"{method}-{key}" if key else method) + '.parquet'
+
+
+class FakeProvider(DataProvider):
+    '''
+    Synthetic or recorded data with latency and error injection.
+    '''
+
+    name = 'fake'
+
+    def __init__(
+        self,
+        market: Optional[SyntheticMarket] = None,
+        codes: int = 5000,
+        years: float = 1.0,
+        seed: int = 0,
+        trade_day: Optional[date] = None,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        recorded: Optional[str] = None,
+        throttle_secs: float = 0.0,
+    ):
+        self.codes = codes
+        self.years = years
+        self.seed = seed
+        self.trade_day = trade_day or (market.trade_days[-1] if market is not None else previous_trade_day(date.today()))
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.recorded = recorded
+        self.throttle_secs = throttle_secs
+
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self._market = market
+        self._attempts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'FakeProvider':
+        trade_day = os.getenv("FAKE_PROVIDER_TRADE_DAY")
+        return cls(
+            codes=          int(os.getenv("FAKE_PROVIDER_CODES")            or 5000),
+            years=        float(os.getenv("FAKE_PROVIDER_YEARS")            or 1.0),
+            seed=           int(os.getenv("FAKE_PROVIDER_SEED")             or 0),
+            trade_day=      date.fromisoformat(trade_day) if trade_day else None,
+            latency_ms=   float(os.getenv("FAKE_PROVIDER_LATENCY_MS")       or 0.0),
+            jitter_ms=    float(os.getenv("FAKE_PROVIDER_JITTER_MS")        or 0.0),
+            error_rate=   float(os.getenv("FAKE_PROVIDER_ERROR_RATE")       or 0.0),
+            recorded=           os.getenv("FAKE_PROVIDER_RECORDED")         or None,
+        )
+
+    @property
+    def market(self) -> SyntheticMarket:
+        '''
+        Generated on first use, once.
+        '''
+        with self._lock:
+            if self._market is None:
+                self._market = SyntheticMarket(self.codes, self.years, end_day=self.trade_day, seed=self.seed)
+            return self._market
+
+    def warm(self) -> None:
+        self.market
+
+    def _call(self, method: str, args: Tuple, produce: Callable[[], DataFrame]) -> DataFrame:
+        key = f"{method}:{args}"
+        with self._lock:
+            self.calls[method] += 1
+            self._attempts[key] += 1
+            attempt = self._attempts[key]
+        rng = np.random.default_rng([self.seed, zlib.crc32(key.encode()), attempt])
+
+        delay_ms = self.latency_ms + (rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+        if self.error_rate and rng.random() < self.error_rate:
+            with self._lock:
+                self.errors[method] += 1
+            raise ProviderError(f"Injected error in {method}{args}, attempt {attempt}")
+
+        if self.recorded is not None:
+            path = os.path.join(self.recorded, _record_name(method, args))
+            if os.path.exists(path):
+                return read_parquet(path)
+        return produce()
+
+    #
+    # pulls
+    def pull_stocks(self, exchange: str) -> DataFrame:
+        if exchange not in EXCHANGE_MARKET_IDS:
+            raise ValueError(f"exchange {exchange} not supported")
+
+        def produce():
+            stocks = self.market.stocks
+            return stocks[stocks['market_id'].isin(EXCHANGE_MARKET_IDS[exchange])][['code', 'name']].reset_index(drop=True)
+        return self._call('pull_stocks', (exchange,), produce)
+
+    def pull_collections(self, cType: CollectionType) -> DataFrame:
+        if cType != CollectionType.INDUSTRY_BOARD:
+            raise Exception("Not implemented yet!")
+        return self._call('pull_collections', (cType,), lambda: self.market.boards[['name', 'code']].copy())
+
+    def pull_stocks_in_collection(self, cType: CollectionType, symbol: str) -> DataFrame:
+        if cType != CollectionType.INDUSTRY_BOARD:
+            raise Exception("Not implemented yet!")
+
+        def produce():
+            market = self.market
+            board = market.boards.loc[market.boards['name'] == symbol, 'code']
+            stocks = market.stocks[market.stocks['board'].isin(board)]
+            return stocks[['code', 'name']].reset_index(drop=True)
+        return self._call('pull_stocks_in_collection', (cType, symbol), produce)
+
+    def pull_stock_daily(self) -> DataFrame:
+        def produce():
+            df = self.market.daily_frame(self.trade_day)
+            return _as_decimal(df, ['open', 'high', 'low', 'close'])
+        return self._call('pull_stock_daily', (), produce)
+
+    def pull_stock_daily_hist(self, symbol: str, start_date: date, end_date: date, adjust: str = 'qfq') -> DataFrame:
+        def produce():
+            market = self.market
+            if symbol not in set(market.stocks['code']):
+                # as akshare does for unknown codes
+                raise KeyError(symbol)
+            df = market.hist_frame(symbol, start_date, end_date)
+            df[['volume', 'turnover']] = df[['volume', 'turnover']].astype('int64')
+            return _as_decimal(df, ['open', 'high', 'low', 'close'])
+        return self._call('pull_stock_daily_hist', (symbol, start_date, end_date, adjust), produce)
+
+    def pull_collection_daily(self, cType: CollectionType) -> DataFrame:
+        if cType != CollectionType.INDUSTRY_BOARD:
+            raise Exception("Not implemented yet!")
+
+        def produce():
+            df = self.market.collection_frame(self.trade_day)
+            return _as_decimal(df, ['price', 'change'])
+        return self._call('pull_collection_daily', (cType,), produce)
+
+
+class RecordingProvider(DataProvider):
+    '''
+    Passes pulls through to another provider, saving each frame as Parquet
+    under path for FakeProvider(recorded=path) to replay.
+    '''
+
+    name = 'recording'
+
+    def __init__(self, provider: DataProvider, path: str):
+        self.provider = provider
+        self.path = path
+        self.throttle_secs = provider.throttle_secs
+        os.makedirs(path, exist_ok=True)
+
+    def _record(self, method: str, args: Tuple, df: DataFrame) -> DataFrame:
+        df.reset_index(drop=True).to_parquet(os.path.join(self.path, _record_name(method, args)), index=False)
+        return df
+
+    def pull_stocks(self, exchange: str) -> DataFrame:
+        return self._record('pull_stocks', (exchange,), self.provider.pull_stocks(exchange))
+
+    def pull_collections(self, cType: CollectionType) -> DataFrame:
+        return self._record('pull_collections', (cType,), self.provider.pull_collections(cType))
+
+    def pull_stocks_in_collection(self, cType: CollectionType, symbol: str) -> DataFrame:
+        return self._record('pull_stocks_in_collection', (cType, symbol), self.provider.pull_stocks_in_collection(cType, symbol))
+
+    def pull_stock_daily(self) -> DataFrame:
+        return self._record('pull_stock_daily', (), self.provider.pull_stock_daily())
+
+    def pull_stock_daily_hist(self, symbol: str, start_date: date, end_date: date, adjust: str = 'qfq') -> DataFrame:
+        df = self.provider.pull_stock_daily_hist(symbol, start_date, end_date, adjust)
+        return self._record('pull_stock_daily_hist', (symbol, start_date, end_date, adjust), df)
+
+    def pull_collection_daily(self, cType: CollectionType) -> DataFrame:
+        return self._record('pull_collection_daily', (cType,), self.provider.pull_collection_daily(cType))
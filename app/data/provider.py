@@ -0,0 +1,201 @@
+"""
+Data providers.
+
+Ingest and load pull market data through the process provider instead of
+calling akshare directly, so the source can be swapped, e.g. for the offline
+fake provider in app.data.fake. The provider is chosen by DATA_PROVIDER in
+.env (akshare, the default, or fake) or set in code:
+
+    with use_provider(FakeProvider(latency_ms=50, error_rate=0.01)):
+        refresh_stock_daily(engine, trade_day)
+
+Every provider returns the frames of app.data.ak, i.e. renamed columns with
+prices as Decimal, pauses `throttle_secs` between consecutive per-code pulls
+and raises ProviderError for a pull that failed at the source, which ingest
+retries.
+"""
+
+import os
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import date
+from typing import Optional
+
+from dotenv import load_dotenv
+from pandas import DataFrame
+
+from app.constant.collection import CollectionType
+from app.constant.misc import TIME_SLEEP_SECS
+
+
+load_dotenv(override=True)
+
+
+class ProviderError(ConnectionError):
+    '''
+    A pull that failed at the source, e.g. a dropped connection.
+    '''
+
+
+class DataProvider(ABC):
+    '''
+    Source of stock, board and daily data.
+    '''
+
+    name = 'base'
+    # between consecutive per-code pulls, to respect the source's rate limit
+    throttle_secs: float = 0.0
+
+    def warm(self) -> None:
+        '''
+        Pays one-off costs ahead of the first pull, e.g. imports, for long-running processes.
+        '''
+
+    @abstractmethod
+    def pull_stocks(self, exchange: str) -> DataFrame: ...
+
+    @abstractmethod
+    def pull_collections(self, cType: CollectionType) -> DataFrame: ...
+
+    @abstractmethod
+    def pull_stocks_in_collection(self, cType: CollectionType, symbol: str) -> DataFrame: ...
+
+    @abstractmethod
+    def pull_stock_daily(self) -> DataFrame: ...
+
+    @abstractmethod
+    def pull_stock_daily_hist(self, symbol: str, start_date: date, end_date: date, adjust: str = 'qfq') -> DataFrame: ...
+
+    @abstractmethod
+    def pull_collection_daily(self, cType: CollectionType) -> DataFrame: ...
+
+
+@contextmanager
+def source_errors(method: str):
+    '''
+    Raises the I/O errors of a pull, requests' included, as ProviderError.
+    '''
+    try:
+        yield
+    except ProviderError:
+        raise
+    except OSError as e:
+        raise ProviderError(f"{method} failed at the source: {e!r}") from e
+
+
+class AkshareProvider(DataProvider):
+    '''
+    Live data from akshare, see app.data.ak.
+    '''
+
+    name = 'akshare'
+    throttle_secs = TIME_SLEEP_SECS
+
+    def warm(self) -> None:
+        # akshare takes seconds to import
+        from app.data import ak  # noqa: F401
+
+    def pull_stocks(self, exchange: str) -> DataFrame:
+        from app.data import ak
+        with source_errors('pull_stocks'):
+            return ak.pull_stocks(exchange)
+
+    def pull_collections(self, cType: CollectionType) -> DataFrame:
+        from app.data import ak
+        with source_errors('pull_collections'):
+            return ak.pull_collections(cType)
+
+    def pull_stocks_in_collection(self, cType: CollectionType, symbol: str) -> DataFrame:
+        from app.data import ak
+        with source_errors('pull_stocks_in_collection'):
+            return ak.pull_stocks_in_collection(cType, symbol)
+
+    def pull_stock_daily(self) -> DataFrame:
+        from app.data import ak
+        with source_errors('pull_stock_daily'):
+            return ak.pull_stock_daily()
+
+    def pull_stock_daily_hist(self, symbol: str, start_date: date, end_date: date, adjust: str = 'qfq') -> DataFrame:
+        from app.data import ak
+        with source_errors('pull_stock_daily_hist'):
+            return ak.pull_stock_daily_hist(symbol, start_date, end_date, adjust)
+
+    def pull_collection_daily(self, cType: CollectionType) -> DataFrame:
+        from app.data import ak
+        with source_errors('pull_collection_daily'):
+            return ak.pull_collection_daily(cType)
+
+
+PROVIDERS = ('akshare', 'fake')
+
+_provider: Optional[DataProvider] = None
+
+
+def provider_from_name(name: str) -> DataProvider:
+    match name:
+        case 'akshare':
+            return AkshareProvider()
+        case 'fake':
+            from app.data.fake import FakeProvider
+            return FakeProvider.from_env()
+        case _:
+            raise ValueError(f"Data provider {name} not supported, use one of {', '.join(PROVIDERS)}")
+
+
+def get_provider() -> DataProvider:
+    '''
+    The process provider, from DATA_PROVIDER on first use.
+    '''
+    global _provider
+    if _provider is None:
+        _provider = provider_from_name(os.getenv("DATA_PROVIDER") or 'akshare')
+    return _provider
+
+
+def set_provider(provider: Optional[DataProvider]) -> None:
+    '''
+    Replaces the process provider, None to go back to DATA_PROVIDER.
+    '''
+    global _provider
+    _provider = provider
+
+
+@contextmanager
+def use_provider(provider: DataProvider):
+    global _provider
+    previous = _provider
+    _provider = provider
+    try:
+        yield provider
+    finally:
+        _provider = previous
+
+
+#
+# pulls of the process provider
+def pull_stocks(exchange: str) -> DataFrame:
+    return get_provider().pull_stocks(exchange)
+
+
+def pull_collections(cType: CollectionType) -> DataFrame:
+    return get_provider().pull_collections(cType)
+
+
+def pull_stocks_in_collection(cType: CollectionType, symbol: str) -> DataFrame:
+    return get_provider().pull_stocks_in_collection(cType, symbol)
+
+
+def pull_stock_daily() -> DataFrame:
+    return get_provider().pull_stock_daily()
+
+
+def pull_stock_daily_hist(symbol: str, start_date: date, end_date: date, adjust: str = 'qfq') -> DataFrame:
+    return get_provider().pull_stock_daily_hist(symbol, start_date, end_date, adjust)
+
+
+def pull_collection_daily(cType: CollectionType) -> DataFrame:
+    return get_provider().pull_collection_daily(cType)
+
+
+def throttle_secs() -> float:
+    return get_provider().throttle_secs
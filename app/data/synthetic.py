@@ -0,0 +1,243 @@
+"""
+Synthetic A-share market.
+
+Generates `codes` stocks over `years` of trade days, shaped like the real
+market: codes and price limits per board (SSE main/STAR, SZSE main/SME/
+ChiNext, BSE), ST names, industry boards, stocks listed during the period and
+suspensions leaving gaps in their history. Prices follow a random walk within
+the board's daily limit, volumes are lognormal with occasional tail-session
+spikes, so the tail scraper has something to pick.
+
+The frames handed out match the app.data.ak pulls. Used by the fake data
+provider and the benchmarks.
+"""
+
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from pandas import DataFrame
+
+from app.constant.schedule import previous_trade_day, trade_calendar
+
+
+# prefix: (market_id, share of the universe, daily price limit)
+BOARDS: Dict[str, Tuple[int, float, float]] = {
+    '600':  (1, 0.16, 0.10),
+    '601':  (1, 0.08, 0.10),
+    '603':  (1, 0.09, 0.10),
+    '605':  (1, 0.02, 0.10),
+    '688':  (1, 0.11, 0.20),
+    '000':  (2, 0.08, 0.10),
+    '001':  (2, 0.02, 0.10),
+    '002':  (2, 0.20, 0.10),
+    '300':  (2, 0.16, 0.20),
+    '301':  (2, 0.03, 0.20),
+    '830':  (3, 0.03, 0.30),
+    '430':  (3, 0.02, 0.30),
+}
+ST_LIMIT = 0.05
+
+INDUSTRY_BOARDS = 86
+
+
+def trade_days_between(start_day: date, end_day: date) -> List[date]:
+    return trade_calendar().range(start_day, end_day)
+
+
+class SyntheticMarket:
+    '''
+    A reproducible universe, every array is (trade days, codes) with NaN where
+    a stock was not listed or suspended.
+    '''
+
+    def __init__(
+        self,
+        codes: int = 5000,
+        years: float = 2,
+        end_day: Optional[date] = None,
+        seed: int = 0,
+        st_share: float = 0.04,
+        listing_share: float = 0.1,
+        suspension_share: float = 0.05,
+    ):
+        rng = np.random.default_rng(seed)
+        if end_day is None:
+            end_day = previous_trade_day(date.today(), inclusive=True)
+
+        self.trade_days = trade_days_between(end_day - timedelta(days=round(365 * years)), end_day)
+        self.day_index = {day: i for i, day in enumerate(self.trade_days)}
+        n_days = len(self.trade_days)
+
+        # stocks
+        prefixes = list(BOARDS)
+        shares = np.array([BOARDS[p][1] for p in prefixes])
+        board_of = rng.choice(len(prefixes), size=codes, p=shares / shares.sum())
+        counters = {p: 0 for p in prefixes}
+        used = set()
+        code_list, market_ids, limits = [], [], []
+        for b in board_of:
+            prefix = prefixes[b]
+            # boards over 1000 codes spill into the next free codes
+            while (code := f"{int(prefix) * 1000 + counters[prefix]:06d}") in used:
+                counters[prefix] += 1
+            used.add(code)
+            code_list.append(code)
+            market_ids.append(BOARDS[prefix][0])
+            limits.append(BOARDS[prefix][2])
+
+        is_st = rng.random(codes) < st_share
+        names = [
+            (('*ST' if rng.random() < 0.3 else 'ST') if st else '') + f"合成{i:05d}"
+            for i, st in enumerate(is_st)
+        ]
+        self.stocks = DataFrame({
+            'code':         code_list,
+            'name':         names,
+            'market_id':    market_ids,
+            'board':        [f"BK{1000 + i}" for i in rng.integers(0, INDUSTRY_BOARDS, size=codes)],
+        })
+        self.boards = DataFrame({
+            'code':     [f"BK{1000 + i}" for i in range(INDUSTRY_BOARDS)],
+            'name':     [f"合成行业{i:02d}" for i in range(INDUSTRY_BOARDS)],
+        })
+        limit = np.where(is_st, ST_LIMIT, np.array(limits))
+
+        # prices within the daily limit
+        returns = np.clip(rng.normal(0.0003, 0.022, size=(n_days, codes)), -limit, limit)
+        close = np.round(rng.lognormal(np.log(12), 0.7, size=codes) * np.cumprod(1 + returns, axis=0), 2)
+        close = np.maximum(close, 0.5)
+        previous_close = np.vstack([close[:1], close[:-1]])
+        open_ = np.round(previous_close * (1 + np.clip(rng.normal(0, 0.008, size=close.shape), -limit, limit)), 2)
+        high = np.round(np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.008, size=close.shape))), 2)
+        low = np.round(np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.008, size=close.shape))), 2)
+
+        # shares in lots, with occasional volume spikes on up days
+        shares_out = rng.lognormal(np.log(4e8), 0.9, size=codes)
+        base_volume = shares_out * rng.uniform(0.005, 0.03, size=codes) / 100
+        volume = base_volume * rng.lognormal(0, 0.35, size=close.shape)
+        spikes = (rng.random(close.shape) < 0.02) & (close > open_)
+        volume = np.round(np.where(spikes, volume * rng.uniform(2, 5, size=close.shape), volume))
+
+        # not listed yet, then suspensions
+        present = np.ones(close.shape, dtype=bool)
+        listed = rng.random(codes) < listing_share
+        listing_day = np.where(listed, rng.integers(0, n_days, size=codes), 0)
+        present &= np.arange(n_days)[:, None] >= listing_day[None, :]
+        for c in np.flatnonzero(rng.random(codes) < suspension_share):
+            start = rng.integers(0, n_days)
+            present[start:start + rng.integers(3, 60), c] = False
+
+        nan = np.nan
+        self.close = np.where(present, close, nan)
+        self.open = np.where(present, open_, nan)
+        self.high = np.where(present, high, nan)
+        self.low = np.where(present, low, nan)
+        self.volume = np.where(present, volume, nan)
+        self.shares_out = shares_out
+        self.present = present
+
+    @property
+    def codes(self) -> List[str]:
+        return self.stocks['code'].tolist()
+
+    def _columns(self, days: slice, codes: np.ndarray) -> Dict[str, np.ndarray]:
+        close = self.close[days][:, codes]
+        volume = self.volume[days][:, codes]
+        return {
+            'open':     self.open[days][:, codes],
+            'high':     self.high[days][:, codes],
+            'low':      self.low[days][:, codes],
+            'close':    close,
+            'volume':   volume,
+            'turnover': np.round(volume * 100 * close),
+        }
+
+    def daily_frame(self, day: date) -> DataFrame:
+        '''
+        Like app.data.ak.pull_stock_daily on day.
+        '''
+        i = self.day_index[day]
+        codes = np.flatnonzero(self.present[i])
+        columns = {k: v[0] for k, v in self._columns(slice(i, i + 1), codes).items()}
+
+        window = self.volume[max(i - 5, 0):i][:, codes]
+        listed_days = (~np.isnan(window)).sum(axis=0)
+        ma5_volume = np.where(listed_days > 0, np.nansum(window, axis=0) / np.maximum(listed_days, 1), columns['volume'])
+        capital = np.round(self.shares_out[codes] * columns['close'])
+        return DataFrame({
+            'code':                     self.stocks['code'].to_numpy()[codes],
+            **columns,
+            'capital':                  capital,
+            'circulation_capital':      np.round(capital * 0.8),
+            'quantity_relative_ratio':  np.round(columns['volume'] / ma5_volume, 3),
+            # %, volume is in lots of 100
+            'turnover_rate':            np.round(columns['volume'] * 100 / self.shares_out[codes] * 100, 3),
+        })
+
+    def hist_frame(self, code: str, start_day: date, end_day: date) -> DataFrame:
+        '''
+        Like app.data.ak.pull_stock_daily_hist of one code.
+        '''
+        c = int(np.flatnonzero(self.stocks['code'].to_numpy() == code)[0])
+        days = [d for d in self.trade_days if start_day <= d <= end_day]
+        if not days:
+            return DataFrame(columns=['trade_day', 'open', 'high', 'low', 'close', 'volume', 'turnover'])
+        rows = slice(self.day_index[days[0]], self.day_index[days[-1]] + 1)
+        columns = {k: v[:, 0] for k, v in self._columns(rows, np.array([c])).items()}
+        df = DataFrame({'trade_day': days, **columns})
+        return df[df['close'].notna()].reset_index(drop=True)
+
+    def collection_frame(self, day: date) -> DataFrame:
+        '''
+        Like app.data.ak.pull_collection_daily on day, boards are cap weighted.
+        '''
+        i = self.day_index[day]
+        previous = max(i - 1, 0)
+        gain = (self.close[i] - self.close[previous]) / self.close[previous]
+        capital = self.shares_out * self.close[i]
+
+        rng = np.random.default_rng(i)
+        frame = DataFrame({'board': self.stocks['board'], 'name': self.stocks['name'], 'gain': gain, 'capital': capital}).dropna()
+        rows = []
+        for board, group in frame.groupby('board'):
+            top = group.loc[group['gain'].idxmax()]
+            change_rate = float(np.average(group['gain'], weights=group['capital'])) * 100
+            rows.append({
+                'code':             board,
+                'price':            round(1000 * (1 + change_rate / 100), 3),
+                'change':           round(10 * change_rate, 3),
+                'change_rate':      round(change_rate, 3),
+                'capital':          round(group['capital'].sum()),
+                'turnover_rate':    round(float(rng.uniform(0.5, 4)), 3),
+                'gainer_count':     int((group['gain'] > 0).sum()),
+                'loser_count':      int((group['gain'] < 0).sum()),
+                'top_gainer':       top['name'],
+                'top_gain':         round(float(top['gain']) * 100, 3),
+            })
+        return DataFrame(rows)
+
+    def stock_daily_frames(self, end_day: date, stop_days: Optional[Dict[str, date]] = None, chunk_days: int = 20) -> Iterator[DataFrame]:
+        '''
+        stock_daily rows up to end_day in chunks of days, each code's rows
+        stopping at stop_days[code] if given.
+        '''
+        codes = self.stocks['code'].to_numpy()
+        last = self.day_index[end_day]
+        stop_index = np.full(len(codes), last)
+        for code, day in (stop_days or {}).items():
+            stop_index[np.flatnonzero(codes == code)[0]] = self.day_index[day]
+
+        everyone = np.arange(len(codes))
+        for start in range(0, last + 1, chunk_days):
+            rows = slice(start, min(start + chunk_days, last + 1))
+            day_numbers = np.arange(rows.start, rows.stop)
+            keep = self.present[rows] & (day_numbers[:, None] <= stop_index[None, :])
+            columns = self._columns(rows, everyone)
+            days = np.array(self.trade_days[rows], dtype=object)
+            day_grid, code_grid = np.meshgrid(days, codes, indexing='ij')
+            yield DataFrame({
+                'code':         code_grid[keep],
+                'trade_day':    day_grid[keep],
+                **{k: v[keep] for k, v in columns.items()},
+            }).astype({'volume': 'int64', 'turnover': 'int64'})
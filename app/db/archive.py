@@ -0,0 +1,307 @@
+"""
+Cold storage of old stock_daily trade days in Parquet.
+
+Only the last ~260 trade days of stock_daily feed the daily pipeline, ma250
+reads 250 of them, while older days are read by backtests alone. archive
+moves the trade days before a cutoff into a file per month, zstd compressed
+and sorted by (trade_day, code) so the row group statistics prune the days:
+
+    <ARCHIVE_PATH>/stock_daily/2024/2024-01.parquet
+
+and deletes them from the table, keeping it and its primary key index small
+enough to stay in shared buffers:
+
+    python app/main.py archive [--keep 260] [--before 2024-01-01] [-d]
+
+A month is written, and read back, before its rows are deleted, so a failure
+in between leaves a day in both places rather than in neither. Archiving the
+rest of a month later merges into its file. The latest row of each stock
+stays in the table, fill_history looks for it.
+
+read_stock_daily reads a range from the archive and the table together, the
+table's row winning a (code, trade_day) found in both, so the backtest and
+panel loaders do not care where a day lives. data_version counters are left
+alone, archived rows are unchanged rows.
+"""
+
+import os
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from loguru import logger
+from pandas import DataFrame, concat
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Date,
+    DateTime,
+    Float,
+    Integer,
+    Numeric,
+    Table,
+    delete,
+    func,
+    select,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.constant.schedule import trade_calendar
+from app.db.models import StockDaily
+from app.profile.tracer import annotate, trace_elapsed
+
+
+load_dotenv(override=True)
+
+
+DEFAULT_ARCHIVE_PATH = 'archive'
+DEFAULT_KEEP_DAYS = 260
+# ma250's window, the most any daily step reads back
+MIN_KEEP_DAYS = 250
+
+
+def archive_path(directory: Optional[str] = None) -> str:
+    return directory or os.getenv("ARCHIVE_PATH") or DEFAULT_ARCHIVE_PATH
+
+
+def partition_path(directory: str, month: date) -> str:
+    return os.path.join(directory, StockDaily.__tablename__, f"{month:%Y}", f"{month:%Y-%m}.parquet")
+
+
+def _months(start_day: date, end_day: date) -> List[date]:
+    months = []
+    month = start_day.replace(day=1)
+    while month <= end_day:
+        months.append(month)
+        month = (month + timedelta(days=32)).replace(day=1)
+    return months
+
+
+def _month_end(month: date) -> date:
+    return (month + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+
+def arrow_schema(table: Table) -> pa.Schema:
+    '''
+    Arrow types of the table's columns, decimals kept exact.
+    '''
+    fields = []
+    for column in table.columns:
+        match column.type:
+            case Float():
+                arrow_type = pa.float64()
+            case Numeric():
+                arrow_type = pa.decimal128(column.type.precision or 38, column.type.scale or 0)
+            case BigInteger() | Integer():
+                arrow_type = pa.int64()
+            case DateTime():
+                arrow_type = pa.timestamp('us')
+            case Date():
+                arrow_type = pa.date32()
+            case Boolean():
+                arrow_type = pa.bool_()
+            case _:
+                arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type, nullable=True))
+    return pa.schema(fields)
+
+
+def archived_months(directory: Optional[str] = None) -> List[date]:
+    '''
+    Months with a file in the archive, oldest first.
+    '''
+    root = os.path.join(archive_path(directory), StockDaily.__tablename__)
+    if not os.path.isdir(root):
+        return []
+
+    months = []
+    for year in os.listdir(root):
+        for name in os.listdir(os.path.join(root, year)):
+            if name.endswith('.parquet'):
+                months.append(date.fromisoformat(f"{name[:-len('.parquet')]}-01"))
+    return sorted(months)
+
+
+def read_archive(
+    start_day: date,
+    end_day: date,
+    columns: Optional[Iterable[str]] = None,
+    codes: Optional[List[str]] = None,
+    directory: Optional[str] = None,
+) -> DataFrame:
+    '''
+    Archived rows of [start_day, end_day], only the months' files overlapping it are opened.
+    '''
+    directory = archive_path(directory)
+    columns = list(columns) if columns is not None else [c.name for c in StockDaily.__table__.columns]
+
+    filters = [('trade_day', '>=', start_day), ('trade_day', '<=', end_day)]
+    if codes is not None:
+        filters.append(('code', 'in', list(codes)))
+
+    tables = [
+        pq.read_table(partition_path(directory, month), columns=columns, filters=filters)
+        for month in archived_months(directory)
+        if start_day.replace(day=1) <= month <= end_day
+    ]
+    if not tables:
+        return DataFrame(columns=columns)
+    return pa.concat_tables(tables).to_pandas()
+
+
+@trace_elapsed()
+def read_stock_daily(
+    engine: Engine,
+    start_day: date,
+    end_day: date,
+    columns: Iterable[str],
+    codes: Optional[List[str]] = None,
+    directory: Optional[str] = None,
+) -> DataFrame:
+    '''
+    (code, trade_day, *columns) of [start_day, end_day] from the archive and
+    stock_daily together, sorted by (trade_day, code).
+    '''
+    names = ['code', 'trade_day'] + [c for c in columns if c not in ('code', 'trade_day')]
+
+    stmt = (
+        select(*[StockDaily.__table__.c[name] for name in names])
+        .where(StockDaily.trade_day.between(start_day, end_day))
+        .order_by(StockDaily.trade_day, StockDaily.code)
+    )
+    if codes is not None:
+        stmt = stmt.where(StockDaily.code.in_(codes))
+
+    with Session(engine) as session:
+        result = session.execute(stmt)
+        df = DataFrame(result.all(), columns=list(result.keys()))
+
+    archived = read_archive(start_day, end_day, names, codes, directory)
+    if archived.shape[0] == 0:
+        return df
+
+    annotate(archived_rows=archived.shape[0])
+    return (
+        concat([archived, df], ignore_index=True)
+        .drop_duplicates(subset=['code', 'trade_day'], keep='last')
+        .sort_values(['trade_day', 'code'], ignore_index=True)
+    )
+
+
+def _write_partition(path: str, rows: pa.Table) -> int:
+    '''
+    Merges rows into the month's file, replacing the rows of the same
+    (code, trade_day), through a temporary file read back before the rename.
+    '''
+    if os.path.exists(path):
+        existing = pq.read_table(path)
+
+        def keys(t: pa.Table) -> pa.Array:
+            return pc.binary_join_element_wise(t['code'], pc.cast(t['trade_day'], pa.string()), '|')
+
+        existing = existing.filter(pc.invert(pc.is_in(keys(existing), value_set=keys(rows).combine_chunks())))
+        rows = pa.concat_tables([existing, rows])
+
+    rows = rows.sort_by([('trade_day', 'ascending'), ('code', 'ascending')])
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    pq.write_table(rows, tmp, compression='zstd')
+    written = pq.ParquetFile(tmp).metadata.num_rows
+    if written != rows.num_rows:
+        os.remove(tmp)
+        raise Exception(f"Wrote {written} rows into {tmp}, expected {rows.num_rows}")
+    os.replace(tmp, path)
+
+    return rows.num_rows
+
+
+def archive_cutoff(trade_day: date, keep: int = DEFAULT_KEEP_DAYS) -> date:
+    '''
+    First trade day kept in stock_daily when keeping keep trade days through trade_day.
+    '''
+    if keep < MIN_KEEP_DAYS:
+        raise ValueError(f"Keep at least {MIN_KEEP_DAYS} trade days in stock_daily, ma250 reads them, not {keep}")
+    return trade_calendar().offset(trade_day, -(keep - 1))
+
+
+@trace_elapsed(unit='s')
+def archive_stock_daily(
+    engine: Engine,
+    before: date,
+    directory: Optional[str] = None,
+    dryrun: bool = False,
+) -> Dict[date, int]:
+    '''
+    Moves the stock_daily rows of trade days before the cutoff into the
+    archive, a month at a time. Rows moved per month.
+    '''
+    directory = archive_path(directory)
+    table: Table = StockDaily.__table__                                 # type: ignore
+    schema = arrow_schema(table)
+
+    with Session(engine) as session:
+        first_day, latest_day = session.execute(
+            select(func.min(StockDaily.trade_day), func.max(StockDaily.trade_day))
+        ).one()
+    if first_day is None or first_day >= before:
+        logger.info(f"Nothing in stock_daily before {before} to archive")
+        return {}
+
+    if before > archive_cutoff(latest_day, MIN_KEEP_DAYS):
+        raise ValueError(f"Archiving before {before} leaves less than {MIN_KEEP_DAYS} trade days up to {latest_day} in stock_daily")
+
+    # a stock's latest row stays for fill_history, it is archived again once newer rows exist
+    latest = table.alias('latest')
+    not_latest = StockDaily.trade_day < (
+        select(func.max(latest.c.trade_day))
+        .where(latest.c.code == StockDaily.code)
+        .scalar_subquery()
+    )
+
+    moved: Dict[date, int] = {}
+    for month in _months(first_day, before - timedelta(days=1)):
+        start_day, end_day = month, min(_month_end(month), before - timedelta(days=1))
+        in_month = StockDaily.trade_day.between(start_day, end_day)
+
+        if dryrun:
+            with Session(engine) as session:
+                moved[month] = session.execute(select(func.count()).where(in_month, not_latest)).scalar() or 0
+            logger.info(f"Would archive {moved[month]} rows of {month:%Y-%m}")
+            continue
+
+        with Session(engine) as session:
+            result = session.execute(
+                select(table).where(in_month).order_by(StockDaily.trade_day, StockDaily.code)
+            )
+            rows = result.all()
+            if not rows:
+                continue
+
+            columns = dict(zip(result.keys(), zip(*rows)))
+            path = partition_path(directory, month)
+            total = _write_partition(path, pa.table({f.name: pa.array(columns[f.name], type=f.type) for f in schema}, schema=schema))
+
+            moved[month] = session.execute(delete(StockDaily).where(in_month, not_latest)).rowcount
+            session.commit()
+        logger.info(f"Archived {moved[month]} rows of {month:%Y-%m} into {path}, {total} rows in the file")
+
+    if not dryrun and moved and engine.dialect.name == 'postgresql':
+        # frees the deleted rows' pages for the daily inserts, and fresh statistics for the planner
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.exec_driver_sql(f"VACUUM (ANALYZE) {table.name}")
+
+    annotate(months=len(moved), rows=sum(moved.values()))
+    logger.success(f"{'Would archive' if dryrun else 'Archived'} {sum(moved.values())} rows of stock_daily before {before} into {directory}")
+    return moved
+
+
+if __name__ == '__main__':
+    from app.constant.schedule import previous_trade_day
+    from app.db.engine import engine_from_env
+
+    archive_stock_daily(engine_from_env(), archive_cutoff(previous_trade_day(date.today())), dryrun=True)
@@ -0,0 +1,155 @@
+"""
+State shared by the tasks of one `run` invocation.
+
+Created once in main, the context resolves the trade days, checks out one
+pooled connection for its own read-only lookups, and snapshots the metadata
+the tasks keep asking for (the materialized view catalog, the code to market
+map) on first use, so each of them costs one round trip per run.
+
+Tasks that write take .engine: a Session on a shared connection joins
+whatever transaction an earlier lookup left open, and its commit is then a
+no-op that the context's close rolls back.
+"""
+
+from dataclasses import dataclass, field
+from datetime import date, datetime, time
+from typing import Dict, Optional, Set
+
+from loguru import logger
+from pandas import Series
+from sqlalchemy.engine import Connection, Engine
+
+from app.backtest.label import ensure_label_columns
+from app.constant.schedule import previous_trade_day
+from app.db.market import is_closed, market_close_times
+from app.db.trade_calendar import ensure_trade_calendar
+from app.db.materialized_view import MV_STOCK_DAILY, daily_create_mv, get_mv_stock_daily_name, load_mv_catalog, mv_inputs
+from app.db.version import ensure_data_version, is_fresh
+
+
+@dataclass
+class RunContext:
+    engine:                 Engine
+    trade_day:              date
+    previous_day:           date
+
+    _connection:            Optional[Connection]    = field(default=None, repr=False)
+    _procedure_exists:      Optional[bool]          = field(default=None, repr=False)
+    _mv_names:              Optional[Set[str]]      = field(default=None, repr=False)
+    _close_times:           Optional[Dict[str, time]] = field(default=None, repr=False)
+
+    @classmethod
+    def create(cls, engine: Engine, day: date, close_times: Optional[Dict[str, time]] = None) -> 'RunContext':
+        '''
+        close_times, from app.db.market, when the caller has them already, e.g. the serve daemon.
+        '''
+        trade_day = previous_trade_day(day, inclusive=True)
+        return cls(
+            engine=engine,
+            trade_day=trade_day,
+            previous_day=previous_trade_day(trade_day, inclusive=False),
+            _close_times=close_times,
+        )
+
+    @property
+    def bind(self) -> Connection:
+        '''
+        The run's connection, checked out once, for read-only lookups. Never
+        pass it to a writer, nor share it across threads; use .engine there.
+        '''
+        if self._connection is None:
+            self._connection = self.engine.connect()
+        return self._connection
+
+    def ensure_trade_calendar(self) -> bool:
+        '''
+        trade_calendar through the run's trade day, which the windowed queries join.
+        '''
+        return ensure_trade_calendar(self.engine, self.trade_day)
+
+    def ensure_data_version(self) -> bool:
+        '''
+        data_version, which writers bump and derived stages compare against.
+        '''
+        return ensure_data_version(self.engine)
+
+    def ensure_label_columns(self) -> bool:
+        '''
+        feed_daily's label columns, which the label task fills.
+        '''
+        return ensure_label_columns(self.engine)
+
+    #
+    # materialized views
+    def _load_mv_catalog(self) -> None:
+        if self._mv_names is None:
+            if self.engine.dialect.name == 'postgresql':
+                self._procedure_exists, self._mv_names = load_mv_catalog(self.bind)
+            else:
+                self._procedure_exists, self._mv_names = False, set()
+            logger.debug(f"Catalog snapshot: procedure {self._procedure_exists}, {len(self._mv_names)} materialized views")
+
+    def mv_procedure_exists(self) -> bool:
+        self._load_mv_catalog()
+        return bool(self._procedure_exists)
+
+    def mv_exists(self, previous: bool = False) -> bool:
+        self._load_mv_catalog()
+        assert self._mv_names is not None
+        return get_mv_stock_daily_name(self.trade_day, previous=previous) in self._mv_names
+
+    def mv_fresh(self, previous: bool = False, bind: Optional[Connection | Engine] = None) -> bool:
+        '''
+        Whether the view exists and was built from the current stock_daily of
+        its window, or before versions were recorded.
+        '''
+        if not self.mv_exists(previous=previous):
+            return False
+        day = self.previous_day if previous else self.trade_day
+        return is_fresh(bind if bind is not None else self.bind, MV_STOCK_DAILY, day, mv_inputs(day)) is not False
+
+    def create_mv(self, previous: bool = False, bind: Optional[Connection | Engine] = None) -> bool:
+        '''
+        On the engine, or bind, e.g. a connection the caller commits.
+        '''
+        created = daily_create_mv(bind if bind is not None else self.engine, self.trade_day, previous=previous)
+        if created:
+            self._load_mv_catalog()
+            assert self._mv_names is not None
+            self._mv_names.add(get_mv_stock_daily_name(self.trade_day, previous=previous))
+        return created
+
+    #
+    # market sessions
+    def close_times(self) -> Dict[str, time]:
+        if self._close_times is None:
+            self._close_times = market_close_times(self.bind)
+        return self._close_times
+
+    def market_closed(self, now: Optional[datetime] = None) -> bool:
+        '''
+        Whether every supported market has closed on the trade day, i.e. its data is final.
+        '''
+        return all(is_closed(self.trade_day, close, now) for close in self.close_times().values())
+
+    #
+    # stocks
+    def code_market_map(self) -> Series:
+        '''
+        Loaded once and shared with app.display.tdx, so display sinks need no query.
+        '''
+        from app.display.tdx import code_market_map
+
+        return code_market_map(self.bind)
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
@@ -0,0 +1,159 @@
+"""
+Embedded DuckDB copy of the tables the update and filter tasks read.
+
+DuckDB runs the windowed aggregate of update and the joins of filter on
+columns, in vectors and in process, so laptops and tests need no PostgreSQL
+server. A file is filled from the configured PostgreSQL, or any engine:
+
+    python app/main.py duckdb [-o stock_picker.duckdb] [--since 2024-01-01] [--parquet data]
+
+and run against with the duckdb driver, DUCKDB_PATH naming the file:
+
+    python app/main.py --db-driver duckdb run -t update
+    python app/main.py --db-driver duckdb run -t filter -d
+
+Tables are copied without keys or indexes, stock_daily sorted by trade_day so
+the min/max of each row group prune the date windows. With --parquet each
+table is also written to <dir>/<table>.parquet, which DUCKDB_PARQUET attaches
+as views over the file's tables, e.g. to filter on a copy shared read only.
+"""
+
+import os
+import time
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+import pyarrow as pa
+from loguru import logger
+from sqlalchemy import Enum, String, Table, cast, select
+from sqlalchemy.engine import Dialect, Engine
+
+from app.db.models import (
+    Collection,
+    CollectionDaily,
+    FeedDaily,
+    Market,
+    RelationCollectionStock,
+    Stock,
+    StockDaily,
+    TradeDay,
+)
+from app.profile.tracer import annotate, trace_elapsed
+
+
+EXPORT_TABLES: List[Table] = [
+    Market.__table__,                   # type: ignore
+    Stock.__table__,                    # type: ignore
+    Collection.__table__,               # type: ignore
+    RelationCollectionStock.__table__,  # type: ignore
+    TradeDay.__table__,                 # type: ignore
+    CollectionDaily.__table__,          # type: ignore
+    StockDaily.__table__,               # type: ignore
+    FeedDaily.__table__,                # type: ignore
+]
+
+DEFAULT_CHUNK_ROWS = 100_000
+
+
+def duckdb_ddl(table: Table, dialect: Dialect) -> str:
+    '''
+    CREATE OR REPLACE TABLE of the columns, enums as VARCHAR, without keys.
+    '''
+    columns = []
+    for column in table.columns:
+        column_type = 'VARCHAR' if isinstance(column.type, Enum) else column.type.compile(dialect=dialect)
+        columns.append(f"{column.name} {column_type}")
+    return f"CREATE OR REPLACE TABLE {table.name} ({', '.join(columns)})"
+
+
+def attach_parquet(dbapi_connection, directory: str) -> List[str]:
+    '''
+    Views of <directory>/<table>.parquet for every exported table found, on this connection.
+    '''
+    attached = []
+    for table in EXPORT_TABLES:
+        path = os.path.join(directory, f"{table.name}.parquet")
+        if os.path.exists(path):
+            dbapi_connection.execute(f"CREATE OR REPLACE TEMP VIEW {table.name} AS SELECT * FROM read_parquet('{path}')")
+            attached.append(table.name)
+    return attached
+
+
+def _export_table(
+    source: Engine,
+    target: Engine,
+    table: Table,
+    since: Optional[date],
+    chunk_rows: int,
+) -> int:
+    # enums read as their names, what the VARCHAR column holds
+    columns = [cast(c, String).label(c.name) if isinstance(c.type, Enum) else c for c in table.columns]
+    stmt = select(*columns)
+    if 'trade_day' in table.c:
+        if since is not None:
+            stmt = stmt.where(table.c.trade_day >= since)
+        stmt = stmt.order_by(table.c.trade_day, table.c.code)
+
+    names = [c.name for c in table.columns]
+    rows = 0
+    with source.connect() as src, target.connect() as dst:
+        dst.exec_driver_sql(duckdb_ddl(table, target.dialect))
+        duck = dst.connection.dbapi_connection
+
+        # server side cursor on PostgreSQL, chunk_rows in memory at a time
+        result = src.execution_options(stream_results=True, yield_per=chunk_rows).execute(stmt)
+        for partition in result.partitions():
+            chunk = pa.table({name: pa.array(values) for name, values in zip(names, zip(*partition))})
+            duck.register('chunk', chunk)                                   # type: ignore
+            dst.exec_driver_sql(f"INSERT INTO {table.name} ({', '.join(names)}) SELECT {', '.join(names)} FROM chunk")
+            duck.unregister('chunk')                                        # type: ignore
+            rows += len(partition)
+        dst.commit()
+
+    return rows
+
+
+@trace_elapsed(unit='s')
+def export_to_duckdb(
+    source: Engine,
+    target: Engine,
+    tables: Optional[Iterable[str]] = None,
+    since: Optional[date] = None,
+    parquet: Optional[str] = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+) -> Dict[str, int]:
+    '''
+    Copies the tables, every exported one by default, from source into the
+    DuckDB target, replacing them. since keeps the daily tables from that day,
+    take 250+ trade days before the first day to update. Rows per table.
+    '''
+    by_name = {t.name: t for t in EXPORT_TABLES}
+    names = list(tables) if tables else list(by_name)
+    unknown = set(names) - by_name.keys()
+    if unknown:
+        raise Exception(f"Cannot export {', '.join(sorted(unknown))}, only {', '.join(by_name)}")
+
+    counts: Dict[str, int] = {}
+    for name in names:
+        start = time.perf_counter()
+        counts[name] = _export_table(source, target, by_name[name], since, chunk_rows)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Exported {counts[name]} rows of {name} in {elapsed:.2f}s ({counts[name] / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    if parquet:
+        os.makedirs(parquet, exist_ok=True)
+        with target.connect() as dst:
+            for name in names:
+                path = os.path.join(parquet, f"{name}.parquet")
+                dst.exec_driver_sql(f"COPY {name} TO '{path}' (FORMAT parquet, COMPRESSION zstd)")
+        logger.info(f"Wrote {len(names)} tables as Parquet into {parquet}")
+
+    annotate(tables=len(names), rows=sum(counts.values()))
+    logger.success(f"Exported {sum(counts.values())} rows of {len(names)} tables into {target.url.database}")
+    return counts
+
+
+if __name__ == '__main__':
+    from app.db.engine import engine_duckdb, engine_from_env
+
+    export_to_duckdb(engine_from_env(), engine_duckdb())
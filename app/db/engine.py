@@ -1,29 +1,255 @@
 import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, Dict, List, Optional
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.engine import URL, Engine
+from sqlalchemy.orm import Session
 
 
 load_dotenv(override=True)
 
 
-def engine_from_env(**kwargs) -> Engine:
+SUPPORTED_DRIVERS = ('postgresql', 'postgresql+psycopg2', 'postgresql+psycopg')
+
+# embedded analytics copy, see app/db/duck.py
+DEFAULT_DUCKDB_PATH = 'stock_picker.duckdb'
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+@dataclass
+class EngineOptions:
+    '''
+    Driver, pool and per-session settings of the engine, from env and CLI.
+    '''
+
+    driver:             str             = 'postgresql'
+    # POSTGRES_DATABASE when None
+    database:           Optional[str]   = None
+    pool_size:          int             = 5
+    max_overflow:       int             = 10
+    pool_timeout:       float           = 30.0
+    pool_recycle:       int             = -1
+    pre_ping:           bool            = False
+    # ms, 0 or None for no limit
+    statement_timeout:  Optional[int]   = None
+    # e.g. 64MB
+    work_mem:           Optional[str]   = None
+    application_name:   str             = 'stock-picker'
+    # psycopg (v3) only, results in binary format
+    binary:             bool            = False
+
+    @classmethod
+    def from_env(cls) -> 'EngineOptions':
+        return cls(
+            driver=             os.getenv("DB_DRIVER")              or cls.driver,
+            database=           os.getenv("POSTGRES_DATABASE")      or None,
+            pool_size=          _env_int("DB_POOL_SIZE",            cls.pool_size),           # type: ignore
+            max_overflow=       _env_int("DB_MAX_OVERFLOW",         cls.max_overflow),        # type: ignore
+            pool_timeout=float( os.getenv("DB_POOL_TIMEOUT")        or cls.pool_timeout),
+            pool_recycle=       _env_int("DB_POOL_RECYCLE",         cls.pool_recycle),        # type: ignore
+            pre_ping=           _env_bool("DB_POOL_PRE_PING",       cls.pre_ping),
+            statement_timeout=  _env_int("DB_STATEMENT_TIMEOUT"),
+            work_mem=           os.getenv("DB_WORK_MEM")            or None,
+            application_name=   os.getenv("DB_APPLICATION_NAME")    or cls.application_name,
+            binary=             _env_bool("DB_PSYCOPG_BINARY",      cls.binary),
+        )
+
+    def override(self, **kwargs) -> 'EngineOptions':
+        '''
+        Copy with every given option that is not None, e.g. from CLI args.
+        '''
+        names = {f.name for f in fields(self)}
+        return replace(self, **{k: v for k, v in kwargs.items() if k in names and v is not None})
+
+    def server_options(self) -> str:
+        '''
+        libpq options setting the session parameters at connect.
+        '''
+        options = []
+        if self.statement_timeout:
+            options.append(f"-c statement_timeout={self.statement_timeout}")
+        if self.work_mem:
+            options.append(f"-c work_mem={self.work_mem}")
+        return ' '.join(options)
+
+
+def _binary_cursor_factory():
+    import psycopg
+
+    class BinaryCursor(psycopg.Cursor):
+        '''
+        Cursor asking for binary results unless a call says otherwise.
+        '''
+
+        def execute(self, query, params=None, *, prepare=None, binary=None):
+            return super().execute(query, params, prepare=prepare, binary=True if binary is None else binary)
+
+    return BinaryCursor
+
+
+def engine_from_env(options: Optional[EngineOptions] = None, **kwargs) -> Engine:
+    if options is None:
+        options = EngineOptions.from_env()
+
+    if options.driver == 'duckdb':
+        return engine_duckdb(**kwargs)
 
     url = URL.create(
-        drivername= os.getenv("DB_DRIVER")          or 'postgresql',
+        drivername= options.driver,
         username=   os.getenv("POSTGRES_USERNAME")  or 'postgres',
         password=   os.getenv("POSTGRES_PASSWORD")  or 'postgres',
         host=       os.getenv("POSTGRES_HOST")      or 'localhost',
         port=   int(os.getenv("POSTGRES_PORT")      or '5432'),
-        database=   os.getenv("POSTGRES_DATABASE")
+        database=   options.database                or os.getenv("POSTGRES_DATABASE")
     )
 
-    if url.drivername != 'postgresql':
-        raise Exception("Only support postgresql atm")
+    if url.drivername not in SUPPORTED_DRIVERS:
+        raise Exception(f"Only support {', '.join(SUPPORTED_DRIVERS)} atm")
+
+    connect_args: Dict[str, Any] = {'application_name': options.application_name}
+    if options.server_options():
+        connect_args['options'] = options.server_options()
+    if options.binary:
+        if url.get_dialect().driver != 'psycopg':
+            raise Exception("Binary results need the postgresql+psycopg driver")
+        connect_args['cursor_factory'] = _binary_cursor_factory()
+    connect_args.update(kwargs.pop('connect_args', {}))
+
+    return create_engine(
+        url,
+        pool_size=options.pool_size,
+        max_overflow=options.max_overflow,
+        pool_timeout=options.pool_timeout,
+        pool_recycle=options.pool_recycle,
+        pool_pre_ping=options.pre_ping,
+        connect_args=connect_args,
+        **kwargs,
+    )
 
-    return create_engine(url, **kwargs)
+
+def engine_duckdb(
+    path: Optional[str] = None,
+    read_only: bool = False,
+    parquet: Optional[str] = None,
+    **kwargs,
+) -> Engine:
+    '''
+    Embedded DuckDB engine on a file, DUCKDB_PATH by default, with the Parquet
+    files of a directory attached as views, DUCKDB_PARQUET by default. Needs
+    duckdb and duckdb_engine, imported on connect.
+    '''
+    path = path or os.getenv("DUCKDB_PATH") or DEFAULT_DUCKDB_PATH
+    parquet = parquet or os.getenv("DUCKDB_PARQUET") or None
+
+    config: Dict[str, Any] = {}
+    if os.getenv("DUCKDB_THREADS"):
+        config['threads'] = int(os.environ["DUCKDB_THREADS"])
+    if os.getenv("DUCKDB_MEMORY_LIMIT"):
+        config['memory_limit'] = os.environ["DUCKDB_MEMORY_LIMIT"]
+
+    connect_args: Dict[str, Any] = {'read_only': read_only, 'config': config}
+    connect_args.update(kwargs.pop('connect_args', {}))
+    engine = create_engine(f"duckdb:///{path}", connect_args=connect_args, **kwargs)
+
+    if parquet:
+        from app.db.duck import attach_parquet
+
+        @event.listens_for(engine, 'connect')
+        def views(dbapi_connection, connection_record):
+            attach_parquet(dbapi_connection, parquet)
+
+    return engine
 
 
 def engine_mock(**kwargs):
-    return create_engine('sqlite:///:memory:', **kwargs)
\ No newline at end of file
+    return create_engine('sqlite:///:memory:', **kwargs)
+
+
+@contextmanager
+def pipeline(session: Session):
+    '''
+    Runs the statements of the block in psycopg (v3) pipeline mode, which
+    sends them without waiting for each result. A no-op on other drivers.
+    '''
+    if session.get_bind().dialect.driver != 'psycopg':
+        yield
+        return
+
+    dbapi_connection = session.connection().connection.dbapi_connection
+    with dbapi_connection.pipeline(): # type: ignore
+        yield
+
+
+@dataclass
+class PoolStats:
+    '''
+    Connects and checkouts of an engine's pool, see instrument_pool.
+    '''
+
+    connects:           int             = 0
+    checkouts:          int             = 0
+    connect_ms:         List[float]     = field(default_factory=list)
+    checkout_ms:        List[float]     = field(default_factory=list)
+
+    def summary(self) -> Dict[str, float]:
+        def pct(values: List[float], q: float) -> float:
+            if not values:
+                return 0.0
+            ordered = sorted(values)
+            return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 3)
+
+        return {
+            'connects':         self.connects,
+            'checkouts':        self.checkouts,
+            'connect_ms_total': round(sum(self.connect_ms), 3),
+            'connect_ms_p50':   pct(self.connect_ms, 0.5),
+            'checkout_ms_p50':  pct(self.checkout_ms, 0.5),
+            'checkout_ms_p95':  pct(self.checkout_ms, 0.95),
+            'checkout_ms_max':  round(max(self.checkout_ms, default=0.0), 3),
+        }
+
+
+def instrument_pool(engine: Engine) -> PoolStats:
+    '''
+    Records the latency of every new DBAPI connection and every pool checkout,
+    the latter including the connect and pre-ping it may trigger.
+    '''
+
+    stats = PoolStats()
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_checkout():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            stats.checkouts += 1
+            stats.checkout_ms.append((time.perf_counter() - start) * 1000)
+
+    pool.connect = timed_checkout # type: ignore
+
+    @event.listens_for(engine, 'do_connect')
+    def timed_connect(dialect, conn_rec, cargs, cparams):
+        start = time.perf_counter()
+        connection = dialect.loaded_dbapi.connect(*cargs, **cparams)
+        stats.connects += 1
+        stats.connect_ms.append((time.perf_counter() - start) * 1000)
+        return connection
+
+    return stats
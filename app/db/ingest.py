@@ -4,28 +4,29 @@ Ingesting is for dynamic data like stock daily/collection daily
 
 from time import sleep
 from datetime import date, timedelta
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 
-from pandas import isna
+from pandas import DataFrame, isna
 from loguru import logger
-from sqlalchemy import select
+from sqlalchemy import select, tuple_
 from sqlalchemy.orm import Session
 from sqlalchemy.engine import Engine
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from app.constant.collection import CollectionType
 from app.constant.exchange import MARKET_SUPPORTED
-from app.constant.misc import TIME_SLEEP_SECS
 from app.constant.schedule import (
     is_stock_market_open, 
     previous_trade_day,
 )
-from app.data.ak import (
+from app.data.provider import (
+    ProviderError,
     pull_collection_daily, 
     pull_stock_daily, 
     pull_stock_daily_hist,
+    throttle_secs,
 )
-from app.db.engine import engine_from_env
+from app.db.engine import engine_from_env, pipeline
 from app.db.models import (
     Collection, 
     Market, 
@@ -33,6 +34,47 @@ from app.db.models import (
     StockDaily, 
     CollectionDaily,
 )
+from app.db.version import bump_version
+
+
+# pulls of one code again after a ProviderError, before it is skipped
+PULL_RETRIES = 2
+
+
+def pull_stock_daily_hist_retried(code: str, start_date: date, end_date: date) -> Optional[DataFrame]:
+    '''
+    Daily history of one code, pulled again on a ProviderError, backing off
+    by the throttle. None for a code the source does not know, or once out of
+    retries, so one code does not stop the others.
+    '''
+    for attempt in range(1 + PULL_RETRIES):
+        try:
+            return pull_stock_daily_hist(
+                symbol=code,
+                start_date=start_date,
+                end_date=end_date,
+                adjust='qfq'
+            )
+        except KeyError:
+            logger.error(f'Got key error of stock code {code}, continuing...')
+            return None
+        except ProviderError as e:
+            logger.warning(f"Pulling daily data of {code} failed, attempt {attempt + 1} of {1 + PULL_RETRIES}: {e}")
+            sleep(throttle_secs() * (attempt + 1))
+
+    logger.error(f"Skipping daily data of {code}, {1 + PULL_RETRIES} pulls failed")
+    return None
+
+
+def add_stock_daily_hist(session: Session, stock_objs: List[StockDaily]) -> None:
+    '''
+    Inserts the daily history of a code and bumps its versions, sent in one
+    pipeline on psycopg (v3). The caller commits.
+    '''
+    with pipeline(session):
+        session.add_all(stock_objs)
+        session.flush()
+        bump_version(session, StockDaily.__tablename__, [obj.trade_day for obj in stock_objs])
 
 
 def load_individual_stock_daily_hist(
@@ -48,22 +90,14 @@ def load_individual_stock_daily_hist(
             assert start_day <= end_date
 
             logger.debug(f"Getting daily data of {code} for {(end_date - start_day + timedelta(days=1)).days} days")
-            try:
-                df = pull_stock_daily_hist(
-                    symbol=code,
-                    start_date=start_day,
-                    end_date=end_date,
-                    adjust='qfq'
-                )
-            except KeyError:
-                logger.error(f'Got key error of stock code {code}, continuing...')
-                session.commit()
-                sleep(TIME_SLEEP_SECS)
+            df = pull_stock_daily_hist_retried(code, start_day, end_date)
+            if df is None:
+                sleep(throttle_secs())
                 continue
 
             if len(df) == 0:
                 logger.warning(f"No daily data for {code} from {start_day} to {end_date}")
-                sleep(TIME_SLEEP_SECS)
+                sleep(throttle_secs())
                 continue
 
             stock_objs = [
@@ -80,12 +114,12 @@ def load_individual_stock_daily_hist(
                 for _, row in df.iterrows()
             ]
             
-            session.add_all(stock_objs)
+            add_stock_daily_hist(session, stock_objs)
             session.commit()
 
             logger.info(f"Total of {len(stock_objs)} daily data for {code} committed")
             # TODO async
-            sleep(TIME_SLEEP_SECS)
+            sleep(throttle_secs())
 
 
 def load_all_stock_daily_hist(
@@ -118,12 +152,10 @@ def load_all_stock_daily_hist(
 
                 logger.debug(f"Getting daily data for {stock.name} from {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}")
 
-                df = pull_stock_daily_hist(
-                    symbol=stock.code,
-                    start_date=start_date,
-                    end_date=end_date,
-                    adjust='qfq'
-                )
+                df = pull_stock_daily_hist_retried(stock.code, start_date, end_date)
+                if df is None:
+                    sleep(throttle_secs())
+                    continue
 
                 stock_objs = [
                     StockDaily(
@@ -139,12 +171,12 @@ def load_all_stock_daily_hist(
                     for _, row in df.iterrows()
                 ]
 
-                session.add_all(stock_objs)
+                add_stock_daily_hist(session, stock_objs)
                 session.commit()
 
                 logger.success(f"Total of {len(stock_objs)} daily data for {stock.name} committed")
                 # TODO async
-                sleep(TIME_SLEEP_SECS)
+                sleep(throttle_secs())
 
         else:
             logger.error(f"Market {market_name} not in database")
@@ -173,6 +205,7 @@ def refresh_stock_daily(engine: Engine, today: Optional[date] = None) -> None:
         df = df[~df['code'].isin(stock_codes_to_handle)]
         df['trade_day'] = today
 
+        changed = len(df)
         try:
             if engine.dialect.name == 'postgresql':
                 # upsert statement
@@ -192,9 +225,11 @@ def refresh_stock_daily(engine: Engine, today: Optional[date] = None) -> None:
                 }
                 stmt = stmt.on_conflict_do_update(
                     index_elements=['code', 'trade_day'],
-                    set_=update_dict
+                    set_=update_dict,
+                    # rows already holding these values are left alone and unversioned
+                    where=tuple_(*[StockDaily.__table__.c[key] for key in update_dict]).is_distinct_from(tuple_(*update_dict.values())),
                 )
-                session.execute(stmt)
+                changed = session.execute(stmt).rowcount
 
             else:
                 for _, row in df.iterrows():
@@ -216,8 +251,10 @@ def refresh_stock_daily(engine: Engine, today: Optional[date] = None) -> None:
                     session.merge(stock)
 
 
+            if changed:
+                bump_version(session, StockDaily.__tablename__, [today])
             session.commit()
-            logger.info(f"Total of {len(df)} daily data committed for {today.isoformat()}")
+            logger.info(f"Total of {len(df)} daily data committed for {today.isoformat()}, {changed} changed")
 
         except Exception as e:
             session.rollback()
@@ -246,6 +283,7 @@ def refresh_collection_daily(engine: Engine, collection_type: CollectionType, to
         df = df[~df['code'].isin(collection_codes_to_handle)]
         df['trade_day'] = today
 
+        changed = len(df)
         try:
             if engine.dialect.name == 'postgresql':
                 # upsert statement
@@ -264,9 +302,11 @@ def refresh_collection_daily(engine: Engine, collection_type: CollectionType, to
                 }
                 stmt = stmt.on_conflict_do_update(
                     index_elements=['code', 'trade_day'],
-                    set_=update_dict
+                    set_=update_dict,
+                    # rows already holding these values are left alone and unversioned
+                    where=tuple_(*[CollectionDaily.__table__.c[key] for key in update_dict]).is_distinct_from(tuple_(*update_dict.values())),
                 )
-                session.execute(stmt)
+                changed = session.execute(stmt).rowcount
 
             else:
                 for _, row in df.iterrows():
@@ -286,8 +326,10 @@ def refresh_collection_daily(engine: Engine, collection_type: CollectionType, to
                     )
                     session.merge(stock)
 
+            if changed:
+                bump_version(session, CollectionDaily.__tablename__, [today])
             session.commit()
-            logger.info(f"Total of {len(df)} daily data committed for {today.isoformat()}")
+            logger.info(f"Total of {len(df)} daily data committed for {today.isoformat()}, {changed} changed")
 
         except Exception as e:
             session.rollback()
@@ -12,9 +12,8 @@ from sqlalchemy import select
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
 
-from app.data.ak import pull_collections, pull_stocks, pull_stocks_in_collection
+from app.data.provider import pull_collections, pull_stocks, pull_stocks_in_collection, throttle_secs
 from app.constant.exchange import BAD_STOCKS, MARKET_SUPPORTED
-from app.constant.misc import TIME_SLEEP_SECS
 from app.constant.collection import CollectionType
 from app.db.engine import engine_from_env
 from app.db.models import Collection, Market, Stock
@@ -115,7 +114,7 @@ def load_collection_stock_relation(engine: Engine, collection_type: CollectionTy
             cName = collection[0].name
 
             df = pull_stocks_in_collection(cType=collection_type, symbol=cName)
-            sleep(TIME_SLEEP_SECS)
+            sleep(throttle_secs())
             
             for code, name in zip(df['code'], df['name']):
                 stock = session.query(Stock).filter_by(code=code).first()
@@ -0,0 +1,57 @@
+"""
+Trading sessions of the markets, from the market table.
+
+Close times are handed out as timezone-aware times, local to the exchange, so
+they compare correctly whatever the host's timezone.
+"""
+
+from datetime import date, datetime, time
+from typing import Dict, Iterable, Optional
+from zoneinfo import ZoneInfo
+
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.constant.exchange import COUNTRY_TIMEZONE, MARKET_SUPPORTED
+from app.db.models import Market
+
+
+# China mainland close, when the market table is not loaded yet
+DEFAULT_CLOSE = time(15, 0, tzinfo=ZoneInfo(COUNTRY_TIMEZONE['CN']))
+
+
+def market_close_times(engine: Engine, markets: Iterable[str] = MARKET_SUPPORTED) -> Dict[str, time]:
+    '''
+    Close time of each market by name_short, aware of the exchange's timezone.
+    '''
+    markets = set(markets)
+    with Session(engine) as session:
+        rows = session.execute(
+            select(Market.name_short, Market.country, Market.close)
+            .where(Market.name_short.in_(markets), Market.close.is_not(None))
+        ).all()
+
+    closes = {
+        name: close.replace(tzinfo=ZoneInfo(COUNTRY_TIMEZONE.get(country, COUNTRY_TIMEZONE['CN'])))
+        for name, country, close in rows
+    }
+    missing = markets - closes.keys()
+    if missing:
+        logger.warning(f"No close time of {', '.join(sorted(missing))} in market, assuming {DEFAULT_CLOSE.isoformat()}")
+        closes.update({name: DEFAULT_CLOSE for name in missing})
+    return closes
+
+
+def close_of(trade_day: date, close: time) -> datetime:
+    return datetime.combine(trade_day, close)
+
+
+def is_closed(trade_day: date, close: time, now: Optional[datetime] = None) -> bool:
+    '''
+    Whether the market closing at close has closed on trade_day.
+    '''
+    if now is None:
+        now = datetime.now(close.tzinfo)
+    return now >= close_of(trade_day, close)
@@ -1,12 +1,14 @@
 from datetime import date
-from typing import Optional
+from typing import Optional, Set, Tuple
 
 from loguru import logger
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
 
-from app.constant.schedule import is_stock_market_open, previous_trade_day
+from app.constant.schedule import is_stock_market_open, previous_trade_day, trade_calendar
+from app.db.trade_calendar import min_window_rows
+from app.db.version import Inputs, bump_version, snapshot
 from app.profile.tracer import trace_elapsed
 
 
@@ -19,7 +21,20 @@ RETURNS boolean AS
 $$
 DECLARE
   exists_result boolean;
+  trade_ordinal integer;
+  window_249_start date;
+  window_4_start date;
 BEGIN
+        -- the days of the next trade day's 250 and 5 day windows that are known today, bounded by
+        -- trade_calendar as literals so the planner can prune
+        SELECT ordinal INTO trade_ordinal FROM trade_calendar WHERE day = input_trade_day;
+        SELECT day INTO window_249_start FROM trade_calendar WHERE ordinal = trade_ordinal - 248;
+        SELECT day INTO window_4_start FROM trade_calendar WHERE ordinal = trade_ordinal - 3;
+
+        IF window_249_start IS NULL OR window_4_start IS NULL THEN
+                RETURN false;
+        END IF;
+
         EXECUTE format(
                 'DROP MATERIALIZED VIEW IF EXISTS %s;', 
                 '{MV_STOCK_DAILY}_' || replace(input_trade_day::text, '-', '_')
@@ -33,113 +48,38 @@ SELECT
         sd.trade_day,                                           -- last trade day
         sd.close,                                               -- previous close
         sd.volume,                                              -- previous volume
-        ma250_subq.ma250                AS ma250,               -- 250-day moving average of close
-        ma250_subq.close                AS prev_250_close,      -- close 250 days ago
-        volume_ma5_subq.volume_ma5      AS ma5_volume,          -- 5-day moving average of volume
-        volume_ma5_subq.volume          AS prev_5_volume        -- volume 5 days ago
+        window_subq.close_sum,                                  -- sum of close over the last 249 days
+        window_subq.close_count,                                -- rows of close over the last 249 days
+        window_subq.volume_sum,                                 -- sum of volume over the last 4 days
+        window_subq.volume_count                                -- rows of volume over the last 4 days
 FROM stock_daily sd
 
-JOIN LATERAL 
-(
-        -- ma250_subq
-        SELECT 
-        (
-                -- ma250_expr
-                SELECT AVG(close)
-                FROM 
-                (
-                        -- ma250_innermost
-                        SELECT close
-                        FROM stock_daily
-                        WHERE code = sd.code
-                        AND trade_day <= sd.trade_day
-                        ORDER BY trade_day DESC
-                        LIMIT 250
-                ) AS ma250_innermost
-        ) AS ma250,
-        (
-                SELECT COUNT(close)
-                FROM 
-                (
-                        -- ma250_innermost
-                        SELECT close
-                        FROM stock_daily
-                        WHERE code = sd.code
-                        AND trade_day <= sd.trade_day
-                        ORDER BY trade_day DESC
-                        LIMIT 250
-                ) AS ma250_innermost
-        ) AS row_count,
-        (
-                -- ma250_expr
-                SELECT close
-                FROM 
-                (
-                        -- ma250_innermost
-                        SELECT 
-                                close,
-                                trade_day
-                        FROM stock_daily
-                        WHERE code = sd.code
-                        AND trade_day <= sd.trade_day
-                        ORDER BY trade_day DESC
-                        LIMIT 250
-                ) AS ma250_innermost
-                ORDER BY trade_day ASC 
-                LIMIT 1
-        ) AS close
-        FROM stock_daily
-        WHERE code = sd.code AND trade_day = sd.trade_day
-) ma250_subq ON true
-
-JOIN LATERAL
+JOIN
 (
-        -- volume_ma5_subq
-        SELECT 
-        (
-                -- vol_ma5_expr
-                SELECT AVG(volume)
-                FROM 
-                (
-                        -- volume_ma5_innermost
-                        SELECT volume
-                        FROM stock_daily
-                        WHERE code = sd.code
-                        AND trade_day <= sd.trade_day
-                        ORDER BY trade_day DESC
-                        LIMIT 5
-                ) AS volume_ma5_innermost
-        ) AS volume_ma5,
-        (
-                -- vol_ma5_volume_expr
-                SELECT volume
-                FROM 
-                (
-                        -- volume_ma5_innermost
-                        SELECT 
-                                volume,
-                                trade_day
-                        FROM stock_daily
-                        WHERE code = sd.code
-                        AND trade_day <= sd.trade_day
-                        ORDER BY trade_day DESC
-                        LIMIT 5
-                ) AS volume_ma5_innermost
-                ORDER BY trade_day ASC
-                LIMIT 1
-        ) AS volume
+        -- one range scan of the window for both sums, counted so gaps in the window stay exact
+        SELECT
+                code,
+                SUM(close)                                      AS close_sum,
+                COUNT(close)                                    AS close_count,
+                SUM(volume) FILTER (WHERE trade_day >= %L)      AS volume_sum,
+                COUNT(volume) FILTER (WHERE trade_day >= %L)    AS volume_count
         FROM stock_daily
-        WHERE code = sd.code AND trade_day = sd.trade_day
-) volume_ma5_subq ON true
+        WHERE trade_day BETWEEN %L AND %L
+        GROUP BY code
+) window_subq ON window_subq.code = sd.code
 
 WHERE 
         sd.trade_day = %L AND 
-        ma250_subq.row_count = 250;', 
+        window_subq.close_count + 1 >= {min_window_rows(250)};', 
 
         -- %s
         '{MV_STOCK_DAILY}_' || replace(input_trade_day::text, '-', '_'),
 
         -- %L
+        window_4_start,
+        window_4_start,
+        window_249_start,
+        input_trade_day,
         input_trade_day
 );
 
@@ -180,6 +120,17 @@ SELECT EXISTS (
 """
 
 
+LOAD_MV_CATALOG_SQL = f"""
+SELECT
+        ({CHECK_MV_PROCEDURE_EXISTS_SQL.strip().rstrip(';')}) AS procedure_exists,
+        ARRAY(
+                SELECT matviewname::text
+                FROM pg_matviews
+                WHERE matviewname LIKE '{MV_STOCK_DAILY}_%'
+        ) AS mv_names;
+"""
+
+
 def get_mv_stock_daily_name(trade_day: Optional[date] = None, previous = False) -> str:
     if trade_day is None:
         trade_day = previous_trade_day(date.today(), inclusive=previous)
@@ -205,6 +156,23 @@ def check_mv_procedure_exists(engine: Engine) -> bool:
         return bool(result.scalar())
 
 
+@trace_elapsed()
+def load_mv_catalog(engine: Engine) -> Tuple[bool, Set[str]]:
+    '''
+    Whether the procedure exists and the names of all daily materialized views, in one query.
+    '''
+    with Session(engine) as session:
+        procedure_exists, mv_names = session.execute(text(LOAD_MV_CATALOG_SQL)).one()
+        return bool(procedure_exists), set(mv_names or [])
+
+
+def mv_inputs(trade_day: date) -> Inputs:
+    '''
+    The stock_daily window the view of trade_day is built from, see app.db.version.
+    '''
+    return {'stock_daily': (trade_calendar().offset(trade_day, -248), trade_day)}
+
+
 @trace_elapsed()
 def daily_create_mv(engine: Engine, trade_day: Optional[date] = None, previous = False) -> bool:
     if trade_day is None:
@@ -219,6 +187,7 @@ def daily_create_mv(engine: Engine, trade_day: Optional[date] = None, previous =
         result = session.execute(text(DAILY_CREATE_MV_SQL.format(trade_day.isoformat())))
         exists = bool(result.scalar())
         if exists:
+            bump_version(session, MV_STOCK_DAILY, [trade_day], inputs=snapshot(session, mv_inputs(trade_day)))
             session.commit()
             logger.success(f"Materialized view {mv_name} (re)created successfully")
         else:
@@ -1,8 +1,7 @@
 from __future__ import annotations
 from datetime import datetime
-from typing import List
+from typing import TYPE_CHECKING, List
 
-from pandas import DataFrame
 from sqlalchemy import (
     Integer,
     String,
@@ -11,6 +10,7 @@ from sqlalchemy import (
     Float,
     Numeric,
     DateTime,
+    JSON,
     BigInteger,
     ForeignKey,
     UniqueConstraint,
@@ -23,7 +23,9 @@ from sqlalchemy.types import Enum as SQLAlchemyEnum
 from sqlalchemy.inspection import inspect
 
 from app.constant.collection import CollectionType
-from app.display.utils import ten_thousand_format
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
 
 
 class MetadataBase(DeclarativeBase):
@@ -50,6 +52,38 @@ class Market(MetadataBase):
     currency:                   Mapped[str]         = mapped_column(String, nullable=True)
 
 
+class TradeDay(MetadataBase):
+    '''
+    Trade days of the China mainland market, see app.db.trade_calendar.
+
+    - ordinal:                  position in the trade calendar, so a window of n
+                                trade days ending on d starts at ordinal(d) - n + 1
+    '''
+
+    __tablename__ = 'trade_calendar'
+
+    day:                        Mapped[Date]        = mapped_column(Date, primary_key=True)
+    ordinal:                    Mapped[int]         = mapped_column(Integer, unique=True)
+
+
+class DataVersion(MetadataBase):
+    '''
+    Write counter of a table per trade day, see app/db/version.py.
+
+    - version:                  bumped in the transaction of every write to the day's rows
+    - inputs:                   of a derived table, versions of the ranges it was built from
+    '''
+
+    __tablename__ = 'data_version'
+    __table_args__ = PrimaryKeyConstraint('table_name', 'trade_day'),
+
+    table_name:                 Mapped[str]         = mapped_column(String(50))
+    trade_day:                  Mapped[Date]        = mapped_column(Date)
+    version:                    Mapped[int]         = mapped_column(BigInteger, default=1)
+    last_updated:               Mapped[DateTime]    = mapped_column(DateTime, server_default=func.now(), onupdate=func.now())
+    inputs:                     Mapped[dict]        = mapped_column(JSON, nullable=True)
+
+
 class Collection(MetadataBase):
     '''
     A collection of stocks, such as concept board, industry board, index, analyst, etc.
@@ -177,11 +211,23 @@ class FeedDaily(MetadataBase):
     gain:                       Mapped[Float]       = mapped_column(Float)
     volume_gain:                Mapped[Float]       = mapped_column(Float)
 
+    # labels, filled by app.backtest.label once the following trade days are in
+    next_open:                  Mapped[Numeric]     = mapped_column(Numeric(10, 3), nullable=True)
+    next_close:                 Mapped[Numeric]     = mapped_column(Numeric(10, 3), nullable=True)
+    return_1d:                  Mapped[Float]       = mapped_column(Float, nullable=True)
+    return_3d:                  Mapped[Float]       = mapped_column(Float, nullable=True)
+    return_5d:                  Mapped[Float]       = mapped_column(Float, nullable=True)
+    return_10d:                 Mapped[Float]       = mapped_column(Float, nullable=True)
+    return_20d:                 Mapped[Float]       = mapped_column(Float, nullable=True)
+    max_drawdown:               Mapped[Float]       = mapped_column(Float, nullable=True)
+
     def to_dict(self):
         return {c.key: getattr(self, c.key) for c in self.__table__.columns}
 
     @classmethod
     def to_dataframe(cls, fds: List[FeedDaily] = []) -> DataFrame:
+        from pandas import DataFrame
+
         df = DataFrame(
             [fd.to_dict() for fd in fds],
             columns=FeedDaily.__table__.columns.keys(),
@@ -208,19 +254,22 @@ class FeedDaily(MetadataBase):
     
     @classmethod
     def convert_to_feed(cls, df: DataFrame) -> DataFrame:
+        from app.display.utils import fixed_format_series, ten_thousand_format_series
+
         column_mapping = FeedDaily.feed_column_mapping()
         transformations = {
-            'collection_performance':   lambda x: format(x, '.2f') + '%',
-            'gain':                     lambda x: format(x, '.2f') + '%',
-            'previous_close':           lambda x: format(x, '.2f'),
-            'close':                    lambda x: format(x, '.2f'),
-            'previous_volume':          lambda x: ten_thousand_format(x),
-            'volume':                   lambda x: ten_thousand_format(x),
-            'volume_gain':              lambda x: format(x, '.2f') + '%',
+            'collection_performance':   lambda s: fixed_format_series(s, 2, '%'),
+            'gain':                     lambda s: fixed_format_series(s, 2, '%'),
+            'previous_close':           lambda s: fixed_format_series(s, 2),
+            'close':                    lambda s: fixed_format_series(s, 2),
+            'previous_volume':          lambda s: ten_thousand_format_series(s),
+            'volume':                   lambda s: ten_thousand_format_series(s),
+            'volume_gain':              lambda s: fixed_format_series(s, 2, '%'),
         }
 
+        # whole columns at once
         for col, func_ in transformations.items():
-            df[col] = df[col].apply(func_)
+            df[col] = func_(df[col])
         
         return df.rename(columns=column_mapping)[list(column_mapping.values())]
     
@@ -259,6 +308,28 @@ class FeedDaily(MetadataBase):
         return columns
 
 
+class BacktestState(MetadataBase):
+    '''
+    End state of a backtest per filter and parameter hash, extended one trade day at a time.
+
+    - state:                    open positions, realized equity curve and cumulative stats
+    - data_versions:            versions of the stock_daily and feed_daily ranges the state was built from
+    '''
+
+    __tablename__ = "backtest_state"
+    __table_args__ = PrimaryKeyConstraint('filter_id', 'params_hash'),
+
+    filter_id:                  Mapped[int]         = mapped_column(Integer)
+    params_hash:                Mapped[str]         = mapped_column(String(40))
+    last_updated:               Mapped[DateTime]    = mapped_column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    params:                     Mapped[dict]        = mapped_column(JSON)
+    start_day:                  Mapped[Date]        = mapped_column(Date)
+    last_trade_day:             Mapped[Date]        = mapped_column(Date)
+    data_versions:              Mapped[dict]        = mapped_column(JSON, nullable=True)
+    state:                      Mapped[dict]        = mapped_column(JSON)
+
+
 if __name__ == "__main__":
     from app.db.engine import engine_from_env
     from app.constant.confirm import confirms_execution
@@ -0,0 +1,112 @@
+"""
+The trade calendar in the database.
+
+The trade_calendar table mirrors app.constant.schedule, one row per trade day
+with its ordinal, so rolling windows in SQL are bounded by dates instead of
+`ORDER BY trade_day DESC LIMIT n` per code:
+
+    stock_daily.trade_day BETWEEN window_start(d, 250) AND d
+
+which the planner serves with index range scans and partition pruning. A
+code gets its average with a few rows missing from the window, see
+min_window_rows, rather than only with every day present.
+
+The table is compared against the calendar on every run and rewritten when
+they differ, so holidays.csv edits reach the SQL windows the same day they
+reach the Python calendar the version ranges are taken from.
+"""
+
+from datetime import date
+from typing import Optional
+
+from loguru import logger
+from sqlalchemy import delete, insert, inspect, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.constant.schedule import TradeCalendar, trade_calendar
+from app.db.models import TradeDay
+from app.profile.tracer import annotate, trace_elapsed
+
+
+# trade days a code may miss in a window and still get its average, e.g. a short suspension
+WINDOW_TOLERANCE = 5
+
+
+def min_window_rows(days: int) -> int:
+    '''
+    Rows a code needs within a window of `days` trade days.
+    '''
+    return days - WINDOW_TOLERANCE
+
+
+def window_start(trade_day: date, days: int) -> ColumnElement:
+    '''
+    First day of the window of `days` trade days ending on trade_day, looked up in trade_calendar.
+    '''
+    ordinal = select(TradeDay.ordinal).where(TradeDay.day == trade_day).scalar_subquery()
+    return select(TradeDay.day).where(TradeDay.ordinal == ordinal - (days - 1)).scalar_subquery()
+
+
+@trace_elapsed()
+def refresh_trade_calendar(engine: Engine, calendar: Optional[TradeCalendar] = None, up_to: Optional[date] = None) -> int:
+    '''
+    Rewrites trade_calendar from the calendar, holidays.csv by default, through up_to's year at least.
+    '''
+    if calendar is None:
+        calendar = trade_calendar()
+    if up_to is not None:
+        calendar.ordinal(up_to)
+
+    days = calendar.days
+    with Session(engine) as session:
+        session.execute(delete(TradeDay))
+        session.execute(insert(TradeDay), [{'day': day, 'ordinal': i} for i, day in enumerate(days)])
+        session.commit()
+
+    annotate(rows=len(days))
+    logger.success(f"Trade calendar refreshed, {len(days)} trade days from {days[0]} to {days[-1]}")
+    return len(days)
+
+
+def ensure_trade_calendar(engine: Engine, up_to: date) -> bool:
+    '''
+    Creates or refreshes trade_calendar when it differs from the calendar
+    through up_to's year, e.g. on a new year, after holidays.csv was edited or
+    in a database initialized before the table existed. Whether it was
+    (re)written. Raises when holidays.csv has no rows for up_to's year.
+    '''
+    calendar = trade_calendar()
+    if not calendar.covers(up_to):
+        raise ValueError(f"No holiday data for {up_to.year} in holidays.csv, add its rows to run on {up_to}")
+    calendar.ordinal(up_to)
+    expected = list(enumerate(calendar.days))
+
+    with Session(engine) as session:
+        created = not inspect(session.connection()).has_table(TradeDay.__tablename__)
+        if created:
+            TradeDay.__table__.create(session.connection())
+            session.commit()
+        rows = session.execute(select(TradeDay.ordinal, TradeDay.day).order_by(TradeDay.ordinal)).all()
+
+    if [tuple(row) for row in rows] == expected:
+        return False
+
+    refresh_trade_calendar(engine, up_to=up_to)
+    if engine.dialect.name == 'postgresql':
+        # along with the table, the procedure may predate it or its window rules
+        from app.db.materialized_view import init_db_mv
+        init_db_mv(engine)
+    return True
+
+
+def load_trade_calendar(engine: Engine) -> TradeCalendar:
+    '''
+    The calendar from trade_calendar instead of holidays.csv.
+    '''
+    with Session(engine) as session:
+        days = session.execute(select(TradeDay.day).order_by(TradeDay.day)).scalars().all()
+    if not days:
+        raise ValueError("trade_calendar is empty, run init or a task first")
+    return TradeCalendar.from_trade_days(days)
@@ -0,0 +1,148 @@
+"""
+Write counters per table and trade day, driving cache invalidation.
+
+Every writer of stock_daily, collection_daily and feed_daily (ingest, update,
+feed refresh) bumps the data_version row of each trade day it wrote, in its
+own transaction, so a counter moves exactly when committed data does. A
+derived stage records the versions of the ranges it read as its inputs and
+skips the work while they are unchanged:
+
+    inputs = {'stock_daily': (start_day, trade_day)}
+    if not is_fresh(engine, 'mv_stock_daily', trade_day, inputs):
+        ...rebuild, then bump_version(session, 'mv_stock_daily', [trade_day], snapshot(session, inputs))
+
+The version of a range is the sum of its counters. They only grow, so the sum
+changes with any write to the range, days written for the first time included.
+Upserts that change no row bump nothing, so a rerun on unchanged data skips
+every stage after ingest.
+
+Derived stages version under their own name, e.g. ma_250 under
+stock_daily.ma_250 so that the update does not invalidate its own input.
+"""
+
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from sqlalchemy import and_, func, inspect, or_, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.db.models import BacktestState, DataVersion
+
+
+# table -> (start_day, end_day), inclusive
+Inputs = Dict[str, Tuple[date, date]]
+
+# stock_daily.ma_250 of a trade day, written by the update
+MA_250 = 'stock_daily.ma_250'
+
+Bind = Union[Engine, Connection, Session]
+
+
+@contextmanager
+def _session(bind: Bind) -> Iterator[Session]:
+    if isinstance(bind, Session):
+        yield bind
+    else:
+        with Session(bind) as session:
+            yield session
+
+
+def _insert(dialect_name: str):
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert
+
+
+def bump_version(
+    session: Session,
+    table: str,
+    trade_days: Iterable[date],
+    inputs: Optional[Dict[str, int]] = None,
+) -> None:
+    '''
+    Bumps the counters of the trade days written, in the writer's transaction.
+    inputs, from snapshot, records what a derived table was built from.
+    '''
+    days = sorted(set(trade_days))
+    if not days:
+        return
+
+    insert = _insert(session.get_bind().dialect.name)
+    stmt = insert(DataVersion).values([
+        {'table_name': table, 'trade_day': day, 'version': 1, 'inputs': inputs}
+        for day in days
+    ])
+    set_ = {'version': DataVersion.version + 1, 'last_updated': func.now()}
+    if inputs is not None:
+        set_['inputs'] = stmt.excluded.inputs
+    session.execute(stmt.on_conflict_do_update(index_elements=['table_name', 'trade_day'], set_=set_))
+
+
+def snapshot(bind: Bind, inputs: Inputs) -> Dict[str, int]:
+    '''
+    Version of each input range, 0 for a range never written.
+    '''
+    if not inputs:
+        return {}
+
+    stmt = (
+        select(DataVersion.table_name, func.sum(DataVersion.version))
+        .where(or_(*[
+            and_(DataVersion.table_name == table, DataVersion.trade_day.between(start_day, end_day))
+            for table, (start_day, end_day) in inputs.items()
+        ]))
+        .group_by(DataVersion.table_name)
+    )
+    with _session(bind) as session:
+        versions = {table: int(version) for table, version in session.execute(stmt).all()}
+    return {table: versions.get(table, 0) for table in sorted(inputs)}
+
+
+def recorded_inputs(bind: Bind, table: str, trade_day: date) -> Optional[Dict[str, int]]:
+    '''
+    Versions the table's trade day was last built from, None if never recorded.
+    '''
+    with _session(bind) as session:
+        return session.execute(
+            select(DataVersion.inputs)
+            .where(DataVersion.table_name == table, DataVersion.trade_day == trade_day)
+        ).scalar()
+
+
+def is_fresh(bind: Bind, table: str, trade_day: date, inputs: Inputs) -> Optional[bool]:
+    '''
+    Whether the table's trade day was built from the current versions of its
+    inputs, None if it was built before versions were recorded, or never.
+    '''
+    recorded = recorded_inputs(bind, table, trade_day)
+    if recorded is None:
+        return None
+    return recorded == snapshot(bind, inputs)
+
+
+def ensure_data_version(engine: Engine) -> bool:
+    '''
+    Creates data_version and backtest_state, or backtest_state.data_versions,
+    in a database initialized before they existed. Whether anything was created.
+    '''
+    state = BacktestState.__table__
+
+    with Session(engine) as session:
+        inspector = inspect(session.connection())
+        created = False
+        for table in (DataVersion.__table__, state):
+            if not inspector.has_table(table.name):
+                table.create(session.connection())                                      # type: ignore
+                created = True
+
+        if 'data_versions' not in {c['name'] for c in inspect(session.connection()).get_columns(state.name)}:
+            column_type = state.c.data_versions.type.compile(dialect=session.get_bind().dialect)  # type: ignore
+            session.execute(text(f"ALTER TABLE {state.name} ADD COLUMN data_versions {column_type}"))
+            created = True
+        session.commit()
+
+    return created
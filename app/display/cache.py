@@ -0,0 +1,132 @@
+"""
+Picks to display, read from feed_daily through a small result cache.
+
+The cache is keyed by (trade_day, filter_id, data version), where the data
+version holds the versions of the stock_daily and collection_daily ranges the
+filter reads for that day, see app.db.version. Any write to those rows bumps
+the version, so stale entries are never hit and simply age out. The filter is
+only run when feed_daily was never filtered for the day, or was filtered from
+other versions than the current ones, and its picks are written back through
+refresh_feed_daily_table, so the next process reads them, no picks included.
+"""
+
+from collections import OrderedDict
+from datetime import date
+from typing import Hashable, Optional, Tuple
+
+from loguru import logger
+from pandas import DataFrame
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.db.models import FeedDaily
+from app.db.version import recorded_inputs, snapshot
+from app.filter.misc import StockFilter, get_filter_id
+from app.filter.tail_scraper import filter_inputs
+
+
+class ResultCache:
+    '''
+    Least recently used cache of DataFrames, handing out copies.
+    '''
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, DataFrame] = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[DataFrame]:
+        df = self._entries.get(key)
+        if df is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return df.copy()
+
+    def put(self, key: Hashable, df: DataFrame) -> None:
+        self._entries[key] = df.copy()
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, trade_day: Optional[date] = None) -> None:
+        '''
+        Drops the entries of a trade day, or all of them.
+        '''
+        for key in [k for k in self._entries if trade_day is None or k[0] == trade_day]: # type: ignore
+            del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+display_cache = ResultCache()
+
+
+def data_version(engine: Engine, trade_day: date, materialized: Optional[bool] = True) -> Tuple[Tuple[str, int], ...]:
+    '''
+    Versions of the stock_daily and collection_daily ranges the filter reads for trade_day.
+    '''
+    return tuple(snapshot(engine, filter_inputs(trade_day, materialized)).items())
+
+
+def _read_feed_daily(engine: Engine, trade_day: date, filter_id: int) -> DataFrame:
+    with Session(engine) as session:
+        fds = session.execute(
+            select(FeedDaily)
+            .where(FeedDaily.trade_day == trade_day, FeedDaily.filter_id == filter_id)
+            .order_by(FeedDaily.code)
+        ).scalars().all()
+        return FeedDaily.to_dataframe(list(fds))
+
+
+def feed_for_display(
+    engine: Engine,
+    trade_day: date,
+    filter_id: Optional[int] = None,
+    materialized: Optional[bool] = True,
+    cache: ResultCache = display_cache,
+) -> DataFrame:
+    '''
+    The day's picks of a filter, from the cache, feed_daily or, failing both, the filter.
+    '''
+
+    if filter_id is None:
+        filter_id = get_filter_id(StockFilter.TAIL_SCRAPER)
+
+    version = data_version(engine, trade_day, materialized)
+    key = (trade_day, filter_id, version)
+
+    df = cache.get(key)
+    if df is not None:
+        logger.info(f"Picks of {trade_day} for filter {filter_id} from cache")
+        return df
+
+    df = _read_feed_daily(engine, trade_day, filter_id)
+    built_from = recorded_inputs(engine, FeedDaily.__tablename__, trade_day)
+
+    # feed_daily written before versions were recorded is trusted, if it has picks
+    if built_from is not None:
+        fresh = tuple(sorted(built_from.items())) == version
+    else:
+        fresh = df.shape[0] > 0
+
+    if fresh:
+        logger.info(f"Picks of {trade_day} for filter {filter_id} from feed_daily")
+    else:
+        from app.backtest.feed import refresh_feed_daily_table
+        from app.filter.tail_scraper import filter_desired
+
+        if built_from is not None:
+            logger.warning(f"feed_daily of {trade_day} was filtered from older stock/collection data, filtering again")
+        else:
+            logger.info(f"No picks of {trade_day} in feed_daily, filtering")
+        fds = filter_desired(engine=engine, trade_day=trade_day, materialized=materialized)
+        refresh_feed_daily_table(engine=engine, fds=fds, trade_day=trade_day, materialized=materialized)
+        df = _read_feed_daily(engine, trade_day, filter_id)
+
+    cache.put(key, df)
+    return df
@@ -0,0 +1,199 @@
+"""
+Local fake of the Google Sheets v4 endpoints used for publishing.
+
+Counts requests and adds configurable latency, so that publishing can be
+tested and timed offline. Point the app at it with GOOGLE_SHEETS_ENDPOINT.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import gspread
+import requests
+from gspread.http_client import HTTPClient
+
+
+GOOGLE_SHEETS_BASE_URL = 'https://sheets.googleapis.com'
+
+
+class EndpointHTTPClient(HTTPClient):
+    '''
+    gspread http client sending Sheets API calls to another base url.
+    '''
+
+    base_url: str = GOOGLE_SHEETS_BASE_URL
+
+    def request(self, method, endpoint, *args, **kwargs):
+        if endpoint.startswith(GOOGLE_SHEETS_BASE_URL):
+            endpoint = self.base_url.rstrip('/') + endpoint[len(GOOGLE_SHEETS_BASE_URL):]
+        return super().request(method, endpoint, *args, **kwargs)
+
+
+def client_for_endpoint(base_url: str) -> gspread.Client:
+    http_client = type('BoundEndpointHTTPClient', (EndpointHTTPClient,), {'base_url': base_url})
+    return gspread.Client(auth=None, session=requests.Session(), http_client=http_client) # type: ignore
+
+
+class FakeSpreadsheet:
+    def __init__(self, spreadsheet_id: str):
+        self.id = spreadsheet_id
+        self.sheets: Dict[int, Dict[str, Any]] = {
+            0: {'sheetId': 0, 'title': 'Sheet1', 'index': 0, 'gridProperties': {'rowCount': 1000, 'columnCount': 26}},
+        }
+        self.cells: Dict[int, Dict[tuple, Any]] = {0: {}}
+
+    def metadata(self) -> Dict[str, Any]:
+        return {
+            'spreadsheetId': self.id,
+            'properties': {'title': f'fake-{self.id}', 'locale': 'en_US', 'timeZone': 'Asia/Shanghai'},
+            'sheets': [{'properties': p} for p in self.sheets.values()],
+        }
+
+    def apply(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        (kind, body), = request.items()
+
+        match kind:
+            case 'addSheet':
+                props = dict(body['properties'])
+                sheet_id = props.setdefault('sheetId', max(self.sheets, default=-1) + 1)
+                if sheet_id in self.sheets or any(p['title'] == props['title'] for p in self.sheets.values()):
+                    raise ValueError(f"sheet {props['title']} already exists")
+                props.setdefault('index', len(self.sheets))
+                props.setdefault('gridProperties', {'rowCount': 1000, 'columnCount': 26})
+                self.sheets[sheet_id] = props
+                self.cells[sheet_id] = {}
+                return {'addSheet': {'properties': props}}
+
+            case 'updateSheetProperties':
+                props = body['properties']
+                self.sheets[props['sheetId']]['gridProperties'].update(props.get('gridProperties', {}))
+                return {}
+
+            case 'updateCells':
+                if 'range' in body:
+                    sheet_id = body['range']['sheetId']
+                    if not body.get('rows'):
+                        self.cells[sheet_id].clear()
+                        return {}
+                start = body.get('start', {})
+                sheet_id = start.get('sheetId', body.get('range', {}).get('sheetId'))
+                for r, row in enumerate(body.get('rows', [])):
+                    for c, cell in enumerate(row.get('values', [])):
+                        key = (start.get('rowIndex', 0) + r, start.get('columnIndex', 0) + c)
+                        self.cells[sheet_id].setdefault(key, {}).update(cell)
+                return {}
+
+            case 'repeatCell':
+                rng = body['range']
+                sheet_id = rng['sheetId']
+                grid = self.sheets[sheet_id]['gridProperties']
+                for r in range(rng.get('startRowIndex', 0), rng.get('endRowIndex', grid['rowCount'])):
+                    for c in range(rng.get('startColumnIndex', 0), rng.get('endColumnIndex', grid['columnCount'])):
+                        cell = self.cells[sheet_id].setdefault((r, c), {})
+                        cell.setdefault('userEnteredFormat', {}).update(body['cell'].get('userEnteredFormat', {}))
+                return {}
+
+            case _:
+                raise ValueError(f"request {kind} not supported by the fake")
+
+
+class FakeSheetsServer:
+    '''
+    Serves spreadsheets.get and spreadsheets.batchUpdate on localhost in a background thread.
+    '''
+
+    def __init__(self, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0):
+        self.latency = latency
+        self.requests: Counter = Counter()
+        self.batch_sizes: List[int] = []
+        self.spreadsheets: Dict[str, FakeSpreadsheet] = {}
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, payload: Dict[str, Any]):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _error(self, status: int, message: str):
+                self._reply(status, {'error': {'code': status, 'message': message, 'status': 'FAILED'}})
+
+            def do_GET(self):
+                time.sleep(server.latency)
+                path = urlparse(self.path).path
+                match = re.fullmatch(r'/v4/spreadsheets/([^/:]+)', path)
+                if not match:
+                    return self._error(404, f'unknown path {path}')
+                with server._lock:
+                    server.requests['get'] += 1
+                    self._reply(200, server.spreadsheet(match.group(1)).metadata())
+
+            def do_POST(self):
+                time.sleep(server.latency)
+                path = urlparse(self.path).path
+                match = re.fullmatch(r'/v4/spreadsheets/([^/:]+):batchUpdate', path)
+                if not match:
+                    return self._error(404, f'unknown path {path}')
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                with server._lock:
+                    server.requests['batchUpdate'] += 1
+                    server.batch_sizes.append(len(body.get('requests', [])))
+                    spreadsheet = server.spreadsheet(match.group(1))
+                    try:
+                        replies = [spreadsheet.apply(r) for r in body.get('requests', [])]
+                    except (KeyError, ValueError) as e:
+                        return self._error(400, str(e))
+                    self._reply(200, {'spreadsheetId': spreadsheet.id, 'replies': replies})
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def spreadsheet(self, spreadsheet_id: str) -> FakeSpreadsheet:
+        return self.spreadsheets.setdefault(spreadsheet_id, FakeSpreadsheet(spreadsheet_id))
+
+    def start(self) -> 'FakeSheetsServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        return False
+
+
+if __name__ == '__main__':
+    import sys
+
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.2
+    with FakeSheetsServer(latency=latency, port=8765) as server:
+        print(f"Fake Sheets endpoint at {server.url}, export GOOGLE_SHEETS_ENDPOINT={server.url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            print(dict(server.requests))
@@ -0,0 +1,171 @@
+"""
+Concurrent fan-out of the display stage.
+
+Every sink (Google Sheets, tdx block file, xlsx report) runs on its own daemon
+thread with its own timeout, so a slow or failing sink neither delays nor
+breaks the others. Sinks and timeouts are configured in .env:
+
+    DISPLAY_SINKS=tdx,sheet,report
+    DISPLAY_TIMEOUT_SHEET=120
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from loguru import logger
+from pandas import DataFrame
+from sqlalchemy.engine import Engine
+
+from app.profile.tracer import span
+
+
+load_dotenv(override=True)
+
+
+DEFAULT_SINKS = 'tdx,sheet'
+
+# seconds
+DEFAULT_TIMEOUTS = {
+    'tdx':      30.0,
+    'sheet':    120.0,
+    'report':   60.0,
+}
+
+
+@dataclass
+class Sink:
+    name:       str
+    func:       Callable[[], Any]
+    timeout:    float
+
+
+@dataclass
+class SinkResult:
+    name:       str
+    ok:         bool
+    elapsed:    float
+    timed_out:  bool = False
+    error:      Optional[str] = None
+
+
+def _start(sink: Sink, start: float, elapsed: Dict[str, float]) -> Future:
+    '''
+    Runs the sink on a daemon thread, so a hung sink does not hold the process at exit.
+    '''
+    future: Future = Future()
+    future.set_running_or_notify_cancel()
+
+    def target():
+        try:
+            with span(f"display.sink.{sink.name}", timeout=sink.timeout):
+                result = sink.func()
+            elapsed[sink.name] = time.perf_counter() - start
+            future.set_result(result)
+        except BaseException as e:
+            elapsed[sink.name] = time.perf_counter() - start
+            future.set_exception(e)
+
+    threading.Thread(target=target, name=f"display-{sink.name}", daemon=True).start()
+    return future
+
+
+def run_sinks(sinks: List[Sink]) -> List[SinkResult]:
+    '''
+    Runs all sinks concurrently and waits for each up to its own timeout.
+
+    Failures and timeouts are logged and reported, never raised.
+    '''
+
+    start = time.perf_counter()
+    elapsed: Dict[str, float] = {}
+    futures = [(sink, _start(sink, start, elapsed)) for sink in sinks]
+
+    results = []
+    for sink, future in futures:
+        remaining = max(sink.timeout - (time.perf_counter() - start), 0)
+        try:
+            future.result(timeout=remaining)
+            result = SinkResult(sink.name, ok=True, elapsed=elapsed[sink.name])
+            logger.success(f"Display sink {sink.name:8} done in {result.elapsed:8.3f} s")
+        except TimeoutError:
+            result = SinkResult(sink.name, ok=False, elapsed=time.perf_counter() - start, timed_out=True)
+            logger.error(f"Display sink {sink.name:8} timed out after {sink.timeout} s, left running in background")
+        except BaseException as e:
+            # SystemExit and KeyboardInterrupt of a sink too, the others keep running
+            result = SinkResult(sink.name, ok=False, elapsed=elapsed[sink.name], error=repr(e))
+            logger.error(f"Display sink {sink.name:8} failed in {result.elapsed:8.3f} s: {e!r}")
+        results.append(result)
+
+    return results
+
+
+def sink_timeout(name: str) -> float:
+    return float(os.getenv(f"DISPLAY_TIMEOUT_{name.upper()}", DEFAULT_TIMEOUTS[name]))
+
+
+def _write_report(trade_day: date, df: DataFrame) -> str:
+    from app.display.report import REPORT_PATH, write_report
+
+    if not os.path.exists(REPORT_PATH):
+        os.makedirs(REPORT_PATH)
+    path = f'{REPORT_PATH}/report-{trade_day}.xlsx'
+    write_report([(trade_day, df)], xlsx_path=path)
+    return path
+
+
+def display_sinks(
+    engine: Engine,
+    trade_day: date,
+    df: DataFrame,
+    yes: Optional[bool] = False,
+    names: Optional[List[str]] = None,
+) -> List[Sink]:
+    '''
+    The configured sinks of one day's feed, each on its own copy of df.
+
+    Confirmations are asked before the fan-out, on the calling thread.
+    '''
+
+    if names is None:
+        names = [n.strip() for n in os.getenv('DISPLAY_SINKS', DEFAULT_SINKS).split(',') if n.strip()]
+
+    sinks = []
+    for name in names:
+        match name:
+            case 'tdx':
+                from app.display.tdx import add_to_tdx_path
+                func = lambda df=df.copy(): add_to_tdx_path(engine=engine, df=df, trade_day=trade_day)
+            case 'sheet':
+                from app.display.google_sheet import add_df_to_new_sheet, confirms_overwrite
+                # input() on a sink's thread would block it until its timeout, ask here
+                if df.shape[0] > 0:
+                    try:
+                        confirms_overwrite(trade_day, yes=yes)
+                    except Exception as e:
+                        logger.error(f"Display sink {name:8} skipped, listing the sheets failed: {e!r}")
+                        continue
+                func = lambda df=df.copy(): add_df_to_new_sheet(trade_day=trade_day, df=df, yes=True)
+            case 'report':
+                func = lambda df=df.copy(): _write_report(trade_day, df)
+            case _:
+                logger.error(f"Unknown display sink {name}")
+                continue
+        sinks.append(Sink(name=name, func=func, timeout=sink_timeout(name)))
+
+    return sinks
+
+
+def display_feed(
+    engine: Engine,
+    trade_day: date,
+    df: DataFrame,
+    yes: Optional[bool] = False,
+    names: Optional[List[str]] = None,
+) -> List[SinkResult]:
+    return run_sinks(display_sinks(engine, trade_day, df, yes=yes, names=names))
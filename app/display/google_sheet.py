@@ -1,20 +1,18 @@
 import os
 from datetime import date
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
 import gspread
-from gspread.exceptions import WorksheetNotFound
-from gspread_formatting import CellFormat, TextFormat, format_cell_ranges # type: ignore
+from gspread.exceptions import APIError
 from google.oauth2.service_account import Credentials
 from dotenv import load_dotenv
 from pandas import DataFrame
 from loguru import logger
 
 from app.constant.confirm import confirms_execution
-from app.db.engine import engine_from_env
 from app.db.models import FeedDaily
-from app.display.utils import get_color_for_column
-from app.filter.tail_scraper import filter_desired
+from app.display.utils import color_channels
 from app.profile.tracer import trace_elapsed
 
 
@@ -24,22 +22,183 @@ load_dotenv(override=True)
 scopes = [
     "https://www.googleapis.com/auth/spreadsheets"
 ]
-creds = Credentials.from_service_account_file("credentials.json", scopes=scopes)
-client = gspread.authorize(creds)
-sheet_id = os.getenv("GOOGLE_SHEET_ID")
-if sheet_id is None:
-    raise ValueError("Missing or incorrect GOOGLE_SHEET_ID")
 
 
-def client_from_env():
-    return client
+# created on first use and reused across calls, so importing this module
+# neither reads credentials.json nor touches the network
+_client: Optional[gspread.Client] = None
+_stock_sheet: Optional[gspread.Spreadsheet] = None
+_worksheet_properties: Optional[Dict[str, Dict[str, Any]]] = None
 
 
-def get_stock_sheet():
-    return client.open_by_key(sheet_id)
-    
+def client_from_env() -> gspread.Client:
+    global _client
+    if _client is None:
+        # offline fake, see app.display.fake_sheets
+        sheets_endpoint = os.getenv("GOOGLE_SHEETS_ENDPOINT")
+        if sheets_endpoint:
+            from app.display.fake_sheets import client_for_endpoint
+            _client = client_for_endpoint(sheets_endpoint)
+        else:
+            creds = Credentials.from_service_account_file("credentials.json", scopes=scopes)
+            _client = gspread.authorize(creds)
+    return _client
+
+
+def get_stock_sheet() -> gspread.Spreadsheet:
+    global _stock_sheet
+    if _stock_sheet is None:
+        sheet_id = os.getenv("GOOGLE_SHEET_ID")
+        if sheet_id is None:
+            raise ValueError("Missing or incorrect GOOGLE_SHEET_ID")
+        _stock_sheet = client_from_env().open_by_key(sheet_id)
+    return _stock_sheet
+
+
+def get_worksheet_properties(refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+    '''
+    Title to sheet properties of every worksheet, cached.
+    '''
+    global _worksheet_properties
+    if _worksheet_properties is None or refresh:
+        metadata = get_stock_sheet().fetch_sheet_metadata({
+            'fields': 'sheets.properties(sheetId,title,gridProperties)'
+        })
+        _worksheet_properties = {
+            s['properties']['title']: s['properties'] for s in metadata.get('sheets', [])
+        }
+    return _worksheet_properties
+
+
+def to_rgb(color) -> Tuple[float, float, float]:
+    return (float(color.red), float(color.green), float(color.blue))
+
+
+def merge_channel_runs(channels: Dict[str, np.ndarray], column_index: Dict[str, int]) -> List[Tuple[int, int, int, Tuple[float, float, float]]]:
+    '''
+    Merges vertically adjacent cells of the same color into (column, start_row, end_row, rgb) runs.
+
+    channels holds the (n, 3) RGB array of each column, see app.display.utils.color_channels.
+    Rows are 0-based data rows, end_row is exclusive, white cells are skipped.
+    '''
+
+    runs = []
+    for c, rgb in channels.items():
+        if rgb.shape[0] == 0:
+            continue
+        changed = np.flatnonzero((rgb[1:] != rgb[:-1]).any(axis=1)) + 1
+        starts = np.concatenate(([0], changed))
+        ends = np.concatenate((changed, [rgb.shape[0]]))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            red, green, blue = rgb[start].tolist()
+            if blue != 1.0:
+                runs.append((column_index[c], start, end, (red, green, blue)))
+    return runs
+
+
+def merge_color_runs(color_df: DataFrame, column_index: Dict[str, int]) -> List[Tuple[int, int, int, Tuple[float, float, float]]]:
+    '''
+    merge_channel_runs of a DataFrame of gspread-formatting Color.
+    '''
+    channels = {
+        c: np.array([to_rgb(color) for color in color_df[c]], dtype=float).reshape(-1, 3)
+        for c in color_df.columns
+    }
+    return merge_channel_runs(channels, column_index)
+
+
+def _grid_range(sheet_id_: int, **kwargs) -> Dict[str, int]:
+    return {'sheetId': sheet_id_, **kwargs}
+
+
+def build_publish_requests(
+    worksheet_id: int,
+    title: str,
+    feed_df: DataFrame,
+    color_runs: List[Tuple[int, int, int, Tuple[float, float, float]]],
+    right_align_columns: List[int],
+    existing: Optional[Dict[str, Any]],
+    rows: int,
+    columns: int,
+) -> List[Dict[str, Any]]:
+    '''
+    Every request of publishing one day, sent in a single batchUpdate.
+    '''
+
+    requests: List[Dict[str, Any]] = []
+
+    # sheet
+    if existing is None:
+        requests.append({'addSheet': {'properties': {
+            'sheetId': worksheet_id,
+            'title': title,
+            'gridProperties': {'rowCount': rows, 'columnCount': columns},
+        }}})
+    else:
+        grid = existing.get('gridProperties', {})
+        if grid.get('rowCount', 0) < rows or grid.get('columnCount', 0) < columns:
+            requests.append({'updateSheetProperties': {
+                'properties': {
+                    'sheetId': worksheet_id,
+                    'gridProperties': {
+                        'rowCount': max(rows, grid.get('rowCount', 0)),
+                        'columnCount': max(columns, grid.get('columnCount', 0)),
+                    },
+                },
+                'fields': 'gridProperties(rowCount,columnCount)',
+            }})
+        requests.append({'updateCells': {
+            'range': _grid_range(worksheet_id),
+            'fields': 'userEnteredValue,userEnteredFormat',
+        }})
+
+    # values
+    values = [feed_df.columns.values.tolist()] + feed_df.values.tolist()
+    requests.append({'updateCells': {
+        'start': {'sheetId': worksheet_id, 'rowIndex': 0, 'columnIndex': 0},
+        'rows': [
+            {'values': [{'userEnteredValue': {'stringValue': str(v)}} for v in row]}
+            for row in values
+        ],
+        'fields': 'userEnteredValue',
+    }})
+
+    # formats
+    for column, start, end, (red, green, blue) in color_runs:
+        requests.append({'repeatCell': {
+            'range': _grid_range(
+                worksheet_id,
+                startRowIndex=start + 1,
+                endRowIndex=end + 1,
+                startColumnIndex=column,
+                endColumnIndex=column + 1,
+            ),
+            'cell': {'userEnteredFormat': {'backgroundColor': {'red': red, 'green': green, 'blue': blue}}},
+            'fields': 'userEnteredFormat.backgroundColor',
+        }})
+    for column in right_align_columns:
+        requests.append({'repeatCell': {
+            'range': _grid_range(worksheet_id, startColumnIndex=column, endColumnIndex=column + 1),
+            'cell': {'userEnteredFormat': {'horizontalAlignment': 'RIGHT', 'textFormat': {'bold': True}}},
+            'fields': 'userEnteredFormat(horizontalAlignment,textFormat.bold)',
+        }})
+
+    return requests
+
 
 @trace_elapsed(unit='s')
+def confirms_overwrite(trade_day: date, yes: Optional[bool] = False) -> None:
+    '''
+    Asks before the trade day's existing sheet is overwritten, on the calling
+    thread, so the display fan-out can pass yes=True to its sink.
+    '''
+    if yes:
+        return
+    title = trade_day.isoformat()
+    if title in get_worksheet_properties():
+        confirms_execution(f"Overwriting exsting Sheet {title}")
+
+
 def add_df_to_new_sheet(trade_day: date, df: DataFrame, yes: Optional[bool] = False) -> None:
     title = trade_day.isoformat()
     if df.shape[0] == 0:
@@ -47,64 +206,72 @@ def add_df_to_new_sheet(trade_day: date, df: DataFrame, yes: Optional[bool] = Fa
         return
     assert len(FeedDaily.feed_column_mapping().keys()) <= 26
 
-
-    def idx_to_alpha(idx: int):
-        return chr(idx + 65)
-    
     feed_column_map = FeedDaily.feed_column_mapping()
-    color_df = df[FeedDaily.colorize_columns()].apply(get_color_for_column)
-    color_formats = [
-        (
-            c, idx, CellFormat(backgroundColor=color)
-        ) for c in color_df.columns for idx, color in enumerate(color_df[c]) if color.blue != 1.0
-    ]
-    feed_df = FeedDaily.convert_to_feed(df)
-    alpha_map = {c: idx_to_alpha(idx) for idx, c in enumerate(feed_column_map.keys())}
+    column_index = {c: idx for idx, c in enumerate(feed_column_map.keys())}
+    color_runs = merge_channel_runs(
+        {c: color_channels(df[c]) for c in FeedDaily.colorize_columns()},
+        column_index,
+    )
+    feed_df = FeedDaily.convert_to_feed(df).map(str)
 
     #
     # make sheet
     rows = max((feed_df.shape[0] + 1) * 2, 50)
     columns = feed_df.shape[1] + 10
-    
+
     logger.info(f"Creating/updating sheet {title} of {rows} rows and {columns} columns")
-    try:
-        sheet = get_stock_sheet()
-        worksheet = sheet.worksheet(title)
-        confirms_execution(f"Overwriting exsting Sheet {title}", yes=yes)
-        worksheet.clear()
+    sheet = get_stock_sheet()
 
-    except WorksheetNotFound:
-        worksheet = sheet.add_worksheet(title=title, rows=rows, cols=columns)
+    for attempt in range(2):
+        worksheets = get_worksheet_properties(refresh=attempt > 0)
+        existing = worksheets.get(title)
+        if existing is not None:
+            confirms_execution(f"Overwriting exsting Sheet {title}", yes=yes)
+            worksheet_id = existing['sheetId']
+        else:
+            taken = {p['sheetId'] for p in worksheets.values()}
+            worksheet_id = int(trade_day.strftime('%Y%m%d'))
+            while worksheet_id in taken:
+                worksheet_id += 1
 
-    #
-    # fill sheet
-    feed_df = feed_df.map(str)
-    worksheet.update([feed_df.columns.values.tolist()] + feed_df.values.tolist()) # type: ignore
+        requests = build_publish_requests(
+            worksheet_id=worksheet_id,
+            title=title,
+            feed_df=feed_df,
+            color_runs=color_runs,
+            right_align_columns=[column_index[c] for c in FeedDaily.right_align_columns()],
+            existing=existing,
+            rows=rows,
+            columns=columns,
+        )
 
-    #
-    # format sheet
-    format_cell_ranges(worksheet, [
-        (
-            f"{alpha_map[c]}{row_number+2}",
-            format_
-        ) for c, row_number, format_ in color_formats
-    ] + [
-        (
-            alpha_map[c], 
-            CellFormat(
-                horizontalAlignment='RIGHT',
-                textFormat=TextFormat(
-                    bold=True
-                )
-            )
-        ) for c in FeedDaily.right_align_columns()
-    ])    
-    logger.success(f"Google sheet updated for {title}")
+        #
+        # fill and format sheet in one round trip
+        try:
+            sheet.batch_update({'requests': requests})
+            break
+        except APIError as e:
+            # sheets changed outside of this process since they were cached
+            if attempt > 0:
+                raise
+            logger.warning(f"Sheet batch update failed, retrying with fresh metadata: {e}")
+
+    worksheets[title] = {
+        'sheetId': worksheet_id,
+        'title': title,
+        'gridProperties': {
+            'rowCount': max(rows, (existing or {}).get('gridProperties', {}).get('rowCount', 0)),
+            'columnCount': max(columns, (existing or {}).get('gridProperties', {}).get('columnCount', 0)),
+        },
+    }
+    logger.success(f"Google sheet updated for {title} with {len(requests)} requests in one batch")
 
 
 if __name__ == "__main__":
     from app.constant.schedule import previous_trade_day
-    
+    from app.db.engine import engine_from_env
+    from app.filter.tail_scraper import filter_desired
+
     trade_day = previous_trade_day(date(2025, 2, 24))
     fds = filter_desired(engine_from_env(), trade_day)
     df = FeedDaily.to_dataframe(fds)
@@ -0,0 +1,197 @@
+"""
+Streaming report writer.
+
+Writes feed_daily picks into XLSX, one sheet per trade day, with the same
+coloring and alignment rules as the Google Sheet, and into Parquet, one row
+group per trade day, for archival. Days are added one at a time and the XLSX
+is written in constant-memory mode, so multi-day reports never hold more than
+one day in memory.
+"""
+
+import os
+from datetime import date
+from decimal import Decimal
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+from loguru import logger
+from pandas import DataFrame
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.db.archive import arrow_schema
+from app.db.models import FeedDaily
+from app.display.utils import color_channels
+from app.profile.tracer import trace_elapsed
+
+
+REPORT_PATH = 'reports'
+
+
+def _to_decimal(value, scale: int) -> Optional[Decimal]:
+    if value is None or value != value:
+        return None
+    return Decimal(str(value)).quantize(Decimal(1).scaleb(-scale))
+
+
+def to_hex(rgb: np.ndarray) -> np.ndarray:
+    '''
+    '#RRGGBB' of each row of a (n, 3) array of 0-1 channels.
+    '''
+    ints = np.rint(rgb * 255).astype(int).tolist()
+    return np.array(['#%02X%02X%02X' % tuple(c) for c in ints], dtype=object)
+
+
+class ReportWriter:
+    '''
+    Adds one trade day at a time to an XLSX and/or a Parquet report.
+
+        with ReportWriter('reports/r.xlsx', 'reports/r.parquet') as writer:
+            for trade_day, df in iter_feed_days(engine, start, end):
+                writer.add_day(trade_day, df)
+    '''
+
+    def __init__(self, xlsx_path: Optional[str] = None, parquet_path: Optional[str] = None):
+        self.xlsx_path = xlsx_path
+        self.parquet_path = parquet_path
+        self.days = 0
+        self.rows = 0
+
+        self._workbook = xlsxwriter.Workbook(xlsx_path, {'constant_memory': True}) if xlsx_path else None
+        self._formats: Dict[Tuple[Optional[str], bool], object] = {}
+        # fixed so every day's row group matches
+        self._schema = arrow_schema(FeedDaily.__table__)                  # type: ignore
+        self._parquet: Optional[pq.ParquetWriter] = None
+        if parquet_path:
+            self._parquet = pq.ParquetWriter(parquet_path, self._schema, compression='zstd')
+
+    def _format(self, bg_color: Optional[str], right_align: bool):
+        '''
+        Shared cell format, a workbook only holds a limited number of them.
+        '''
+        assert self._workbook is not None
+        key = (bg_color, right_align)
+        if key not in self._formats:
+            properties = {}
+            if bg_color is not None:
+                properties.update({'bg_color': bg_color, 'pattern': 1})
+            if right_align:
+                properties.update({'align': 'right', 'bold': True})
+            self._formats[key] = self._workbook.add_format(properties) if properties else None
+        return self._formats[key]
+
+    def _add_sheet(self, trade_day: date, df: DataFrame) -> None:
+        assert self._workbook is not None
+        column_mapping = FeedDaily.feed_column_mapping()
+        columns = list(column_mapping.keys())
+        right_align = set(FeedDaily.right_align_columns())
+
+        # colors come from the raw values, as on the Google Sheet
+        colors = {c: to_hex(color_channels(df[c])) for c in FeedDaily.colorize_columns()}
+        white = '#FFFFFF'
+        values = FeedDaily.convert_to_feed(df.copy()).map(str).to_numpy()
+
+        worksheet = self._workbook.add_worksheet(trade_day.isoformat())
+        for col, (c, title) in enumerate(column_mapping.items()):
+            worksheet.write_string(0, col, title, self._format(None, c in right_align))
+
+        # constant-memory mode flushes each row once the next one starts
+        for row in range(values.shape[0]):
+            for col, c in enumerate(columns):
+                bg_color = colors[c][row] if c in colors else None
+                cell_format = self._format(None if bg_color == white else bg_color, c in right_align)
+                worksheet.write_string(row + 1, col, values[row, col], cell_format)
+
+    def _add_row_group(self, df: DataFrame) -> None:
+        assert self._parquet is not None
+        data = {}
+        for field in self._schema:
+            column = df[field.name] if field.name in df.columns else [None] * df.shape[0]
+            if pa.types.is_decimal(field.type):
+                column = [_to_decimal(v, field.type.scale) for v in column]
+            data[field.name] = pa.array(column, type=field.type, from_pandas=True)
+        self._parquet.write_table(pa.table(data, schema=self._schema))
+
+    def add_day(self, trade_day: date, df: DataFrame) -> None:
+        if self._workbook is not None:
+            self._add_sheet(trade_day, df)
+        if self._parquet is not None:
+            self._add_row_group(df)
+        self.days += 1
+        self.rows += df.shape[0]
+
+    def close(self) -> None:
+        if self._workbook is not None:
+            self._workbook.close()
+        if self._parquet is not None:
+            self._parquet.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+def iter_feed_days(engine: Engine, start_day: date, end_day: date, batch_size: int = 1000) -> Iterator[Tuple[date, DataFrame]]:
+    '''
+    (trade_day, picks) of each day between start_day and end_day from one streamed query.
+    '''
+    with Session(engine) as session:
+        fds = session.execute(
+            select(FeedDaily)
+            .where(FeedDaily.trade_day.between(start_day, end_day))
+            .order_by(FeedDaily.trade_day, FeedDaily.filter_id, FeedDaily.code)
+            .execution_options(yield_per=batch_size)
+        ).scalars()
+
+        for trade_day, day_fds in groupby(fds, key=lambda fd: fd.trade_day):
+            df = FeedDaily.to_dataframe(list(day_fds))
+            # do not keep every loaded day in the identity map
+            session.expunge_all()
+            yield trade_day, df # type: ignore
+
+
+def write_report(
+    days: Iterable[Tuple[date, DataFrame]],
+    xlsx_path: Optional[str] = None,
+    parquet_path: Optional[str] = None,
+) -> ReportWriter:
+    with ReportWriter(xlsx_path, parquet_path) as writer:
+        for trade_day, df in days:
+            writer.add_day(trade_day, df)
+    return writer
+
+
+@trace_elapsed(unit='s')
+def report_from_db(
+    engine: Engine,
+    start_day: date,
+    end_day: date,
+    report_path: str = REPORT_PATH,
+    xlsx: bool = True,
+    parquet: bool = True,
+) -> Tuple[Optional[str], Optional[str]]:
+    if not os.path.exists(report_path):
+        os.makedirs(report_path)
+
+    name = f"report-{start_day}" if start_day == end_day else f"report-{start_day}-{end_day}"
+    xlsx_path = os.path.join(report_path, f"{name}.xlsx") if xlsx else None
+    parquet_path = os.path.join(report_path, f"{name}.parquet") if parquet else None
+
+    writer = write_report(iter_feed_days(engine, start_day, end_day), xlsx_path, parquet_path)
+
+    logger.success(f"Report of {writer.days} days and {writer.rows} picks wrote to {xlsx_path or ''} {parquet_path or ''}")
+    return xlsx_path, parquet_path
+
+
+if __name__ == '__main__':
+    from app.db.engine import engine_from_env
+
+    report_from_db(engine_from_env(), date(2025, 3, 3), date(2025, 3, 10))
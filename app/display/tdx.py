@@ -1,12 +1,12 @@
 from datetime import date
 import os
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Tuple
 
 from dotenv import load_dotenv
 from loguru import logger
-from pandas import DataFrame
-from sqlalchemy import distinct, select
+from pandas import DataFrame, Series, concat, read_csv
+from sqlalchemy import select
 from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
 
@@ -23,47 +23,188 @@ load_dotenv(override=True)
 
 
 TDX_PATH = Path(f"{os.environ.get('TDX_PATH', os.getcwd())}")
+TDX_ROLLING_DAYS = int(os.environ.get('TDX_ROLLING_DAYS', 5))
+
+
+MARKET_NUMBER = {
+    SEX_SHENZHEN:   '0',
+    SEX_SHANGHAI:   '1',
+    SEX_BEIJING:    '2',
+}
+
+
+# code -> market name_short of every stock, loaded once per process
+_code_market: Optional[Series] = None
 
 
 def prefix_market_number(code: str, market_name_short: str) -> str:
-    if market_name_short == SEX_SHENZHEN:
-        return f"0{code}"
-    elif market_name_short == SEX_SHANGHAI:
-        return f"1{code}"
-    elif market_name_short == SEX_BEIJING:
-        return f"2{code}"
+    if market_name_short in MARKET_NUMBER:
+        return f"{MARKET_NUMBER[market_name_short]}{code}"
     else:
         logger.error(f"market {market_name_short} not supported")
         return code
 
 
-def add_to_tdx_path(engine: Engine, df: Optional[DataFrame] = None, trade_day: Optional[date] = None) -> None:
-    if trade_day is None:
-        trade_day = previous_trade_day(date.today())
+def code_market_map(engine: Engine, refresh: bool = False) -> Series:
+    '''
+    Market name_short of every stock indexed by code, cached.
+    '''
+    global _code_market
+    if _code_market is None or refresh:
+        with Session(engine) as session:
+            rows = session.execute(
+                select(Stock.code, Market.name_short).join(Market, Stock.market_id == Market.id)
+            ).all()
+        _code_market = Series(
+            [r.name_short for r in rows],
+            index=[r.code for r in rows],
+            dtype=object,
+        )
+        logger.debug(f"Cached market of {_code_market.shape[0]} stocks")
+    return _code_market
+
+
+def prefix_market_numbers(codes: Series, markets: Series) -> Series:
+    '''
+    Vectorized prefix_market_number.
+    '''
+    numbers = markets.map(MARKET_NUMBER)
+    unsupported = numbers.isna()
+    if unsupported.any():
+        logger.error(f"market {sorted(set(markets[unsupported].astype(str)))} not supported for {unsupported.sum()} stocks")
+    return (numbers.fillna('') + codes).where(~unsupported, codes)
+
+
+def to_block_frame(engine: Engine, df: DataFrame) -> DataFrame:
+    '''
+    Prefixed code and name of each distinct code in df, in order.
 
-    p = Path.joinpath(TDX_PATH, f"tdx-stock-{trade_day}.blk")
+    Uses the name_short column if df has one, the cached code to market map otherwise.
+    '''
+    df = df.drop_duplicates('code')
+    markets = df['name_short'] if 'name_short' in df.columns else df['code'].map(code_market_map(engine))
+    return DataFrame({
+        'code': prefix_market_numbers(df['code'], markets).to_numpy(),
+        'name': df['name'].to_numpy(),
+    })
 
+
+def block_path(trade_day: date) -> Path:
+    return Path.joinpath(TDX_PATH, f"tdx-stock-{trade_day}.blk")
+
+
+def rolling_block_path(days: int) -> Path:
+    return Path.joinpath(TDX_PATH, f"tdx-stock-last{days}.blk")
+
+
+def _load_picks(engine: Engine, start_day: date, end_day: date) -> DataFrame:
     with Session(engine) as session:
-        if df is None:
-            market_query = select(
-                distinct(Stock.code).label('code'), Stock.name, Market.name_short
-            ).join(
-                Market, Stock.market_id == Market.id
-            ).join(
-                FeedDaily, (Stock.code == FeedDaily.code)
-            ).where(
-                FeedDaily.trade_day == trade_day
-            )
-
-            result = session.execute(market_query)
-            df = DataFrame(result.all(), columns=result.keys()) # type: ignore
-
-        df.loc[:, 'code'] = df.apply(
-            lambda x: prefix_market_number(x['code'], x['name_short']), axis=1
+        result = session.execute(
+            select(FeedDaily.trade_day, FeedDaily.code, FeedDaily.name)
+            .where(FeedDaily.trade_day.between(start_day, end_day))
+            .order_by(FeedDaily.trade_day, FeedDaily.code)
         )
-        df = df[['code', 'name']]
-        df.to_csv(p, index=False, header=False)
-        logger.success(f"Tdx format file of {trade_day.isoformat()} wrote to {p}")
+        return DataFrame(result.all(), columns=list(result.keys()))
+
+
+def _read_rolling_index(path: Path) -> List[Tuple[date, int]]:
+    '''
+    (trade day, line count) of each day in a rolling block, oldest first.
+    '''
+    index_path = path.with_suffix('.days')
+    if not index_path.exists() or not path.exists():
+        return []
+    with open(index_path) as f:
+        return [(date.fromisoformat(d), int(n)) for d, n in (line.split() for line in f if line.strip())]
+
+
+def _read_block(path: Path) -> DataFrame:
+    if not path.exists() or path.stat().st_size == 0:
+        return DataFrame(columns=['code', 'name'])
+    return read_csv(path, header=None, names=['code', 'name'], dtype=str)
+
+
+def update_rolling_block(trade_day: date, block: DataFrame, days: int = TDX_ROLLING_DAYS) -> Optional[Path]:
+    '''
+    Rewrites the combined block of the last N trade days with one day's block,
+    each code once, at the latest day it was picked.
+
+    The days in the window are kept next to it in a .days file and their
+    lines read back from each day's block file, so no query is needed; the
+    few hundred lines are rewritten whole. Rerunning the last day replaces
+    it, earlier days are ignored.
+    '''
+    if days <= 0:
+        return None
+
+    path = rolling_block_path(days)
+    index = _read_rolling_index(path)
+
+    if index and trade_day < index[-1][0]:
+        logger.warning(f"Rolling block {path} already at {index[-1][0]}, skipping {trade_day}")
+        return path
+
+    index = ([(d, n) for d, n in index if d != trade_day] + [(trade_day, block.shape[0])])[-days:]
+
+    frames = []
+    for d, _ in index[:-1]:
+        if not block_path(d).exists():
+            logger.warning(f"Block of {d} missing from {TDX_PATH}, left out of {path}")
+        frames.append(_read_block(block_path(d)))
+    frames.append(block)
+    concat(frames, ignore_index=True).drop_duplicates('code', keep='last').to_csv(path, index=False, header=False)
+
+    with open(path.with_suffix('.days'), 'w') as f:
+        f.writelines(f"{d.isoformat()} {n}\n" for d, n in index)
+
+    logger.info(f"Rolling block of last {days} days {path} at {trade_day}")
+    return path
+
+
+def add_to_tdx_path(
+    engine: Engine,
+    df: Optional[DataFrame] = None,
+    trade_day: Optional[date] = None,
+    rolling_days: int = TDX_ROLLING_DAYS,
+) -> None:
+    if trade_day is None:
+        trade_day = previous_trade_day(date.today())
+
+    if df is None:
+        df = _load_picks(engine, trade_day, trade_day)
+
+    p = block_path(trade_day)
+    block = to_block_frame(engine, df)
+    block.to_csv(p, index=False, header=False)
+    update_rolling_block(trade_day, block, rolling_days)
+    logger.success(f"Tdx format file of {trade_day.isoformat()} wrote to {p}")
+
+
+def export_tdx_range(
+    engine: Engine,
+    start_day: date,
+    end_day: date,
+    rolling_days: int = TDX_ROLLING_DAYS,
+) -> List[Path]:
+    '''
+    Writes the block of every trade day in [start_day, end_day] from one query.
+    '''
+
+    picks = _load_picks(engine, start_day, end_day)
+    if picks.shape[0] == 0:
+        logger.warning(f"No picks in feed_daily between {start_day} and {end_day}")
+        return []
+
+    paths = []
+    for trade_day, df in picks.groupby('trade_day', sort=True):
+        p = block_path(trade_day) # type: ignore
+        block = to_block_frame(engine, df)
+        block.to_csv(p, index=False, header=False)
+        update_rolling_block(trade_day, block, rolling_days) # type: ignore
+        paths.append(p)
+
+    logger.success(f"Tdx format files of {len(paths)} days between {start_day} and {end_day} wrote to {TDX_PATH}")
+    return paths
 
 
 if __name__ == '__main__':
@@ -71,8 +212,8 @@ if __name__ == '__main__':
 
     engine = engine_from_env()
     trade_day = date(2025, 2, 20)
-    
+
     # df = filter_desired(engine, trade_day, dryrun=True)
     # add_to_tdx_path(engine, df=df, trade_day=trade_day)
-    
-    add_to_tdx_path(engine, trade_day=trade_day)
\ No newline at end of file
+
+    add_to_tdx_path(engine, trade_day=trade_day)
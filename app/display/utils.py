@@ -1,9 +1,7 @@
 import re
-from math import log10
-from typing import Optional
 
+import numpy as np
 from pandas import Series
-from gspread_formatting import Color # type: ignore
 
 
 def ten_thousand_format(num):
@@ -33,6 +31,102 @@ def ten_thousand_format(num):
     return formatted
 
 
+def group_digits(digits: np.ndarray) -> np.ndarray:
+    """
+    Vectorized comma insertion every 4 digits from the right, on an array of
+    digit-only strings. Digits are laid out as a right-aligned character matrix
+    so that every comma column is set at once.
+    """
+    if digits.size == 0:
+        return digits.astype(str)
+
+    width = int(np.char.str_len(digits).max())
+    groups = (width - 1) // 4
+    chars = np.char.rjust(digits, width).astype(f'<U{width}').view('<U1').reshape(-1, width)
+
+    out = np.full((chars.shape[0], width + groups), ' ', dtype='<U1')
+    k = np.arange(width)[::-1]                  # position of each digit column from the right
+    out[:, (width + groups - 1) - (k + k // 4)] = chars
+    for g in range(1, groups + 1):
+        # comma left of the g-th group, only if a digit follows it on the left
+        out[:, (width + groups - 1) - (5 * g - 1)] = np.where(chars[:, width - 1 - 4 * g] != ' ', ',', ' ')
+
+    return np.char.lstrip(out.view(f'<U{width + groups}').reshape(-1))
+
+
+def ten_thousand_format_series(series: Series) -> Series:
+    """
+    Same as ten_thousand_format applied to every value, done in bulk.
+
+    Integer columns are grouped with NumPy string ops, anything else (floats,
+    Decimal, missing values) goes through pandas string methods on str(value).
+    """
+
+    values = series.to_numpy()
+    if values.dtype.kind in 'iu':
+        grouped = group_digits(np.abs(values).astype(str))
+        formatted = np.where(values < 0, np.char.add('-', grouped), grouped)
+        return Series(formatted, index=series.index, dtype=object)
+
+    parts = series.map(str).astype(str).str.extract(r'^(-?)([^.]*)(.*)$')
+    integer = parts[1].str.replace(r'(?<=\d)(?=(\d{4})+$)', ',', regex=True)
+    return (parts[0] + integer + parts[2]).astype(object)
+
+
+def fixed_format_series(series: Series, decimals: int = 2, suffix: str = '') -> Series:
+    """
+    Same as format(value, f'.{decimals}f') + suffix for every value, done in bulk.
+
+    Decimal columns (Numeric in db) are formatted one by one, as their rounding
+    differs from the binary float they would be converted to.
+    """
+
+    spec = f'.{decimals}f'
+    values = series.to_numpy()
+    if values.dtype.kind in 'fiu':
+        formatted = np.char.mod(f'%{spec}', values.astype(float))
+    else:
+        formatted = np.array([format(v, spec) for v in values], dtype=str)
+    if suffix:
+        formatted = np.char.add(formatted, suffix)
+    return Series(formatted, index=series.index, dtype=object)
+
+
+def color_channels(series_: Series) -> np.ndarray:
+    """
+    RGB channels of every value as a (n, 3) array, see get_color_for_column.
+    """
+
+    series = series_.map(float)
+    values = series.to_numpy(dtype=float)
+
+    min_val = series.min()
+    max_val = series.max()
+
+    positive = values > 0
+    negative = values < 0
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = np.zeros(values.shape[0])
+        if max_val != min_val:
+            fraction = np.where(positive, (values - min_val) / (max_val - min_val), fraction)
+        if min_val != 0:
+            fraction = np.where(negative, (0 - values) / (0 - min_val), fraction)
+        fraction = np.where(positive | negative, fraction, 0.0)
+
+    assert ((-1 <= fraction) & (fraction <= 1)).all()
+    shade = np.round(1.0 - np.log10(np.abs(fraction) * 2 + 1), 3)
+
+    # at or below the threshold of 0 stays white
+    colored = fraction > 0
+    channels = np.ones((values.shape[0], 3))
+    channels[colored & positive, 1] = shade[colored & positive]
+    channels[colored & positive, 2] = shade[colored & positive]
+    channels[colored & negative, 0] = shade[colored & negative]
+    channels[colored & negative, 2] = shade[colored & negative]
+    return channels
+
+
 def get_color_for_column(series_: Series) -> Series:
     """
     Return a gspread-formatting Color based on the value.
@@ -48,47 +142,13 @@ def get_color_for_column(series_: Series) -> Series:
     Zero (or near zero) will return white (1,1,1).
     """
 
-    series = series_.map(float)
-
-    min_val = series.min()
-    max_val = series.max()
+    # gspread_formatting is heavy and models import this module
+    from gspread_formatting import Color # type: ignore
 
-    def adjust(num: float):
-        assert -1 <= num and num <= 1
-        return log10(abs(num) * 2 + 1)
-
-    def colorize(
-        value: float,
-        cap: Optional[int] = 1,
-        threshold: Optional[float] = 0,
-    ) -> Color:
-        threshold = threshold or 0
-        base = 1.0
-        if value > 0:
-            fraction = (value - min_val) / (max_val - min_val) if max_val != min_val else 0
-            if fraction <= threshold:
-                return Color(red=1.0, green=1.0, blue=1.0)
-
-            red = 1.0
-            green = round(base - adjust(fraction * base) * cap, 3)
-            blue = round(base - adjust(fraction * base) * cap, 3)
-
-            return Color(red=red, green=green, blue=blue)
-        elif value < 0:
-            fraction = (0 - value) / (0 - min_val) if min_val != 0 else 0
-
-            if fraction <= threshold:
-                return Color(red=1.0, green=1.0, blue=1.0)
-
-            green = 1.0
-            red = round(base - adjust(fraction * base) * cap, 3)
-            blue = round(base - adjust(fraction * base) * cap, 3)
-            
-            return Color(red=red, green=green, blue=blue)
-        else:
-            return Color(red=1.0, green=1.0, blue=1.0)
-    
-    return Series([colorize(value) for value in series])
+    return Series([
+        Color(red=red, green=green, blue=blue)
+        for red, green, blue in color_channels(series_).tolist()
+    ])
 
 
 if __name__ == '__main__':
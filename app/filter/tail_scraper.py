@@ -8,8 +8,10 @@ from sqlalchemy.sql import lateral, Select
 from sqlalchemy.engine import Engine
 from loguru import logger
 
-from app.constant.schedule import previous_trade_day
+from app.constant.schedule import previous_trade_day, trade_calendar
+from app.db.trade_calendar import window_start
 from app.db.materialized_view import get_mv_stock_daily_name, check_mv_exists
+from app.db.version import MA_250, Inputs
 from app.db.models import (
     MetadataBase,
     RelationCollectionStock,
@@ -20,7 +22,21 @@ from app.db.models import (
     FeedDaily,
 )
 from app.filter.misc import StockFilter, get_filter_id
-from app.profile.tracer import trace_elapsed
+from app.profile.tracer import annotate, trace_elapsed
+
+
+def filter_inputs(trade_day: date, materialized: Optional[bool] = True) -> Inputs:
+    """
+    Ranges the filter reads, see app.db.version: the 5 day volume window of
+    stock_daily, the day's ma_250 and collection_daily. Materialized, it reads
+    the previous day's view, built from its 250 day window of stock_daily.
+    """
+    window = 250 if materialized else 4
+    return {
+        StockDaily.__tablename__: (trade_calendar().offset(trade_day, -window), trade_day),
+        MA_250: (trade_day, trade_day),
+        CollectionDaily.__tablename__: (trade_day, trade_day),
+    }
 
 
 def build_stmt_postgresql_lateral(trade_day: date) -> Select:
@@ -73,15 +89,16 @@ def build_stmt_postgresql_lateral(trade_day: date) -> Select:
         .cte("static_filtering")
     )
 
+    # windows bounded by trade_calendar, as the materialized view of the previous day
+    previous_day = window_start(trade_day, 2)
+
     prev_subq = lateral(
         select(sd.c.close)
         .where(
             sd.c.code == static_filtering_cte.c.code,
-            sd.c.trade_day < static_filtering_cte.c.trade_day,
+            sd.c.trade_day == previous_day,
         )
         .correlate(static_filtering_cte)
-        .order_by(sd.c.trade_day.desc())
-        .limit(1)
     )
 
     prev_volume_innermost = (
@@ -89,12 +106,10 @@ def build_stmt_postgresql_lateral(trade_day: date) -> Select:
         .where(
             and_(
                 sd.c.code == static_filtering_cte.c.code,
-                sd.c.trade_day <= static_filtering_cte.c.trade_day,
+                sd.c.trade_day.between(window_start(trade_day, 5), trade_day),
             )
         )
-        .order_by(sd.c.trade_day.desc())
         .correlate(static_filtering_cte)
-        .limit(5)
     ).subquery()
 
     prev_volume_avg_expr = select(
@@ -105,11 +120,9 @@ def build_stmt_postgresql_lateral(trade_day: date) -> Select:
         select(sd.c.volume)
         .where(
             sd.c.code == static_filtering_cte.c.code,
-            sd.c.trade_day < static_filtering_cte.c.trade_day,
+            sd.c.trade_day == previous_day,
         )
-        .order_by(sd.c.trade_day.desc())
         .correlate(static_filtering_cte)
-        .limit(1)
     ).scalar_subquery()
 
     prev_volume_subq = lateral(
@@ -172,6 +185,10 @@ def build_stmt_postgresql_mv(mv_stock_daily: Table, trade_day: date) -> Select:
     c = Collection.__table__.alias("c")
     cd = CollectionDaily.__table__.alias("cd")
 
+    # the view holds the sums and counts of the days both windows keep, so trade_day's averages are exact
+    ma250 = (prev.c.close_sum + sd.c.close) / (prev.c.close_count + 1)
+    ma5_volume = (func.coalesce(prev.c.volume_sum, 0) + sd.c.volume.cast(Double)) / (prev.c.volume_count + 1)
+
     stmt = (
         select(
             sd.c.trade_day,
@@ -179,11 +196,9 @@ def build_stmt_postgresql_mv(mv_stock_daily: Table, trade_day: date) -> Select:
             s.c.name,
             c.c.name.label("collection_name"),
             cd.c.change_rate.label("collection_performance"),
-            # (prev.c.ma250 + (sd.c.close - prev.c.prev_250_close) / 250).label("ma_250"),
             prev.c.close.label("previous_close"),
             sd.c.close.label("close"),
             (100 * (sd.c.close / prev.c.close - 1)).label("gain"),
-            # (prev.c.ma5_volume + (sd.c.volume - prev.c.prev_5_volume) / 5).label("ma5_volume"),
             prev.c.volume.label("previous_volume"),
             sd.c.volume.label("volume"),
             (100 * (sd.c.volume.cast(Double) / prev.c.volume.cast(Double) - 1)).label("volume_gain"),
@@ -210,16 +225,15 @@ def build_stmt_postgresql_mv(mv_stock_daily: Table, trade_day: date) -> Select:
             sd.c.circulation_capital.between(2_0000_0000, 200_0000_0000),
 
             # T5
-            prev.c.volume
-            < prev.c.ma5_volume + (sd.c.volume - prev.c.prev_5_volume) / 5,
-            sd.c.volume > prev.c.ma5_volume + (sd.c.volume - prev.c.prev_5_volume) / 5,
+            prev.c.volume < ma5_volume,
+            sd.c.volume > ma5_volume,
 
             # T6
             ~s.c.name.like("%ST%"),
             ~s.c.name.like("%*%"),
 
             # T7
-            sd.c.low > prev.c.ma250 + (sd.c.close - prev.c.prev_250_close) / 250,
+            sd.c.low > ma250,
 
             # T8
             sd.c.close > sd.c.open,
@@ -232,25 +246,130 @@ def build_stmt_postgresql_mv(mv_stock_daily: Table, trade_day: date) -> Select:
     return stmt
 
 
-def build_stmt_postgresql(engine: Engine, trade_day: date, materialized: Optional[bool] = True) -> Select:
-    if materialized and check_mv_exists(engine, trade_day, previous=True):
-        mv_stock_daily = Table(get_mv_stock_daily_name(), MetadataBase.metadata, autoload_with=engine)
-        logger.debug("Filter using materialized view")
-        return build_stmt_postgresql_mv(mv_stock_daily, trade_day)
-    else:
-        logger.debug("Filter using lateral join")
-        return build_stmt_postgresql_lateral(trade_day)
+def build_stmt_duckdb(trade_day: date) -> Select:
+    """
+    The conditions of the materialized view statement on plain joins, with
+    ma_250 from stock_daily and the 5 day volume window grouped in one pass,
+    which DuckDB runs as vectorized hash joins and aggregates.
+    """
+
+    sd = StockDaily.__table__.alias("sd")
+    prev = StockDaily.__table__.alias("prev")
+    s = Stock.__table__.alias("s")
+    rcs = RelationCollectionStock.__table__.alias("rcs")
+    c = Collection.__table__.alias("c")
+    cd = CollectionDaily.__table__.alias("cd")
+    window = StockDaily.__table__.alias("window")
+
+    volume_subq = (
+        select(
+            window.c.code,
+            func.avg(window.c.volume.cast(Double)).label("ma5_volume"),
+        )
+        .where(window.c.trade_day.between(window_start(trade_day, 5), trade_day))
+        .group_by(window.c.code)
+    ).subquery("volume_window")
+
+    stmt = (
+        select(
+            sd.c.trade_day,
+            sd.c.code,
+            s.c.name,
+            c.c.name.label("collection_name"),
+            cd.c.change_rate.label("collection_performance"),
+            prev.c.close.label("previous_close"),
+            sd.c.close.label("close"),
+            (100 * (sd.c.close / prev.c.close - 1)).label("gain"),
+            prev.c.volume.label("previous_volume"),
+            sd.c.volume.label("volume"),
+            (100 * (sd.c.volume.cast(Double) / prev.c.volume.cast(Double) - 1)).label("volume_gain"),
+        )
+        .select_from(sd)
+        .join(prev, (prev.c.code == sd.c.code) & (prev.c.trade_day == window_start(trade_day, 2)))
+        .join(volume_subq, volume_subq.c.code == sd.c.code)
+        .join(s, sd.c.code == s.c.code)
+        .join(rcs, s.c.code == rcs.c.stock_code)
+        .join(c, c.c.code == rcs.c.collection_code)
+        .join(cd, (c.c.code == cd.c.code) & (sd.c.trade_day == cd.c.trade_day))
+        .where(
+            # T0
+            sd.c.trade_day == trade_day,
+
+            # T1
+            (100.0 * (sd.c.close / prev.c.close - 1)).between(3, 5),
+
+            # T2
+            sd.c.quantity_relative_ratio >= 1,
+
+            # T3
+            sd.c.turnover_rate > 5.0,
+
+            # T4
+            sd.c.circulation_capital.between(2_0000_0000, 200_0000_0000),
+
+            # T5
+            prev.c.volume < volume_subq.c.ma5_volume,
+            sd.c.volume > volume_subq.c.ma5_volume,
+
+            # T6
+            ~s.c.name.like("%ST%"),
+            ~s.c.name.like("%*%"),
+
+            # T7
+            sd.c.low > sd.c.ma_250,
+
+            # T8
+            sd.c.close > sd.c.open,
+        )
+
+        # TX
+        .order_by(cd.c.change_rate.desc(), c.c.name.desc())
+    )
+
+    return stmt
+
+
+def build_stmt_postgresql(
+    engine: Engine,
+    trade_day: date,
+    materialized: Optional[bool] = True,
+    mv_exists: Optional[bool] = None,
+) -> Select:
+    if materialized and mv_exists is None:
+        mv_exists = check_mv_exists(engine, trade_day, previous=True)
+
+    if materialized and mv_exists:
+        mv_stock_daily = Table(get_mv_stock_daily_name(trade_day, previous=True), MetadataBase.metadata, autoload_with=engine)
+        if 'close_sum' in mv_stock_daily.c:
+            logger.debug("Filter using materialized view")
+            return build_stmt_postgresql_mv(mv_stock_daily, trade_day)
+        logger.warning(f"Materialized view {mv_stock_daily.name} predates window sums, run init to recreate the procedure")
+
+    logger.debug("Filter using lateral join")
+    return build_stmt_postgresql_lateral(trade_day)
 
 
 @trace_elapsed()
-def filter_desired(engine: Engine, trade_day: Optional[date] = None, materialized: Optional[bool] = True) -> List[FeedDaily]:
+def filter_desired(
+    engine: Engine,
+    trade_day: Optional[date] = None,
+    materialized: Optional[bool] = True,
+    mv_exists: Optional[bool] = None,
+) -> List[FeedDaily]:
+    '''
+    mv_exists skips the catalog check when the caller already knows, see RunContext.
+    '''
     output = []
 
     if trade_day is None:
         trade_day = previous_trade_day(date.today(), inclusive=True)
 
     if engine.dialect.name == "postgresql":
-        filter_stmt = build_stmt_postgresql(engine, trade_day, materialized=materialized)
+        filter_stmt = build_stmt_postgresql(engine, trade_day, materialized=materialized, mv_exists=mv_exists)
+        logger.debug(filter_stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+    elif engine.dialect.name == "duckdb":
+        # no materialized views, ma_250 comes from the update task
+        filter_stmt = build_stmt_duckdb(trade_day)
         logger.debug(filter_stmt.compile(engine, compile_kwargs={"literal_binds": True}))
     else:
         raise Exception("Not implemented!")
@@ -264,6 +383,7 @@ def filter_desired(engine: Engine, trade_day: Optional[date] = None, materialize
             )
             output.append(fd)
 
+    annotate(trade_day=trade_day.isoformat(), rows=len(output))
     return output
 
 
@@ -24,35 +24,17 @@ import os
 import sys
 import json
 import argparse
-from datetime import date, datetime, time
+from datetime import date
 
 from loguru import logger
 from dotenv import load_dotenv
 
-from app.backtest.feed import refresh_feed_daily_table
 from app.constant.exchange import MARKET_SUPPORTED
 from app.constant.version import VERSION
 from app.constant.schedule import previous_trade_day
-from app.db.engine import engine_from_env
-from app.db.load import (
-    load_market, 
-    load_all_stocks, 
-    load_default_collections, 
-    load_collection_stock_relation,
-    load_by_level,
-)
-from app.db.materialized_view import (
-    check_mv_exists, 
-    check_mv_procedure_exists,
-    daily_create_mv,
-)
-from app.db.models import FeedDaily
-from app.display.tdx import add_to_tdx_path
-from app.display.google_sheet import add_df_to_new_sheet
-from app.filter.tail_scraper import filter_desired
-from app.utils.ingest import auto_fill
-from app.utils.update import calculate_ma250
-from app.utils.reset import reset_db_content
+
+# subsystems are imported inside the subcommand/task that needs them, so that
+# e.g. --version or init --dryrun never pay for akshare, pandas or gspread
 
 
 load_dotenv(override=True)
@@ -65,9 +47,17 @@ def build_parser():
     parser.add_argument('-q', '--quiet', action='store_true', default=False, help='Supress any logs below SUCCESS, inclusive')
     parser.add_argument('-s', '--supress', action='store_true', default=False, help='Supress any logs below WARNING, inclusive')
     parser.add_argument('-S', '--store-log', action='store_true', default=False, help='Store full logs to a seperate file')
-    parser.add_argument('-t', '--trace', action='store_true', default=False, help='Store tracing logs to a seperate file')
+    parser.add_argument('-t', '--trace', action='store_true', default=False, help='Trace spans, storing tracing logs and a Chrome trace to seperate files')
+    parser.add_argument('--trace-out', default='tracing.json', help='Chrome trace-event file written with -t, open in chrome://tracing or ui.perfetto.dev')
     parser.add_argument('-v', '--verbose', action='count', default=0, help='Increase verbosity, default at SUCCESS')
     parser.add_argument('-V', '--version', action='version', version=f'%(prog)s {VERSION}')
+    parser.add_argument('--db-driver', choices=['postgresql', 'postgresql+psycopg2', 'postgresql+psycopg', 'duckdb'], help='Database driver, duckdb for the file DUCKDB_PATH, default DB_DRIVER')
+    parser.add_argument('--pool-size', type=int, help='Connection pool size, default DB_POOL_SIZE')
+    parser.add_argument('--pre-ping', action=argparse.BooleanOptionalAction, default=None, help='Test pooled connections on checkout, default DB_POOL_PRE_PING')
+    parser.add_argument('--statement-timeout', type=int, help='Session statement_timeout in ms, default DB_STATEMENT_TIMEOUT')
+    parser.add_argument('--work-mem', help='Session work_mem, e.g. 64MB, default DB_WORK_MEM')
+    parser.add_argument('--data-provider', choices=['akshare', 'fake'], help='Source of market data, fake serves synthetic data offline, default DATA_PROVIDER')
+    parser.add_argument('--pool-stats', action='store_true', default=False, help='Log connect/checkout latency of the pool at exit')
     subparsers = parser.add_subparsers(dest="subcommand_name", help='subcommand help')
 
     #
@@ -84,16 +74,110 @@ def build_parser():
 
     #
     # run tasks
-    subparser_run = subparsers.add_parser('run',
-                                          help='Run the stock picker, including refreshing stock data, calculating moving averages, and filtering desired stocks'
+    task_options = argparse.ArgumentParser(add_help=False)
+    task_options.add_argument('-l', '--load', nargs='?', default='all', help='To load market/stock/collection/all (semi-)static data')
+    task_options.add_argument('-d', '--dryrun', action='store_true', default=False, help='Show task run results without committing, only applies to update/filter tasks')
+    task_options.add_argument('-s', '--skip', action='store_true', default=False, help='Skip autof fill history, if you are confident they are correct')
+    task_options.add_argument('-m', '--materialized', action=argparse.BooleanOptionalAction, default=True, help='Recreate/create materialized view')
+    task_options.add_argument('-t', '--task', default='all', help='The trade task to run the stock picker for')
+    task_options.add_argument('-y', '--yes', action='store_true', default=False, help='Say yes to confirms')
+    task_options.add_argument('-w', '--workers', type=int, default=None, help='Concurrent tasks of the all task, default PIPELINE_WORKERS or 4, 1 to run one by one')
+
+    run_options = argparse.ArgumentParser(add_help=False, parents=[task_options])
+    run_options.add_argument('--date', default=date.today().isoformat(), help='The trade day to run the stock picker for')
+
+    subparsers.add_parser('run', parents=[run_options],
+                          help='Run the stock picker, including refreshing stock data, calculating moving averages, and filtering desired stocks'
+    )
+
+    #
+    # profile the SQL of run tasks
+    subparser_profile = subparsers.add_parser('profile', parents=[run_options],
+                                              help='Run a task like run does, timing every SQL statement, and print the top statements'
+    )
+    subparser_profile.add_argument('-n', '--top', type=int, default=20, help='Statements to print')
+    subparser_profile.add_argument('--sort', choices=['total_ms', 'max_ms', 'p95_ms', 'count', 'rows'], default='total_ms', help='Order of the printed statements')
+    subparser_profile.add_argument('--slow-ms', type=float, default=None, help='Capture EXPLAIN (ANALYZE, BUFFERS) of statements slower than this, default SQL_SLOW_MS or 500')
+    subparser_profile.add_argument('--explain', action=argparse.BooleanOptionalAction, default=True, help='Capture plans of slow statements')
+    subparser_profile.add_argument('-o', '--output', default=None, help='Also write every statement\'s stats and plan to this JSON file')
+
+    #
+    # resident scheduler
+    subparser_serve = subparsers.add_parser('serve', parents=[task_options],
+                                            help='Stay resident with warm caches, running the task at each market\'s close time from the market table'
+    )
+    subparser_serve.add_argument('--delay', type=float, default=None, help='Minutes after the close to run, for the sources to publish, default SERVE_DELAY_MINUTES or 10')
+    subparser_serve.add_argument('--retries', type=int, default=None, help='Reruns of a failed run, default SERVE_RETRIES or 2')
+    subparser_serve.add_argument('--retry-minutes', type=float, default=None, help='Minutes between reruns, default SERVE_RETRY_MINUTES or 10')
+    subparser_serve.add_argument('--now', action='store_true', default=False, help='Also run the last closed trade day on start')
+
+    #
+    # backtest feed
+    subparser_backtest = subparsers.add_parser('backtest',
+                                               help='Backtest filtered stocks stored in feed_daily'
+    )
+    subparser_backtest.add_argument('--start', required=True, help='First trade day of picks to backtest')
+    subparser_backtest.add_argument('--end', default=date.today().isoformat(), help='Last trade day of picks to backtest')
+    subparser_backtest.add_argument('-f', '--filter', type=int, action='append', help='Filter id to backtest, default all registered filters')
+    subparser_backtest.add_argument('-c', '--capital', type=float, default=1_000_000.0, help='Initial capital')
+    subparser_backtest.add_argument('-p', '--position-size', type=float, default=0.1, help='Fraction of capital per pick')
+    subparser_backtest.add_argument('-m', '--max-positions', type=int, default=10, help='Max picks bought per filter per day')
+    subparser_backtest.add_argument('-e', '--exit', choices=['next_open', 'next_close'], default='next_open', help='Sell at next open or next close')
+    subparser_backtest.add_argument('-i', '--incremental', action='store_true', default=False, help='Extend the persisted backtest state up to --end, recomputed from --start if it starts on another day')
+
+    #
+    # walk-forward evaluation of filter thresholds
+    subparser_wf = subparsers.add_parser('walk-forward',
+                                         help='Choose tail scraper thresholds on rolling train windows and evaluate on the following test windows'
+    )
+    subparser_wf.add_argument('--start', required=True, help='First trade day of the walk-forward')
+    subparser_wf.add_argument('--end', default=date.today().isoformat(), help='Last trade day of the walk-forward')
+    subparser_wf.add_argument('--train', type=int, default=120, help='Trade days in each train window')
+    subparser_wf.add_argument('--test', type=int, default=20, help='Trade days in each test window')
+    subparser_wf.add_argument('--step', type=int, default=None, help='Trade days between windows, default the test window')
+    subparser_wf.add_argument('-o', '--objective', choices=['sharpe', 'total_return', 'win_rate', 'avg_return'], default='sharpe', help='Train stat to maximize')
+    subparser_wf.add_argument('-j', '--jobs', type=int, default=None, help='Worker processes, default all cores')
+
+    #
+    # tdx blocks of a range of days
+    subparser_tdx = subparsers.add_parser('tdx',
+                                          help='Write tdx block files of feed_daily picks for a range of trade days'
+    )
+    subparser_tdx.add_argument('--start', required=True, help='First trade day to export')
+    subparser_tdx.add_argument('--end', default=date.today().isoformat(), help='Last trade day to export')
+    subparser_tdx.add_argument('-n', '--rolling', type=int, default=None, help='Trade days in the combined rolling block, 0 to disable, default TDX_ROLLING_DAYS')
+
+    #
+    # xlsx/parquet report of a range of days
+    subparser_report = subparsers.add_parser('report',
+                                             help='Write feed_daily picks of a range of trade days into XLSX (a sheet per day) and Parquet'
+    )
+    subparser_report.add_argument('--start', required=True, help='First trade day of the report')
+    subparser_report.add_argument('--end', default=date.today().isoformat(), help='Last trade day of the report')
+    subparser_report.add_argument('-o', '--output', default='reports', help='Directory to write the report into')
+    subparser_report.add_argument('--xlsx', action=argparse.BooleanOptionalAction, default=True, help='Write the XLSX report')
+    subparser_report.add_argument('--parquet', action=argparse.BooleanOptionalAction, default=True, help='Write the Parquet archive')
+
+    #
+    # duckdb copy for update/filter without a server
+    subparser_duckdb = subparsers.add_parser('duckdb',
+                                             help='Export the tables update and filter read into an embedded DuckDB file'
+    )
+    subparser_duckdb.add_argument('-o', '--output', default=None, help='DuckDB file to write, default DUCKDB_PATH or stock_picker.duckdb')
+    subparser_duckdb.add_argument('--since', default=None, help='First trade day of the daily tables, default all')
+    subparser_duckdb.add_argument('-t', '--table', action='append', help='Table to export, default all of update/filter\'s')
+    subparser_duckdb.add_argument('--parquet', default=None, help='Also write each table into this directory as Parquet')
+
+    #
+    # parquet cold storage of old stock_daily days
+    subparser_archive = subparsers.add_parser('archive',
+                                              help='Move stock_daily trade days older than a cutoff into Parquet files, read along by backtests'
     )
-    subparser_run.add_argument('--date', default=date.today().isoformat(), help='The trade day to run the stock picker for')
-    subparser_run.add_argument('-l', '--load', nargs='?', default='all', help='To load market/stock/collection/all (semi-)static data')
-    subparser_run.add_argument('-d', '--dryrun', action='store_true', default=False, help='Show task run results without committing, only applies to update/filter tasks')
-    subparser_run.add_argument('-s', '--skip', action='store_true', default=False, help='Skip autof fill history, if you are confident they are correct')
-    subparser_run.add_argument('-m', '--materialized', action=argparse.BooleanOptionalAction, default=True, help='Recreate/create materialized view')
-    subparser_run.add_argument('-t', '--task', default='all', help='The trade task to run the stock picker for')
-    subparser_run.add_argument('-y', '--yes', action='store_true', default=False, help='Say yes to confirms')
+    subparser_archive.add_argument('-k', '--keep', type=int, default=None, help='Trade days kept in stock_daily up to the last trade day, default ARCHIVE_KEEP_DAYS or 260')
+    subparser_archive.add_argument('--before', default=None, help='First trade day kept, instead of --keep')
+    subparser_archive.add_argument('-o', '--output', default=None, help='Archive directory, default ARCHIVE_PATH or archive')
+    subparser_archive.add_argument('-d', '--dryrun', action='store_true', default=False, help='Count the rows to archive without moving them')
+    subparser_archive.add_argument('-y', '--yes', action='store_true', default=False, help='Say yes to deleting the archived rows')
 
     #
     # reset tables
@@ -110,6 +194,217 @@ def build_parser():
     return parser
 
 
+def make_engine(args, **kwargs):
+    '''
+    Engine from .env, with the database options given on the command line.
+    '''
+    from app.db.engine import EngineOptions, engine_from_env, instrument_pool
+
+    options = EngineOptions.from_env().override(
+        driver=args.db_driver,
+        pool_size=args.pool_size,
+        pre_ping=args.pre_ping,
+        statement_timeout=args.statement_timeout,
+        work_mem=args.work_mem,
+    )
+    engine = engine_from_env(options, **kwargs)
+
+    if args.pool_stats:
+        import atexit
+
+        stats = instrument_pool(engine)
+        atexit.register(lambda: logger.success(f"Pool stats {json.dumps(stats.summary())}"))
+
+    return engine
+
+
+def profile_sql(args, engine):
+    '''
+    Times every statement of the engine, printing the top ones at exit. The
+    tracer is enabled so each statement is attributed to its task.
+    '''
+    import atexit
+    from app.profile.sql import instrument_sql
+    from app.profile.tracer import tracer
+
+    tracer.enable()
+    profiler = instrument_sql(engine, slow_ms=args.slow_ms, explain=args.explain)
+
+    def report():
+        print(profiler.format_table(n=args.top, sort=args.sort))
+        if args.output:
+            logger.success(f"SQL profile of {len(profiler.statements)} statements wrote to {profiler.write_json(args.output, sort=args.sort)}")
+
+    atexit.register(report)
+
+
+def start_tracing(args):
+    '''
+    Enables the span tracer with one root span for the subcommand, closed at
+    exit, when the span summary is logged and the Chrome trace written.
+    '''
+    import atexit
+    from app.profile.tracer import span, tracer
+
+    tracer.enable()
+    root = span(f"main.{args.subcommand_name}", argv=' '.join(sys.argv[1:]))
+    root.__enter__()
+
+    def finish():
+        root.__exit__(None, None, None)
+        tracer.log_summary()
+        if args.trace:
+            logger.success(f"Chrome trace of {len(tracer.spans)} spans wrote to {tracer.write_chrome_trace(args.trace_out)}")
+
+    atexit.register(finish)
+
+
+def run_task(args, ctx):
+    '''
+    Runs args.task for the trade day of the run context, the body of `run`,
+    `profile` and every trigger of `serve`.
+    '''
+    # writers commit on their own connections, ctx.bind is for the context's lookups
+    engine = ctx.engine
+
+    # args
+    trade_day = ctx.trade_day
+    task = args.task.strip()
+    dryrun = args.dryrun
+
+    match task:
+        ############################
+        case "load":
+            from app.db.load import (
+                load_market,
+                load_all_stocks,
+                load_default_collections,
+                load_collection_stock_relation,
+                load_by_level,
+            )
+
+            match args.load:
+                case "market":
+                    load_market(engine)
+                case "stock":
+                    for market_name in MARKET_SUPPORTED:
+                        load_all_stocks(engine, market_name)
+                case "collection":
+                    dcts = load_default_collections(engine)
+                    for cType in dcts:
+                        load_collection_stock_relation(engine, cType)
+                case "all":
+                    load_by_level(engine=engine, level=3)
+                case _:
+                    logger.error(f"Unrecoginized load target {args.load}")
+
+        ############################
+        case "ingest":
+            from app.utils.ingest import auto_fill
+
+            auto_fill(
+                engine=engine, 
+                up_to_date=trade_day, 
+                skip_hist_fill=args.skip, 
+                yes=args.yes
+            )
+
+        ############################
+        case "update":
+            from app.utils.update import calculate_ma250
+
+            if args.materialized and ctx.mv_procedure_exists():
+                if not ctx.mv_exists(previous=True):
+                    ctx.create_mv(previous=True)
+
+                # the trade day's own view once its markets closed, by the market table
+                if ctx.market_closed() and not ctx.mv_exists(previous=False):
+                    _ = ctx.create_mv(previous=False)
+
+            # TODO: fill from mv
+            calculate_ma250(
+                engine=engine, 
+                trade_day=trade_day, 
+                dryrun=dryrun
+            )
+
+        ############################
+        case "filter":
+            from app.backtest.feed import refresh_feed_daily_table
+            from app.db.models import FeedDaily
+            from app.filter.tail_scraper import filter_desired
+
+            fds = filter_desired(
+                engine=engine, 
+                trade_day=trade_day,
+                materialized=args.materialized,
+                mv_exists=ctx.mv_exists(previous=True) if args.materialized else None,
+            )
+            if not dryrun:
+                df = refresh_feed_daily_table(
+                    engine=engine,
+                    fds=fds,
+                    trade_day=trade_day,
+                    materialized=args.materialized,
+                )
+            else:
+                from app.display.report import REPORT_PATH, write_report
+
+                df = FeedDaily.to_dataframe(fds)
+                if not os.path.exists(REPORT_PATH):
+                    os.makedirs(REPORT_PATH)
+                df.to_csv(f'{REPORT_PATH}/report-{trade_day}.csv')
+                write_report(
+                    [(trade_day, df)],
+                    xlsx_path=f'{REPORT_PATH}/report-{trade_day}.xlsx',
+                    parquet_path=f'{REPORT_PATH}/report-{trade_day}.parquet',
+                )
+
+        ############################
+        case "label":
+            from app.backtest.label import label_feed_daily
+
+            label_feed_daily(engine=engine, trade_day=trade_day)
+
+        ############################
+        case "display":
+            from app.display.cache import feed_for_display
+            from app.display.fanout import display_feed
+
+            # feed_daily first, the filter only when the day was never filtered
+            df = feed_for_display(
+                engine=engine,
+                trade_day=trade_day,
+                materialized=args.materialized,
+            )
+            # sinks run on threads, which take the engine, not the run's connection
+            ctx.code_market_map()
+            display_feed(
+                engine=ctx.engine,
+                trade_day=trade_day,
+                df=df,
+                yes=args.yes,
+            )
+
+        ############################
+        case 'all':
+            from app.utils.pipeline import build_run_graph, pipeline_workers
+
+            # a task graph, so independent steps run concurrently, e.g. the stock and board snapshots
+            graph = build_run_graph(
+                ctx,
+                materialized=args.materialized,
+                skip_hist_fill=args.skip,
+                dryrun=dryrun,
+                yes=args.yes,
+            )
+            graph.run(workers=pipeline_workers(args.workers))
+
+        ############################
+        case _:
+            logger.error(f"Unknown task: {task}")
+
+
 def main():
     parser = build_parser()
     args = parser.parse_args()
@@ -139,13 +434,22 @@ def main():
                 logger.add(sys.stdout, level="TRACE")
     logger.debug(f'Parsed args =\n{json.dumps(vars(args), sort_keys=True, indent=4)}')
 
+    if args.trace or args.verbose >= 3:
+        start_tracing(args)
+
+    if args.data_provider:
+        from app.data.provider import provider_from_name, set_provider
+        set_provider(provider_from_name(args.data_provider))
+
     # 
     match args.subcommand_name.strip():
         
         ################################################################################
         case 'init':
+            from app.utils.reset import reset_db_content
+
             dryrun = args.dryrun
-            engine = engine_from_env(echo=args.echo)
+            engine = make_engine(args, echo=args.echo)
 
             reset_db_content(
                 engine=engine,
@@ -160,161 +464,172 @@ def main():
                 # market 1
                 # stocks 2
                 # collections 3
+                from app.db.load import load_by_level
+
                 load_by_level(engine=engine, level=args.load)
 
                 if args.ingest:
                     raise Exception("Not implemented yet!")
         
         ################################################################################
-        case 'run':                
-            engine = engine_from_env()
-            
-            # args
-            trade_day = previous_trade_day(date.fromisoformat(args.date))
-            task = args.task.strip()
-            dryrun = args.dryrun
+        case 'run' | 'profile':
+            from app.db.context import RunContext
 
-            match task:
-                ############################
-                case "load":
-                    match args.load:
-                        case "market":
-                            load_market(engine)
-                        case "stock":
-                            for market_name in MARKET_SUPPORTED:
-                                load_all_stocks(engine, market_name)
-                        case "collection":
-                            dcts = load_default_collections(engine)
-                            for cType in dcts:
-                                load_collection_stock_relation(engine, cType)
-                        case "all":
-                            load_by_level(engine=engine, level=3)
-                        case _:
-                            logger.error(f"Unrecoginized load target {args.load}")
-                
-                ############################
-                case "ingest":
-                    auto_fill(
-                        engine=engine, 
-                        up_to_date=trade_day, 
-                        skip_hist_fill=args.skip, 
-                        yes=args.yes
-                    )
+            engine = make_engine(args)
+            if args.subcommand_name == 'profile':
+                profile_sql(args, engine)
 
-                ############################
-                case "update":
-                    if args.materialized and check_mv_procedure_exists(engine):
-                        if not check_mv_exists(engine, trade_day, previous=True):
-                            daily_create_mv(engine=engine, trade_day=trade_day, previous=True)
-                        
-                        # FIXME: change to market specific close time
-                        now = datetime.now().time()
-                        if now > time(15, 0) and not check_mv_exists(engine, trade_day, previous=False):
-                            _ = daily_create_mv(engine, trade_day, previous=False)
-
-                    # TODO: fill from mv
-                    calculate_ma250(
-                        engine=engine, 
-                        trade_day=trade_day, 
-                        dryrun=dryrun
-                    )
+            # one connection, trade days and catalog snapshot shared by every task
+            with RunContext.create(engine, date.fromisoformat(args.date)) as ctx:
+                ctx.ensure_trade_calendar()
+                ctx.ensure_data_version()
+                ctx.ensure_label_columns()
+                run_task(args, ctx)
 
-                ############################
-                case "filter":
-                    fds = filter_desired(
-                        engine=engine, 
-                        trade_day=trade_day,
-                        materialized=args.materialized,
-                    )
-                    if not dryrun:
-                        df = refresh_feed_daily_table(
-                            engine=engine,
-                            fds=fds,
-                            trade_day=trade_day,
-                        )
-                    else:
-                        df = FeedDaily.to_dataframe(fds)
-                        if not os.path.exists('reports'):
-                            os.makedirs('reports')
-                        df.to_csv(f'reports/report-{trade_day}.csv')
-                        df.to_excel(f'reports/report-{trade_day}.xlsx')
-
-                ############################
-                case "display":
-                    fds = filter_desired(
-                        engine=engine, 
-                        trade_day=trade_day,
-                        materialized=args.materialized,
-                    )
-                    df = FeedDaily.to_dataframe(fds)
-                    add_to_tdx_path(
-                        engine=engine,
-                        df=df,
-                        trade_day=trade_day,
-                    )
-                    add_df_to_new_sheet(
-                        trade_day=trade_day, 
-                        df=FeedDaily.convert_to_feed(df),
-                        yes=args.yes
-                    )
+        ################################################################################
+        case 'serve':
+            from app.db.context import RunContext
+            from app.utils.serve import Scheduler
+
+            engine = make_engine(args)
+            # no one to answer confirms
+            args.yes = True
+
+            def run_day(trade_day, close_times):
+                # a fresh context per run, the catalog changes daily; close times are the scheduler's
+                with RunContext.create(engine, trade_day, close_times=close_times) as ctx:
+                    ctx.ensure_trade_calendar()
+                    ctx.ensure_data_version()
+                    ctx.ensure_label_columns()
+                    run_task(args, ctx)
+
+            Scheduler(
+                engine,
+                run_day,
+                delay_minutes=args.delay,
+                retries=args.retries,
+                retry_minutes=args.retry_minutes,
+                trace_out=args.trace_out if args.trace else None,
+            ).serve(now=args.now)
 
-                ############################
-                case 'all':
-                    # ingest: assumes load is ready
-                    auto_fill(
-                        engine=engine, 
-                        up_to_date=trade_day, 
-                        skip_hist_fill=args.skip, 
-                        yes=args.yes
-                    )
+        ################################################################################
+        case 'backtest':
+            from app.backtest.engine import BacktestConfig, backtest_feed_daily
+            from app.backtest.state import extend_backtest_state
+            from app.db.version import ensure_data_version
+
+            engine = make_engine(args)
+            ensure_data_version(engine)
+            config = BacktestConfig(
+                capital=args.capital,
+                position_size=args.position_size,
+                max_positions=args.max_positions,
+                exit=args.exit,
+            )
 
-                    # update
-                    using_mv = False
-                    if args.materialized and check_mv_procedure_exists(engine):
-                        if check_mv_exists(engine, trade_day, previous=True):
-                            using_mv = True
-                        else:
-                            using_mv = daily_create_mv(engine=engine, trade_day=trade_day, previous=True)
-                            
-                        # FIXME: change to market specific close time
-                        now = datetime.now().time()
-                        if now > time(15, 0) and not check_mv_exists(engine, trade_day, previous=False):
-                            _ = daily_create_mv(engine, trade_day, previous=False)
-                    if not using_mv:
-                        calculate_ma250(
-                            engine=engine, 
-                            trade_day=trade_day
-                        )
-                    
-                    # filter
-                    fds = filter_desired(
-                        engine=engine, 
-                        trade_day=trade_day,
-                        materialized=args.materialized,
-                    )
-                    if not dryrun:
-                        df = refresh_feed_daily_table(
-                            engine=engine,
-                            fds=fds,
-                            trade_day=trade_day,
-                        )
-                    else:
-                        df = FeedDaily.to_dataframe(fds)
-
-                    # display
-                    add_df_to_new_sheet(
-                        trade_day=trade_day, 
-                        df=df,
-                        yes=args.yes
-                    )
-                    add_to_tdx_path(
+            if args.incremental:
+                from app.filter.misc import StockFilter, get_filter_id
+
+                for filter_id in args.filter or [get_filter_id(StockFilter.TAIL_SCRAPER)]:
+                    stats = extend_backtest_state(
                         engine=engine,
-                        trade_day=trade_day
+                        trade_day=previous_trade_day(date.fromisoformat(args.end)),
+                        filter_id=filter_id,
+                        config=config,
+                        start_day=date.fromisoformat(args.start),
                     )
+                    print(f"filter {filter_id}: {json.dumps(stats, indent=4)}")
+            else:
+                results = backtest_feed_daily(
+                    engine=engine,
+                    start_day=date.fromisoformat(args.start),
+                    end_day=date.fromisoformat(args.end),
+                    filter_ids=args.filter,
+                    config=config,
+                )
+                for filter_id, result in results.items():
+                    print(f"filter {filter_id}: {json.dumps(result.stats, indent=4)}")
 
-                ############################
-                case _:
-                    logger.error(f"Unknown task: {task}")
+        ################################################################################
+        case 'walk-forward':
+            from app.backtest.walk_forward import walk_forward_from_db
+
+            engine = make_engine(args)
+
+            walk_forward_from_db(
+                engine=engine,
+                start_day=date.fromisoformat(args.start),
+                end_day=date.fromisoformat(args.end),
+                train_days=args.train,
+                test_days=args.test,
+                step_days=args.step,
+                objective=args.objective,
+                workers=args.jobs,
+            )
+
+        ################################################################################
+        case 'tdx':
+            from app.display.tdx import TDX_ROLLING_DAYS, export_tdx_range
+
+            engine = make_engine(args)
+
+            export_tdx_range(
+                engine=engine,
+                start_day=date.fromisoformat(args.start),
+                end_day=date.fromisoformat(args.end),
+                rolling_days=TDX_ROLLING_DAYS if args.rolling is None else args.rolling,
+            )
+
+        ################################################################################
+        case 'report':
+            from app.display.report import report_from_db
+
+            engine = make_engine(args)
+
+            report_from_db(
+                engine=engine,
+                start_day=date.fromisoformat(args.start),
+                end_day=date.fromisoformat(args.end),
+                report_path=args.output,
+                xlsx=args.xlsx,
+                parquet=args.parquet,
+            )
+
+        ################################################################################
+        case 'duckdb':
+            from app.db.duck import export_to_duckdb
+            from app.db.engine import engine_duckdb
+
+            export_to_duckdb(
+                source=make_engine(args),
+                target=engine_duckdb(path=args.output),
+                tables=args.table,
+                since=date.fromisoformat(args.since) if args.since else None,
+                parquet=args.parquet,
+            )
+
+        ################################################################################
+        case 'archive':
+            from app.constant.confirm import confirms_execution
+            from app.db.archive import DEFAULT_KEEP_DAYS, archive_cutoff, archive_path, archive_stock_daily
+
+            if args.before:
+                before = date.fromisoformat(args.before)
+            else:
+                keep = args.keep or int(os.getenv("ARCHIVE_KEEP_DAYS") or DEFAULT_KEEP_DAYS)
+                before = archive_cutoff(previous_trade_day(date.today()), keep)
+
+            if not args.dryrun:
+                confirms_execution(
+                    action=f'Move stock_daily before {before.isoformat()} into {archive_path(args.output)}',
+                    yes=args.yes,
+                )
+            archive_stock_daily(
+                engine=make_engine(args),
+                before=before,
+                directory=args.output,
+                dryrun=args.dryrun,
+            )
 
         ################################################################################
         case 'reset':
@@ -0,0 +1,240 @@
+"""
+SQL statement profiler.
+
+Hooks before/after_cursor_execute of an engine and records, per statement
+fingerprint (the statement with literals and parameters replaced by ?), how
+often it ran, its durations, the rows it returned or touched and the tasks,
+i.e. innermost tracer spans, that issued it. The first time a statement is
+slower than the threshold its plan is captured with EXPLAIN (ANALYZE, BUFFERS),
+run inside a savepoint that is rolled back, so DML is not applied twice.
+
+    profiler = instrument_sql(engine, slow_ms=500)
+    ...
+    print(profiler.format_table(n=20))
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.profile.tracer import current_span
+
+
+load_dotenv(override=True)
+
+
+# ms
+DEFAULT_SLOW_MS = 500.0
+
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'VALUES')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PARAM = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+|\?")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_VALUES_LIST = re.compile(r"\((?:\?, )*\?\)(?:, \((?:\?, )*\?\))+")
+_IN_LIST = re.compile(r"IN \((?:\?, )*\?\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(statement: str) -> str:
+    '''
+    The statement with literals and parameters replaced by ?, and value/IN
+    lists of any length collapsed, so that repeated calls group together.
+    '''
+    normalized = _WHITESPACE.sub(' ', statement).strip()
+    normalized = _STRING.sub('?', normalized)
+    normalized = _PARAM.sub('?', normalized)
+    normalized = _NUMBER.sub('?', normalized)
+    normalized = _VALUES_LIST.sub('(?, ...), ...', normalized)
+    normalized = _IN_LIST.sub('IN (...)', normalized)
+    return normalized
+
+
+def fingerprint(statement: str) -> str:
+    return hashlib.sha1(normalize(statement).encode()).hexdigest()[:12]
+
+
+@dataclass
+class StatementStats:
+    fingerprint:    str
+    statement:      str
+    count:          int             = 0
+    rows:           int             = 0
+    elapsed_ms:     List[float]     = field(default_factory=list)
+    tasks:          Dict[str, int]  = field(default_factory=dict)
+    plan:           Optional[str]   = None
+
+    @property
+    def total_ms(self) -> float:
+        return sum(self.elapsed_ms)
+
+    def percentile_ms(self, q: float) -> float:
+        ordered = sorted(self.elapsed_ms)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'fingerprint':  self.fingerprint,
+            'count':        self.count,
+            'rows':         self.rows,
+            'total_ms':     round(self.total_ms, 3),
+            'p50_ms':       round(self.percentile_ms(0.5), 3),
+            'p95_ms':       round(self.percentile_ms(0.95), 3),
+            'max_ms':       round(max(self.elapsed_ms, default=0.0), 3),
+            'tasks':        dict(sorted(self.tasks.items(), key=lambda item: -item[1])),
+            'statement':    self.statement,
+            'plan':         self.plan,
+        }
+
+
+class SqlProfiler:
+    '''
+    Statement stats of an engine, see instrument_sql.
+    '''
+
+    SORT_KEYS = ('total_ms', 'max_ms', 'p95_ms', 'count', 'rows')
+
+    def __init__(self, slow_ms: Optional[float] = DEFAULT_SLOW_MS, explain: bool = True):
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self.statements: Dict[str, StatementStats] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        statement: str,
+        elapsed_ms: float,
+        rowcount: int,
+        task: str,
+    ) -> StatementStats:
+        key = fingerprint(statement)
+        with self._lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = StatementStats(key, normalize(statement))
+            stats.count += 1
+            stats.elapsed_ms.append(elapsed_ms)
+            # -1 when the driver does not know, e.g. DDL
+            if rowcount > 0:
+                stats.rows += rowcount
+            stats.tasks[task] = stats.tasks.get(task, 0) + 1
+        return stats
+
+    def wants_plan(self, stats: StatementStats, elapsed_ms: float, statement: str) -> bool:
+        return (
+            self.explain
+            and self.slow_ms is not None
+            and elapsed_ms >= self.slow_ms
+            and stats.plan is None
+            and statement.lstrip().split(None, 1)[0].upper() in EXPLAINABLE
+        )
+
+    def top(self, n: int = 20, sort: str = 'total_ms') -> List[Dict[str, Any]]:
+        assert sort in self.SORT_KEYS, f"Sort by one of {', '.join(self.SORT_KEYS)}"
+        with self._lock:
+            summaries = [stats.summary() for stats in self.statements.values()]
+        return sorted(summaries, key=lambda s: -s[sort])[:n]
+
+    def format_table(self, n: int = 20, sort: str = 'total_ms', width: int = 100) -> str:
+        rows = self.top(n, sort)
+        lines = [
+            f"{'fingerprint':12}  {'count':>6}  {'rows':>9}  {'total ms':>12}  {'p50 ms':>10}  {'p95 ms':>10}  {'max ms':>10}  task / statement",
+        ]
+        for s in rows:
+            task = next(iter(s['tasks']), '-')
+            lines.append(
+                f"{s['fingerprint']:12}  {s['count']:6}  {s['rows']:9}  {s['total_ms']:12_.3f}  "
+                f"{s['p50_ms']:10_.3f}  {s['p95_ms']:10_.3f}  {s['max_ms']:10_.3f}  {task}"
+            )
+            statement = s['statement']
+            lines.append(f"{'':12}  {statement[:width]}{'...' if len(statement) > width else ''}")
+        for s in rows:
+            if s['plan']:
+                lines.append('')
+                lines.append(f"Plan of {s['fingerprint']} ({s['max_ms']:_.3f} ms):")
+                lines.extend(f"    {line}" for line in s['plan'].splitlines())
+        return '\n'.join(lines)
+
+    def write_json(self, path: str, n: Optional[int] = None, sort: str = 'total_ms') -> str:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f:
+            json.dump(self.top(n or len(self.statements), sort), f, indent=4, default=str)
+        return path
+
+
+def _capture_plan(dialect_name: str, dbapi_connection, statement: str, parameters) -> str:
+    '''
+    Plan of statement on its own connection and transaction. On PostgreSQL it
+    is analyzed inside a savepoint that is rolled back; statements that fail
+    to run a second time, e.g. inserts hitting a unique key, get the plain plan.
+    '''
+    cursor = dbapi_connection.cursor()
+    try:
+        if dialect_name != 'postgresql':
+            cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            return '\n'.join(' '.join(str(c) for c in row) for row in cursor.fetchall())
+
+        cursor.execute("SAVEPOINT sql_profile_explain")
+        try:
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+            plan = cursor.fetchall()
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT sql_profile_explain")
+            cursor.execute(f"EXPLAIN {statement}", parameters)
+            plan = cursor.fetchall()
+        cursor.execute("ROLLBACK TO SAVEPOINT sql_profile_explain")
+        cursor.execute("RELEASE SAVEPOINT sql_profile_explain")
+        return '\n'.join(row[0] for row in plan)
+    finally:
+        cursor.close()
+
+
+def slow_ms_from_env() -> float:
+    return float(os.getenv("SQL_SLOW_MS") or DEFAULT_SLOW_MS)
+
+
+def instrument_sql(engine: Engine, slow_ms: Optional[float] = None, explain: bool = True) -> SqlProfiler:
+    '''
+    Records every statement the engine executes. The calling task is the
+    innermost span of app.profile.tracer, so enable the tracer to get it.
+    '''
+
+    profiler = SqlProfiler(slow_ms if slow_ms is not None else slow_ms_from_env(), explain)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('sql_profile_start', []).append(time.perf_counter_ns())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter_ns() - conn.info['sql_profile_start'].pop()) / 1e6
+        task = getattr(current_span(), 'name', '-')
+        stats = profiler.record(statement, elapsed_ms, cursor.rowcount, task)
+
+        if not executemany and profiler.wants_plan(stats, elapsed_ms, statement):
+            try:
+                stats.plan = _capture_plan(conn.dialect.name, conn.connection.dbapi_connection, statement, parameters)
+                logger.debug(f"Captured plan of slow statement {stats.fingerprint} ({elapsed_ms:_.3f} ms)")
+            except Exception as e:
+                stats.plan = f"EXPLAIN failed: {e!r}"
+                logger.warning(f"Could not explain slow statement {stats.fingerprint}: {e!r}")
+
+    @event.listens_for(engine, 'handle_error')
+    def drop_timer(context):
+        starts = context.connection.info.get('sql_profile_start') if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+    return profiler
@@ -1,26 +1,261 @@
+"""
+Span tracer.
+
+Spans are timed with perf_counter_ns, nest per thread (a span opened inside
+another becomes its child) and carry attributes such as row counts. Finished
+spans are kept on the process tracer, which aggregates them per name
+(count/total/p50/p95) and exports them as Chrome trace-event JSON, to open a
+whole run in chrome://tracing or https://ui.perfetto.dev.
+
+Tracing is off unless enabled, e.g. by main's -t/--trace. While off, span()
+hands out a shared no-op span and traced functions call straight through.
+
+    @trace_elapsed()
+    def filter_desired(...):
+        ...
+        annotate(rows=len(output))
+
+    with span('sink.tdx', rows=df.shape[0]):
+        ...
+"""
+
+import json
+import os
+import threading
 import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Dict, List, Optional
 
 from loguru import logger
 
 
-def trace_elapsed(unit='ms'):
+@dataclass
+class SpanRecord:
+    '''
+    A finished span, times in ns from perf_counter_ns.
+    '''
+
+    name:       str
+    start_ns:   int
+    end_ns:     int
+    thread_id:  int
+    depth:      int
+    parent:     Optional[str]   = None
+    attrs:      Dict[str, Any]  = field(default_factory=dict)
+
+    @property
+    def elapsed_ns(self) -> int:
+        return self.end_ns - self.start_ns
+
+
+class Span:
+    '''
+    An open span, entered as a context manager.
+    '''
+
+    __slots__ = ('tracer', 'name', 'attrs', 'parent', 'depth', 'start_ns', 'end_ns', '_token')
+
+    def __init__(self, tracer: 'Tracer', name: str, attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.parent: Optional[Span] = None
+        self.depth = 0
+        self.start_ns = 0
+        self.end_ns = 0
+        self._token = None
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> 'Span':
+        self.parent = _current.get()
+        self.depth = 0 if self.parent is None else self.parent.depth + 1
+        self._token = _current.set(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.end_ns = time.perf_counter_ns()
+        _current.reset(self._token) # type: ignore
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.tracer.record(SpanRecord(
+            name=self.name,
+            start_ns=self.start_ns,
+            end_ns=self.end_ns,
+            thread_id=threading.get_ident(),
+            depth=self.depth,
+            parent=None if self.parent is None else self.parent.name,
+            attrs=self.attrs,
+        ))
+        return False
+
+
+class _NoopSpan:
+    '''
+    Handed out while tracing is off.
+    '''
+
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def __enter__(self) -> '_NoopSpan':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+_current: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+
+def _percentile(ordered: List[int], q: float) -> int:
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class Tracer:
+    '''
+    Collects the finished spans of a run.
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self.spans: List[SpanRecord] = []
+        self.origin_ns = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.spans = []
+        self.origin_ns = time.perf_counter_ns()
+
+    def record(self, record: SpanRecord) -> None:
+        with self._lock:
+            self.spans.append(record)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        '''
+        count, total/p50/p95/max elapsed in ms of each span name, slowest total first.
+        '''
+        by_name: Dict[str, List[int]] = {}
+        with self._lock:
+            for record in self.spans:
+                by_name.setdefault(record.name, []).append(record.elapsed_ns)
+
+        summary = {}
+        for name, elapsed in by_name.items():
+            ordered = sorted(elapsed)
+            summary[name] = {
+                'count':    len(ordered),
+                'total_ms': round(sum(ordered) / 1e6, 3),
+                'p50_ms':   round(_percentile(ordered, 0.5) / 1e6, 3),
+                'p95_ms':   round(_percentile(ordered, 0.95) / 1e6, 3),
+                'max_ms':   round(ordered[-1] / 1e6, 3),
+            }
+        return dict(sorted(summary.items(), key=lambda item: -item[1]['total_ms']))
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        '''
+        Chrome trace-event format, one complete ('X') event per span.
+        '''
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+
+        events = []
+        for record in sorted(spans, key=lambda r: (r.start_ns, r.depth)):
+            events.append({
+                'name': record.name,
+                'cat':  record.name.split('.', 1)[0],
+                'ph':   'X',
+                'ts':   (record.start_ns - self.origin_ns) / 1e3,
+                'dur':  record.elapsed_ns / 1e3,
+                'pid':  pid,
+                'tid':  record.thread_id,
+                'args': {k: v if isinstance(v, (int, float, bool, str)) or v is None else str(v) for k, v in record.attrs.items()},
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path: str) -> str:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+    def log_summary(self) -> None:
+        for name, s in self.summary().items():
+            logger.trace(
+                f"Span '{name[:40]:40}' count {s['count']:6}  total {s['total_ms']:12_.3f} ms  "
+                f"p50 {s['p50_ms']:10_.3f} ms  p95 {s['p95_ms']:10_.3f} ms"
+            )
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attrs) -> Span | _NoopSpan:
+    '''
+    A span of the process tracer, or a no-op one while tracing is off.
+    '''
+    if not tracer.enabled:
+        return _NOOP_SPAN
+    return Span(tracer, name, attrs)
+
+
+def current_span() -> Span | _NoopSpan:
+    current = _current.get()
+    return _NOOP_SPAN if current is None else current
+
+
+def annotate(**attrs) -> None:
+    '''
+    Sets attributes, e.g. rows=..., on the innermost open span.
+    '''
+    current = _current.get()
+    if current is not None:
+        current.attrs.update(attrs)
+
+
+def _format_elapsed(elapsed_ns: int, unit: str) -> str:
+    match unit:
+        case 'us':
+            return f"{elapsed_ns // 1000:12_}"
+        case 's':
+            return f"{elapsed_ns / 1e9:12_.3f}"
+        case 'ms' | _:
+            return f"{elapsed_ns / 1e6:12_.3f}"
+
+
+def trace_elapsed(unit='ms', name: Optional[str] = None):
+    '''
+    Traces each call of the decorated function as a span named after it, and
+    logs its elapsed time in unit at TRACE level.
+    '''
     def decorator(func):
+        span_name = name or f"{func.__module__.removeprefix('app.')}.{func.__qualname__}"
+
+        @wraps(func)
         def wrapper(*args, **kwargs):
-            start_time = time.time()
-            result = func(*args, **kwargs)
-            end_time = time.time()
-            match unit:
-                case 'us':
-                    elapsed_time = int((end_time - start_time) * 1000_000)
-                    formatted_time = f"{elapsed_time:12_}"
-                case 's':
-                    elapsed_time = end_time - start_time
-                    formatted_time = f"{elapsed_time:12_.3f}"
-                case 'ms' | _:
-                    elapsed_time = (end_time - start_time) * 1000
-                    formatted_time = f"{elapsed_time:12_.3f}"
-
-            logger.trace(f"Function '{func.__name__[:20]:20}' executed in {formatted_time} {unit}")
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+
+            with Span(tracer, span_name, {}) as s:
+                result = func(*args, **kwargs)
+            logger.trace(f"Function '{func.__name__[:20]:20}' executed in {_format_elapsed(s.end_ns - s.start_ns, unit)} {unit}")
             return result
         return wrapper
     return decorator
@@ -28,7 +263,9 @@ def trace_elapsed(unit='ms'):
 
 @trace_elapsed()
 def _example():
-    time.sleep(1.05)
+    with span('example.sleep', seconds=1.05):
+        time.sleep(1.05)
+    annotate(rows=0)
 
 
 if __name__ == '__main__':
@@ -36,4 +273,7 @@ if __name__ == '__main__':
     logger.remove()
     logger.add(sys.stdout, level='TRACE')
     logger.add('tracing.log', level='TRACE')
+    tracer.enable()
     _example()
+    tracer.log_summary()
+    tracer.write_chrome_trace('tracing.json')
@@ -8,9 +8,18 @@ CREATE TABLE feed_daily (
         collection_performance FLOAT, 
         close NUMERIC(10, 3) NOT NULL, 
         previous_close NUMERIC(10, 3) NOT NULL, 
+        previous_volume BIGINT NOT NULL, 
+        volume BIGINT NOT NULL, 
         gain FLOAT NOT NULL, 
+        volume_gain FLOAT NOT NULL, 
         next_open NUMERIC(10, 3), 
         next_close NUMERIC(10, 3), 
+        return_1d FLOAT, 
+        return_3d FLOAT, 
+        return_5d FLOAT, 
+        return_10d FLOAT, 
+        return_20d FLOAT, 
+        max_drawdown FLOAT, 
         PRIMARY KEY (code, trade_day, filter_id), 
         FOREIGN KEY(code) REFERENCES stock (code)
 )
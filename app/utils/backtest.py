@@ -1,29 +1,42 @@
 import random
 import math
+import time
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import numpy as np
+
+
+def poisson_rate(probability, duration=30):
+    """
+    Rate (per minute) of a Poisson process with the given probability of at least one event in duration.
+    """
+    if probability <= 0 or probability >= 1:
+        raise ValueError("Probability must be between 0 and 1.")
+
+    # Calculate total lambda to achieve the desired probability of at least one event
+    lambda_total = -math.log(1 - probability)
+
+    return lambda_total / duration
+
 
 def simulate_poisson_events(probability, duration=30):
     """
     Simulates events in a Poisson process with a specified probability of at least one event occurring within the duration.
-    
+
     Parameters:
     probability (float): The probability (0 < x < 1) of at least one event occurring in the given duration.
     duration (int): The total time period in minutes (default is 30 minutes).
-    
+
     Returns:
     list: A sorted list of event times (in minutes) within the duration.
     """
-    if probability <= 0 or probability >= 1:
-        raise ValueError("Probability must be between 0 and 1.")
-    
-    # Calculate total lambda to achieve the desired probability of at least one event
-    lambda_total = -math.log(1 - probability)
-    
     # Rate parameter for the Poisson process (per minute)
-    rate = lambda_total / duration
-    
+    rate = poisson_rate(probability, duration)
+
     events = []
     current_time = 0.0
-    
+
     # Generate events using exponential inter-arrival times
     while True:
         inter_arrival = random.expovariate(rate)
@@ -31,11 +44,111 @@ def simulate_poisson_events(probability, duration=30):
         if current_time > duration:
             break
         events.append(current_time)
-    
+
     return events
 
-# Example usage:
-event_probability = 0.7  # 70% chance of at least one event in 30 minutes
-event_times = simulate_poisson_events(event_probability)
-print(f"Event times (minutes): {event_times}")
-print(f"Number of events: {len(event_times)}")
\ No newline at end of file
+
+@dataclass
+class RaggedEvents:
+    """
+    Event times of many paths stored flat.
+
+    Events of path i are values[offsets[i]:offsets[i + 1]], sorted ascending.
+    """
+
+    offsets: np.ndarray
+    values: np.ndarray
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    @property
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+
+def simulate_poisson_events_batch(
+    probability,
+    n_paths: int,
+    duration=30,
+    seed: Optional[Union[int, np.random.Generator]] = None,
+) -> RaggedEvents:
+    """
+    Vectorized simulate_poisson_events for n_paths independent paths.
+
+    The event count of each path is drawn first, then all K + 1 exponential
+    inter-arrival times of every path are drawn at once and rescaled to span the
+    duration, which gives the same distribution as drawing until past duration.
+
+    Parameters:
+    probability (float): The probability (0 < x < 1) of at least one event occurring in the given duration.
+    n_paths (int): Number of independent paths.
+    duration (int): The total time period in minutes (default is 30 minutes).
+    seed (int | Generator): Seed or generator for reproducible draws.
+
+    Returns:
+    RaggedEvents: Event times (in minutes) of every path as offsets + values.
+    """
+    lambda_total = poisson_rate(probability, duration) * duration
+    rng = np.random.default_rng(seed)
+
+    counts = rng.poisson(lambda_total, size=n_paths)
+    spans = counts + 1
+
+    # all inter-arrival times of all paths at once
+    gaps = rng.exponential(1.0, size=int(spans.sum()))
+    path = np.repeat(np.arange(n_paths), spans)
+
+    ends = np.cumsum(spans)
+    csum = np.cumsum(gaps)
+    base = np.zeros(n_paths)
+    base[1:] = csum[ends[:-1] - 1]
+    total = csum[ends - 1] - base
+
+    times = (csum - base[path]) / total[path] * duration
+
+    # the last spacing of each path only closes the interval
+    keep = np.ones(len(times), dtype=bool)
+    keep[ends - 1] = False
+
+    offsets = np.zeros(n_paths + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    return RaggedEvents(offsets=offsets, values=times[keep])
+
+
+def benchmark(probability=0.7, n_paths=1_000_000, duration=30, seed=0):
+    """
+    Times the scalar and the batched simulator on the same number of paths.
+    """
+    random.seed(seed)
+    start = time.perf_counter()
+    scalar_events = sum(len(simulate_poisson_events(probability, duration)) for _ in range(n_paths))
+    scalar_secs = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = simulate_poisson_events_batch(probability, n_paths, duration, seed=seed)
+    batch_secs = time.perf_counter() - start
+
+    return {
+        'n_paths':          n_paths,
+        'scalar_secs':      round(scalar_secs, 3),
+        'batch_secs':       round(batch_secs, 3),
+        'speedup':          round(scalar_secs / batch_secs, 1),
+        'scalar_mean':      scalar_events / n_paths,
+        'batch_mean':       float(batch.counts.mean()),
+        'expected_mean':    -math.log(1 - probability),
+    }
+
+
+if __name__ == '__main__':
+    # Example usage:
+    event_probability = 0.7  # 70% chance of at least one event in 30 minutes
+    event_times = simulate_poisson_events(event_probability)
+    print(f"Event times (minutes): {event_times}")
+    print(f"Number of events: {len(event_times)}")
+
+    print(benchmark(event_probability))
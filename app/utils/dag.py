@@ -0,0 +1,200 @@
+"""
+Dependency graph of pipeline tasks, run concurrently.
+
+Each task declares the resources it reads (inputs) and writes (outputs),
+e.g. tables or in-memory results. A task runs after every earlier task that
+writes one of its inputs or outputs, or reads one of its outputs, so tasks
+touching different resources run at the same time on a worker pool and the
+wall-clock time of the run approaches its critical path:
+
+    graph = TaskGraph()
+    graph.add('stock_daily', lambda: ..., outputs=['stock_daily'])
+    graph.add('collection_daily', lambda: ..., outputs=['collection_daily'])
+    graph.add('filter', lambda: ..., inputs=['stock_daily', 'collection_daily'], outputs=['picks'])
+    report = graph.run(workers=4)
+
+Dependencies only point to tasks added before, so the graph is acyclic by
+construction. When a task fails, the tasks depending on it are skipped, the
+others still run, and the first failure is raised once all are done.
+"""
+
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from app.profile.tracer import span
+
+
+@dataclass
+class Task:
+    name:           str
+    func:           Callable[[], Any]
+    inputs:         Tuple[str, ...]         = ()
+    outputs:        Tuple[str, ...]         = ()
+    depends_on:     Set[str]                = field(default_factory=set)
+
+
+@dataclass
+class TaskRun:
+    name:           str
+    # seconds since the start of the graph run
+    start:          float                   = 0.0
+    end:            float                   = 0.0
+    ok:             bool                    = False
+    skipped:        bool                    = False
+    error:          Optional[str]           = None
+
+    @property
+    def elapsed(self) -> float:
+        return self.end - self.start
+
+
+@dataclass
+class GraphReport:
+    runs:           Dict[str, TaskRun]
+    wall:           float
+    critical_path:  List[str]
+
+    @property
+    def critical_seconds(self) -> float:
+        return sum(self.runs[name].elapsed for name in self.critical_path)
+
+    @property
+    def busy_seconds(self) -> float:
+        return sum(run.elapsed for run in self.runs.values())
+
+    def format(self) -> str:
+        lines = [f"{'task':28} {'start':>8} {'elapsed':>9}  status"]
+        for run in sorted(self.runs.values(), key=lambda r: (r.skipped, r.start)):
+            status = 'skipped' if run.skipped else ('ok' if run.ok else f"failed {run.error}")
+            mark = '*' if run.name in self.critical_path else ' '
+            lines.append(f"{mark}{run.name:27} {run.start:8.3f} {run.elapsed:9.3f}  {status}")
+        lines.append(
+            f"wall {self.wall:.3f} s, critical path {self.critical_seconds:.3f} s ({' -> '.join(self.critical_path)}), "
+            f"{self.busy_seconds:.3f} s of task time"
+        )
+        return '\n'.join(lines)
+
+
+class TaskFailed(RuntimeError):
+    '''
+    A task of the graph failed, raised from its error once the graph is done.
+    '''
+
+
+class TaskGraph:
+    def __init__(self):
+        self.tasks: Dict[str, Task] = {}
+        self.results: Dict[str, Any] = {}
+
+    def add(
+        self,
+        name: str,
+        func: Callable[[], Any],
+        inputs: Iterable[str] = (),
+        outputs: Iterable[str] = (),
+        after: Iterable[str] = (),
+    ) -> Task:
+        '''
+        Adds a task after every earlier task it conflicts with, and the ones named in after.
+        '''
+        if name in self.tasks:
+            raise ValueError(f"Task {name} already in the graph")
+        unknown = set(after) - self.tasks.keys()
+        if unknown:
+            raise ValueError(f"Task {name} after unknown tasks {', '.join(sorted(unknown))}")
+
+        task = Task(name, func, tuple(inputs), tuple(outputs), set(after))
+        for other in self.tasks.values():
+            reads_written = set(task.inputs) & set(other.outputs)
+            writes_touched = set(task.outputs) & (set(other.inputs) | set(other.outputs))
+            if reads_written or writes_touched:
+                task.depends_on.add(other.name)
+        self.tasks[name] = task
+        return task
+
+    def dependents(self, name: str) -> Set[str]:
+        '''
+        Tasks depending on name, transitively.
+        '''
+        found: Set[str] = set()
+        for task in self.tasks.values():
+            if task.depends_on & ({name} | found):
+                found.add(task.name)
+        return found
+
+    def critical_path(self, runs: Dict[str, TaskRun]) -> List[str]:
+        '''
+        The chain of dependent tasks with the longest total elapsed time.
+        '''
+        longest: Dict[str, Tuple[float, List[str]]] = {}
+        for task in self.tasks.values():
+            before = max((longest[d] for d in task.depends_on), key=lambda x: x[0], default=(0.0, []))
+            longest[task.name] = (before[0] + runs[task.name].elapsed, before[1] + [task.name])
+        return max(longest.values(), key=lambda x: x[0], default=(0.0, []))[1]
+
+    def _call(self, task: Task, start: float, run: TaskRun) -> Any:
+        run.start = time.perf_counter() - start
+        try:
+            with span(f"dag.{task.name}"):
+                return task.func()
+        finally:
+            run.end = time.perf_counter() - start
+
+    def run(self, workers: int = 4) -> GraphReport:
+        '''
+        Runs every task once its dependencies succeeded, up to workers at a time.
+        '''
+        start = time.perf_counter()
+        runs = {name: TaskRun(name) for name in self.tasks}
+        pending = dict(self.tasks)
+        done: Set[str] = set()
+        failed: Optional[BaseException] = None
+        running: Dict[Future, Task] = {}
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='dag') as pool:
+            while pending or running:
+                for task in [t for t in pending.values() if t.depends_on <= done]:
+                    del pending[task.name]
+                    # tasks' spans nest under the caller's
+                    context = contextvars.copy_context()
+                    running[pool.submit(context.run, self._call, task, start, runs[task.name])] = task
+
+                if not running:
+                    # the rest depends on failed tasks
+                    for name in pending:
+                        runs[name].skipped = True
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    run = runs[task.name]
+                    try:
+                        self.results[task.name] = future.result()
+                        run.ok = True
+                        done.add(task.name)
+                    except Exception as e:
+                        run.error = repr(e)
+                        failed = failed or e
+                        skipped = self.dependents(task.name)
+                        logger.error(f"Task {task.name} failed: {e!r}, skipping {', '.join(sorted(skipped)) or 'nothing'}")
+                        for name in skipped:
+                            if name in pending:
+                                runs[name].skipped = True
+                                del pending[name]
+
+        report = GraphReport(
+            runs=runs,
+            wall=time.perf_counter() - start,
+            critical_path=self.critical_path(runs),
+        )
+        logger.success(f"Task graph of {len(self.tasks)} tasks on {workers} workers\n{report.format()}")
+
+        if failed is not None:
+            raise TaskFailed(f"{sum(not r.ok and not r.skipped for r in runs.values())} of {len(runs)} tasks failed") from failed
+        return report
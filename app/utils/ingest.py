@@ -16,7 +16,55 @@ from app.db.ingest import (
     refresh_stock_daily,
     refresh_collection_daily,
 )
-from app.profile.tracer import trace_elapsed
+from app.profile.tracer import annotate, trace_elapsed
+
+
+@trace_elapsed(unit='s')
+def fill_history(engine: Engine, up_to_date: date) -> None:
+    '''
+    Loads the history of every stock whose latest trade day is 2+ trade days before up_to_date.
+    '''
+
+    with Session(engine) as session:
+        latest_trade_day_subquery = (
+            select(StockDaily.trade_day)
+                .where(StockDaily.code == Stock.code)
+                .order_by(StockDaily.trade_day.desc())
+                .limit(1)
+                .correlate(Stock)
+                .scalar_subquery()
+        )
+
+        db_latest_dates = session.execute(
+            select(
+                Stock.code,
+                StockDaily.trade_day.label('latest_trade_day')
+            ).join(StockDaily, Stock.code == StockDaily.code)
+            .where(StockDaily.trade_day == latest_trade_day_subquery)
+        ).fetchall()
+
+    # fill hist only when gap is >= 2 days
+    start_day_map = {}
+    # refresh stock daily if only 1 day missing
+    # start_day_map_single = {}
+    
+    for row in db_latest_dates:
+        code, db_latest_trade_day = row
+
+        if db_latest_trade_day is None:
+            continue
+        
+        supposed_next_trade_day = next_trade_day(db_latest_trade_day, inclusive=False)
+        if supposed_next_trade_day > up_to_date:
+            continue
+
+        if up_to_date - supposed_next_trade_day >= timedelta(days=2):
+            start_day_map[code] = supposed_next_trade_day
+        # else:
+        #     start_day_map_single[code] = supposed_next_trade_day
+    
+    annotate(hist_codes=len(start_day_map))
+    load_individual_stock_daily_hist(engine, start_day_map, up_to_date)
 
 
 @trace_elapsed(unit='s')
@@ -40,56 +88,17 @@ def auto_fill(
         yes=yes,
     )
 
-    with Session(engine) as session:
+    # history
+    if not skip_hist_fill:
+        fill_history(engine, up_to_date)
+
+    #
+    refresh_stock_daily(engine, up_to_date)
+
+    #
+    refresh_collection_daily(engine, CollectionType.INDUSTRY_BOARD, up_to_date)
 
-        # history
-        if not skip_hist_fill:
-            latest_trade_day_subquery = (
-                select(StockDaily.trade_day)
-                    .where(StockDaily.code == Stock.code)
-                    .order_by(StockDaily.trade_day.desc())
-                    .limit(1)
-                    .correlate(Stock)
-                    .scalar_subquery()
-            )
-
-            db_latest_dates = session.execute(
-                select(
-                    Stock.code,
-                    StockDaily.trade_day.label('latest_trade_day')
-                ).join(StockDaily, Stock.code == StockDaily.code)
-                .where(StockDaily.trade_day == latest_trade_day_subquery)
-            ).fetchall()
-
-            # fill hist only when gap is >= 2 days
-            start_day_map = {}
-            # refresh stock daily if only 1 day missing
-            # start_day_map_single = {}
-            
-            for row in db_latest_dates:
-                code, db_latest_trade_day = row
-
-                if db_latest_trade_day is None:
-                    continue
-                
-                supposed_next_trade_day = next_trade_day(db_latest_trade_day, inclusive=False)
-                if supposed_next_trade_day > up_to_date:
-                    continue
-
-                if up_to_date - supposed_next_trade_day >= timedelta(days=2):
-                    start_day_map[code] = supposed_next_trade_day
-                # else:
-                #     start_day_map_single[code] = supposed_next_trade_day
-            
-            load_individual_stock_daily_hist(engine, start_day_map, up_to_date)
-
-        #
-        refresh_stock_daily(engine, up_to_date)
-
-        #
-        refresh_collection_daily(engine, CollectionType.INDUSTRY_BOARD, up_to_date)
-
-        logger.success("Auto fill history data")
+    logger.success("Auto fill history data")
 
 
 
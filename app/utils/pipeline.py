@@ -0,0 +1,146 @@
+"""
+The `run -t all` pipeline as a task graph, see app.utils.dag. Each task runs
+after the ones it needs:
+
+    ingest.history
+    ingest.stock_daily          ingest.history
+    ingest.collection_daily
+    update.mv_previous          ingest.history
+    update.mv_today             ingest.stock_daily
+    update.ma250                ingest.stock_daily, update.mv_previous
+    filter                      update.ma250, ingest.collection_daily
+    feed                        filter
+    label, display              feed
+    backtest_state              label
+
+Tasks run on their own pooled connections, so what they ask the run context
+(the materialized view catalog, close times, the code to market map) is
+loaded on the calling thread while the graph is built.
+
+Derived steps skip themselves when built from the current data versions, see
+app.db.version: the views, ma250, and the filter with the feed refresh, which
+then reads the day's picks back from feed_daily.
+"""
+
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+from loguru import logger
+
+from app.constant.collection import CollectionType
+from app.constant.confirm import confirms_execution
+from app.db.context import RunContext
+from app.utils.dag import TaskGraph
+
+
+load_dotenv(override=True)
+
+
+DEFAULT_WORKERS = 4
+
+
+def pipeline_workers(workers: Optional[int] = None) -> int:
+    return workers or int(os.getenv("PIPELINE_WORKERS") or DEFAULT_WORKERS)
+
+
+def build_run_graph(
+    ctx: RunContext,
+    materialized: bool = True,
+    skip_hist_fill: bool = False,
+    dryrun: bool = False,
+    yes: bool = False,
+) -> TaskGraph:
+    from app.backtest.feed import read_feed_daily, refresh_feed_daily_table
+    from app.backtest.label import label_feed_daily
+    from app.backtest.state import extend_backtest_state
+    from app.db.ingest import refresh_collection_daily, refresh_stock_daily
+    from app.db.models import FeedDaily
+    from app.db.version import is_fresh
+    from app.display.fanout import display_feed
+    from app.filter.tail_scraper import filter_desired, filter_inputs
+    from app.utils.ingest import fill_history
+    from app.utils.update import calculate_ma250
+
+    engine = ctx.engine
+    trade_day = ctx.trade_day
+    graph = TaskGraph()
+
+    confirms_execution(
+        action=f'Auto fill history data up to {trade_day.isoformat()}',
+        yes=yes,
+    )
+
+    # loaded here, read from the workers
+    using_procedure = materialized and ctx.mv_procedure_exists()
+    mv_today = using_procedure and ctx.market_closed()
+    ctx.code_market_map()
+
+    #
+    # ingest
+    if not skip_hist_fill:
+        graph.add('ingest.history', lambda: fill_history(engine, trade_day),
+                  outputs=['stock_daily.history', 'stock_daily.today'])
+    graph.add('ingest.stock_daily', lambda: refresh_stock_daily(engine, trade_day),
+              outputs=['stock_daily.today'])
+    graph.add('ingest.collection_daily', lambda: refresh_collection_daily(engine, CollectionType.INDUSTRY_BOARD, trade_day),
+              outputs=['collection_daily'])
+
+    #
+    # update
+    if using_procedure:
+        graph.add('update.mv_previous', lambda: ctx.mv_fresh(previous=True, bind=engine) or ctx.create_mv(previous=True, bind=engine),
+                  inputs=['stock_daily.history'], outputs=['mv.previous'])
+    if mv_today:
+        # the trade day's own view once its markets closed, by the market table
+        graph.add('update.mv_today', lambda: ctx.mv_fresh(previous=False, bind=engine) or ctx.create_mv(previous=False, bind=engine),
+                  inputs=['stock_daily.history', 'stock_daily.today'], outputs=['mv.today'])
+
+    def ma250():
+        if graph.results.get('update.mv_previous'):
+            logger.info("ma250 skipped, the filter reads the materialized view")
+            return
+        calculate_ma250(engine=engine, trade_day=trade_day)
+
+    graph.add('update.ma250', ma250,
+              inputs=['stock_daily.history', 'stock_daily.today', 'mv.previous'], outputs=['stock_daily.ma250'])
+
+    #
+    # filter
+    def filter_():
+        if not dryrun and is_fresh(engine, FeedDaily.__tablename__, trade_day, filter_inputs(trade_day, materialized)):
+            logger.info(f"feed_daily of {trade_day} already filtered from the current data, skipped")
+            return None
+        return filter_desired(
+            engine=engine,
+            trade_day=trade_day,
+            materialized=materialized,
+            mv_exists=ctx.mv_exists(previous=True) if materialized else None,
+        )
+
+    graph.add('filter', filter_,
+              inputs=['stock_daily.history', 'stock_daily.today', 'stock_daily.ma250', 'collection_daily', 'mv.previous'],
+              outputs=['picks'])
+
+    if not dryrun:
+        def feed():
+            if graph.results['filter'] is None:
+                return read_feed_daily(engine=engine, trade_day=trade_day)
+            return refresh_feed_daily_table(engine=engine, fds=graph.results['filter'], trade_day=trade_day, materialized=materialized)
+
+        graph.add('feed', feed,
+                  inputs=['picks'], outputs=['feed_daily', 'feed.frame'])
+        graph.add('label', lambda: label_feed_daily(engine=engine, trade_day=trade_day),
+                  inputs=['feed_daily', 'stock_daily.history', 'stock_daily.today'], outputs=['feed_daily.labels'])
+        graph.add('backtest_state', lambda: extend_backtest_state(engine=engine, trade_day=trade_day),
+                  inputs=['feed_daily', 'feed_daily.labels', 'stock_daily.history', 'stock_daily.today'], outputs=['backtest_state'])
+    else:
+        graph.add('feed', lambda: FeedDaily.to_dataframe(graph.results['filter']),
+                  inputs=['picks'], outputs=['feed.frame'])
+
+    #
+    # display, its sinks fan out on their own threads
+    graph.add('display', lambda: display_feed(engine=engine, trade_day=trade_day, df=graph.results['feed'], yes=yes),
+              inputs=['feed.frame'], outputs=['display'])
+
+    return graph
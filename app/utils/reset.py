@@ -5,6 +5,7 @@ from sqlalchemy.engine import Engine
 from sqlalchemy.schema import CreateTable, DropTable
 
 from app.constant.confirm import confirms_execution
+from app.db.trade_calendar import refresh_trade_calendar
 from app.db.engine import engine_from_env
 from app.db.materialized_view import init_db_mv
 from app.db.models import MetadataBase
@@ -39,6 +40,7 @@ def reset_db_content(
         logger.info(f'Creating {len(MetadataBase.metadata.tables.keys())} tables in {engine.url.database} at {engine.url.host}')
         MetadataBase.metadata.create_all(engine)
 
+        refresh_trade_calendar(engine)
         init_db_mv(engine)
 
 
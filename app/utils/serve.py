@@ -0,0 +1,303 @@
+"""
+Resident scheduler of the daily pipeline.
+
+`serve` stays up and runs the pipeline, ingest -> update -> filter -> display
+by default, at each market's close time from the market table plus a delay
+for the sources to publish. The interpreter, akshare, the connection pool,
+the trade calendar, the code to market map and the display result cache are
+loaded once instead of on every cron run:
+
+    python app/main.py serve [--delay 10] [--now]
+
+SIGHUP reloads holidays.csv, the close times and the maps, e.g. after
+`run -t load`, keeping the loaded ones if that fails; SIGINT or SIGTERM stop
+once the current run is done. With -t each run's spans are summarized and
+written to their own trace file, then dropped.
+Configured from .env:
+
+    SERVE_DELAY_MINUTES=10
+    SERVE_RETRIES=2
+    SERVE_RETRY_MINUTES=10
+"""
+
+import importlib
+import os
+import signal
+import threading
+import time as timer
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from loguru import logger
+from sqlalchemy.engine import Engine
+
+from app.constant.schedule import TradeCalendar, set_trade_calendar, trade_calendar
+from app.data.provider import get_provider
+from app.db.market import market_close_times
+from app.db.trade_calendar import ensure_trade_calendar
+from app.profile.tracer import span, trace_elapsed, tracer
+
+
+load_dotenv(override=True)
+
+
+DEFAULT_DELAY_MINUTES = 10.0
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_MINUTES = 10.0
+
+# imported on warm up, so the first run pays no import
+PIPELINE_MODULES = (
+    'app.utils.ingest',
+    'app.utils.update',
+    'app.filter.tail_scraper',
+    'app.backtest.feed',
+    'app.backtest.label',
+    'app.backtest.state',
+    'app.display.cache',
+    'app.display.fanout',
+)
+
+# longest sleep, so a suspended host or a changed clock is noticed
+MAX_SLEEP_SECS = 60.0
+
+
+@dataclass
+class Trigger:
+    at:             datetime
+    trade_day:      date
+    markets:        Tuple[str, ...]
+
+
+def next_triggers(
+    close_times: Dict[str, time],
+    now: datetime,
+    delay: timedelta,
+    calendar: TradeCalendar,
+) -> List[Trigger]:
+    '''
+    Next run after now of each distinct close time, earliest first. now is timezone aware.
+    '''
+    by_close: Dict[Tuple[time, str], List[str]] = {}
+    for market, close in close_times.items():
+        by_close.setdefault((close.replace(tzinfo=None), str(close.tzinfo)), []).append(market)
+
+    triggers = []
+    for markets in by_close.values():
+        close = close_times[markets[0]]
+        day = calendar.next(now.astimezone(close.tzinfo).date())
+        while datetime.combine(day, close) + delay <= now:
+            day = calendar.next(day, inclusive=False)
+        triggers.append(Trigger(datetime.combine(day, close) + delay, day, tuple(sorted(markets))))
+    return sorted(triggers, key=lambda t: t.at)
+
+
+def last_closed_day(close_times: Dict[str, time], now: datetime, delay: timedelta, calendar: TradeCalendar) -> date:
+    '''
+    Latest trade day every market has closed on, delay included.
+    '''
+    days = []
+    for close in close_times.values():
+        day = calendar.previous(now.astimezone(close.tzinfo).date())
+        if datetime.combine(day, close) + delay > now:
+            day = calendar.previous(day, inclusive=False)
+        days.append(day)
+    return min(days)
+
+
+class Scheduler:
+    '''
+    Calls run(trade_day, close_times) at every trigger, until stopped.
+    '''
+
+    def __init__(
+        self,
+        engine: Engine,
+        run: Callable[[date, Dict[str, time]], None],
+        delay_minutes: Optional[float] = None,
+        retries: Optional[int] = None,
+        retry_minutes: Optional[float] = None,
+        clock: Callable[[], datetime] = lambda: datetime.now().astimezone(),
+        trace_out: Optional[str] = None,
+    ):
+        if delay_minutes is None:
+            delay_minutes = float(os.getenv("SERVE_DELAY_MINUTES") or DEFAULT_DELAY_MINUTES)
+        if retries is None:
+            retries = int(os.getenv("SERVE_RETRIES") or DEFAULT_RETRIES)
+        if retry_minutes is None:
+            retry_minutes = float(os.getenv("SERVE_RETRY_MINUTES") or DEFAULT_RETRY_MINUTES)
+
+        self.engine = engine
+        self.run = run
+        self.delay = timedelta(minutes=delay_minutes)
+        self.retries = retries
+        self.retry_delay = timedelta(minutes=retry_minutes)
+        self.clock = clock
+        self.trace_out = trace_out
+
+        self.close_times: Dict[str, time] = {}
+        self.runs = 0
+        self.failures = 0
+        self._stop = threading.Event()
+        self._reload = threading.Event()
+        # set with either of the above, to cut a sleep short
+        self._wake = threading.Event()
+
+    #
+    # control, safe from signal handlers and other threads
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def reload(self) -> None:
+        self._reload.set()
+        self._wake.set()
+
+    def _install_signals(self) -> Dict[int, Any]:
+        '''
+        Handlers replaced, to restore once stopped. Only the main thread can install any.
+        '''
+        if threading.current_thread() is not threading.main_thread():
+            return {}
+        handlers = {signal.SIGINT: self.stop, signal.SIGTERM: self.stop}
+        if hasattr(signal, 'SIGHUP'):
+            handlers[signal.SIGHUP] = self.reload
+        return {signum: signal.signal(signum, lambda *_, h=handler: h()) for signum, handler in handlers.items()}
+
+    #
+    # warm state
+    @trace_elapsed(unit='s')
+    def warm(self) -> None:
+        '''
+        Loads what every run needs, once; again on reload.
+        '''
+        from app.display.tdx import code_market_map
+
+        start = timer.perf_counter()
+        self._reload.clear()
+
+        # the previous state stays in place until everything loaded
+        previous = trade_calendar() if self.close_times else None
+        try:
+            set_trade_calendar(None)
+            trade_calendar()
+            ensure_trade_calendar(self.engine, self.clock().date())
+            close_times = market_close_times(self.engine)
+            code_market_map(self.engine, refresh=True)
+
+            get_provider().warm()
+            for module in PIPELINE_MODULES:
+                importlib.import_module(module)
+        except Exception:
+            if previous is not None:
+                set_trade_calendar(previous)
+            raise
+        self.close_times = close_times
+
+        closes = ', '.join(f"{m} {c.isoformat(timespec='minutes')}" for m, c in sorted(self.close_times.items()))
+        logger.success(f"Warmed up in {timer.perf_counter() - start:.2f}s, closes {closes}")
+
+    def rewarm(self) -> bool:
+        '''
+        Warms up, rerunning on failure like run_day; a failed reload keeps the
+        previous state. Whether it warmed up.
+        '''
+        for attempt in range(1 + self.retries):
+            try:
+                self.warm()
+                return True
+            except Exception:
+                logger.exception(f"Warm up failed, attempt {attempt + 1} of {1 + self.retries}")
+                if attempt < self.retries and self._sleep(self.retry_delay.total_seconds()):
+                    return False
+        return False
+
+    #
+    # runs
+    def run_day(self, trade_day: date) -> bool:
+        '''
+        Runs one trade day, rerunning on failure. Whether it succeeded.
+        '''
+        try:
+            for attempt in range(1 + self.retries):
+                start = timer.perf_counter()
+                try:
+                    with span('serve.run', trade_day=trade_day.isoformat(), attempt=attempt + 1):
+                        self.run(trade_day, self.close_times)
+                except Exception:
+                    logger.exception(f"Run for {trade_day} failed, attempt {attempt + 1} of {1 + self.retries}")
+                    if attempt < self.retries and self._sleep(self.retry_delay.total_seconds()):
+                        return False
+                    continue
+
+                self.runs += 1
+                logger.success(f"Run for {trade_day} done in {timer.perf_counter() - start:.1f}s")
+                return True
+
+            self.failures += 1
+            return False
+        finally:
+            self._trace_done(trade_day)
+
+    def _trace_done(self, trade_day: date) -> None:
+        '''
+        Logs the spans of a run, and writes them next to trace_out, then
+        drops them, so a resident process does not keep every run's spans.
+        '''
+        if not tracer.enabled:
+            return
+        tracer.log_summary()
+        if self.trace_out:
+            root, ext = os.path.splitext(self.trace_out)
+            logger.success(f"Chrome trace of {len(tracer.spans)} spans wrote to {tracer.write_chrome_trace(f'{root}-{trade_day}{ext}')}")
+        tracer.reset()
+
+    def _sleep(self, secs: float) -> bool:
+        '''
+        Sleeps unless stopped. Whether it was stopped.
+        '''
+        self._wake.clear()
+        if not (self._stop.is_set() or self._reload.is_set()):
+            self._wake.wait(secs)
+        return self._stop.is_set()
+
+    def _sleep_until(self, at: datetime) -> bool:
+        '''
+        Sleeps until at, in steps of MAX_SLEEP_SECS. Whether it is due, not stopped or reloaded.
+        '''
+        while (remaining := (at - self.clock()).total_seconds()) > 0:
+            if self._sleep(min(remaining, MAX_SLEEP_SECS)) or self._reload.is_set():
+                return False
+        return True
+
+    def serve(self, now: bool = False, max_runs: Optional[int] = None) -> None:
+        '''
+        Runs at every trigger until stopped, or max_runs runs, e.g. in tests.
+        '''
+        previous_handlers = self._install_signals()
+        try:
+            if not self.rewarm():
+                if self._stop.is_set():
+                    return
+                raise Exception("Could not warm up, see the attempts above")
+
+            if now:
+                self.run_day(last_closed_day(self.close_times, self.clock(), self.delay, trade_calendar()))
+
+            while not self._stop.is_set() and (max_runs is None or self.runs + self.failures < max_runs):
+                trigger = next_triggers(self.close_times, self.clock(), self.delay, trade_calendar())[0]
+                logger.info(f"Next run for {trigger.trade_day} at {trigger.at.isoformat(timespec='minutes')}, after the close of {', '.join(trigger.markets)}")
+
+                if not self._sleep_until(trigger.at):
+                    if self._reload.is_set() and not self._stop.is_set():
+                        logger.info("Reloading")
+                        if not self.rewarm():
+                            logger.error("Reload failed, keeping the state of the last warm up")
+                    continue
+                self.run_day(trigger.trade_day)
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+        logger.success(f"Stopped after {self.runs} runs, {self.failures} failed")
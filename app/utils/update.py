@@ -2,80 +2,98 @@ from typing import Optional
 from datetime import date
 
 from loguru import logger
-from sqlalchemy import select, update, func, true, and_
-from sqlalchemy import Select
+from sqlalchemy import select, update, func, and_
+from sqlalchemy import Select, Subquery, Update
 from sqlalchemy.orm import Session
-from sqlalchemy.sql import lateral
 from sqlalchemy.engine import Engine
 
-from app.constant.schedule import is_stock_market_open
+from app.constant.schedule import is_stock_market_open, trade_calendar
+from app.db.trade_calendar import min_window_rows, window_start
 from app.db.engine import engine_from_env
 from app.db.models import Stock, StockDaily
-from app.profile.tracer import trace_elapsed
+from app.db.version import MA_250, Inputs, bump_version, is_fresh, snapshot
+from app.profile.tracer import annotate, trace_elapsed
 
 
-def build_stmt_postgresql(trade_day: date) -> Select:
-    # inner most
-    s = Stock.__table__.alias('s')
-    sd = StockDaily.__table__.alias('sd')
+def ma250_inputs(trade_day: date) -> Inputs:
+    return {StockDaily.__tablename__: (trade_calendar().offset(trade_day, -249), trade_day)}
+
 
-    last_250_inner_subq = (
-        select(StockDaily.close)
-            .select_from(StockDaily)
-            .where(and_(
-                StockDaily.code == s.c.code,
-                StockDaily.trade_day <= trade_day,
-            ))
-            .order_by(StockDaily.trade_day.desc())
-            .limit(250)
-            .correlate(s)
-    ).alias('innermost')
-
-    # lateral subquery rhs
-    ma250_subq = (
-        select(func.avg(last_250_inner_subq.c.close))
-            .scalar_subquery()
-    ).label("ma250")
-
-    row_count_subq = (
-        select(func.count(last_250_inner_subq.c.close))
-            .scalar_subquery()
-    ).label("row_count")
-    
-    # lateral query
-    lateral_query = (
+def build_window_subquery(trade_day: date) -> Subquery:
+    # the last 250 trade days, bounded by date so each code is an index range scan,
+    # averaged over the rows present
+    return (
         select(
-            ma250_subq,
-            row_count_subq,
+            StockDaily.code,
+            func.avg(StockDaily.close).label('ma250'),
+            func.count(StockDaily.close).label('row_count'),
         )
-        .select_from(StockDaily)
-        .where(and_(
-            StockDaily.code == s.c.code,
-            StockDaily.trade_day == trade_day,
-        ))
-        .correlate(s)
-    )
+        .where(StockDaily.trade_day.between(window_start(trade_day, 250), trade_day))
+        .group_by(StockDaily.code)
+    ).subquery('window')
 
-    latest_lateral_subq = lateral(lateral_query).alias('latest')
+
+def build_stmt_postgresql(trade_day: date) -> Select:
+    s = Stock.__table__.alias('s')
+    sd = StockDaily.__table__.alias('sd')
+    window_subq = build_window_subquery(trade_day)
 
     stmt = (
         select(
             s.c.code,
             s.c.name,
-            latest_lateral_subq.c.ma250.label('ma_250')
+            window_subq.c.ma250.label('ma_250')
         )
         .select_from(s)
         .join(sd, s.c.code == sd.c.code)
-        .join(latest_lateral_subq, true())
+        .join(window_subq, s.c.code == window_subq.c.code)
         .where(and_(
             sd.c.trade_day == trade_day,
-            latest_lateral_subq.c.row_count == 250
+            window_subq.c.row_count >= min_window_rows(250)
         ))
     )
 
     return stmt
 
 
+def build_stmt_duckdb(trade_day: date) -> Update:
+    '''
+    One UPDATE ... FROM the window, DuckDB rewrites the column in vectors
+    instead of a statement per code.
+    '''
+    window_subq = build_window_subquery(trade_day)
+
+    return (
+        update(StockDaily)
+        .values(ma_250=window_subq.c.ma250)
+        .where(and_(
+            StockDaily.code == window_subq.c.code,
+            StockDaily.trade_day == trade_day,
+            window_subq.c.row_count >= min_window_rows(250),
+        ))
+        .returning(StockDaily.code)
+    )
+
+
+def calculate_ma250_duckdb(engine: Engine, trade_day: date, dryrun: Optional[bool] = False) -> None:
+    if dryrun:
+        with Session(engine) as session:
+            results = session.execute(build_stmt_postgresql(trade_day)).all()
+        logger.info(f"Calculated a total of {len(results)} ma_250")
+        return
+
+    stmt = build_stmt_duckdb(trade_day)
+    logger.debug(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+
+    with Session(engine) as session:
+        updated = len(session.execute(stmt).all())
+        bump_version(session, MA_250, [trade_day], inputs=snapshot(session, ma250_inputs(trade_day)))
+        session.commit()
+
+    annotate(trade_day=trade_day.isoformat(), codes=updated)
+    logger.success(f"Updated a total of {updated} ma_250 for {trade_day} in db")
+
+
 @trace_elapsed(unit='s')
 def calculate_ma250(engine: Engine, trade_day: Optional[date] = None, dryrun: Optional[bool] = False) -> None:
     if trade_day is None:
@@ -83,9 +101,15 @@ def calculate_ma250(engine: Engine, trade_day: Optional[date] = None, dryrun: Op
 
     assert is_stock_market_open(trade_day)
 
+    if not dryrun and is_fresh(engine, MA_250, trade_day, ma250_inputs(trade_day)):
+        logger.info(f"ma_250 of {trade_day} already calculated from the current stock_daily, skipped")
+        return
+
     # build query
     if engine.dialect.name == 'postgresql':
         stmt = build_stmt_postgresql(trade_day) 
+    elif engine.dialect.name == 'duckdb':
+        return calculate_ma250_duckdb(engine, trade_day, dryrun=dryrun)
     else:
         raise Exception("Not implemented!")
     logger.debug(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
@@ -99,6 +123,7 @@ def calculate_ma250(engine: Engine, trade_day: Optional[date] = None, dryrun: Op
             return
 
         ma_250_dict = {row['code']: row['ma_250'] for row in results}
+        annotate(trade_day=trade_day.isoformat(), codes=len(ma_250_dict))
 
         session.execute(update(StockDaily), 
             [
@@ -106,6 +131,7 @@ def calculate_ma250(engine: Engine, trade_day: Optional[date] = None, dryrun: Op
                 for code, value in ma_250_dict.items()
             ]
         )
+        bump_version(session, MA_250, [trade_day], inputs=snapshot(session, ma250_inputs(trade_day)))
 
         session.commit()
 
@@ -0,0 +1,181 @@
+"""
+Connect and checkout latency of the database pool, per driver and pool option.
+
+By default replays the session pattern of `run -t all` (a dozen short sessions,
+one after another) in-process against the database in .env. With --run-all the
+real task is run in a subprocess for each configuration and the pool stats it
+logs at exit (--pool-stats) are collected instead.
+
+With --writes the per-code history writes of `init` are replayed instead, each
+through add_stock_daily_hist (pipeline mode on psycopg 3) and as plain round
+trips, and rolled back so the database is left as it was.
+
+Usage:
+    PYTHONPATH=. python benchmarks/db_pool.py [--sessions 12] [--json]
+    PYTHONPATH=. python benchmarks/db_pool.py --run-all 2025-03-10
+    PYTHONPATH=. python benchmarks/db_pool.py --writes 50 [--rows 500]
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from app.db.engine import EngineOptions, engine_from_env, instrument_pool
+from app.db.ingest import add_stock_daily_hist
+from app.db.models import Stock, StockDaily
+from app.db.version import bump_version
+
+
+MAIN = os.path.join(os.path.dirname(__file__), '..', 'app', 'main.py')
+
+# name: (option overrides, extra CLI args for --run-all)
+CONFIGS: Dict[str, Tuple[Dict[str, object], List[str]]] = {
+    'psycopg2':             ({'driver': 'postgresql+psycopg2'},                         ['--db-driver', 'postgresql+psycopg2', '--no-pre-ping']),
+    'psycopg2-pre-ping':    ({'driver': 'postgresql+psycopg2', 'pre_ping': True},       ['--db-driver', 'postgresql+psycopg2', '--pre-ping']),
+    'psycopg2-pool-1':      ({'driver': 'postgresql+psycopg2', 'pool_size': 1},         ['--db-driver', 'postgresql+psycopg2', '--pool-size', '1']),
+    'psycopg':              ({'driver': 'postgresql+psycopg'},                          ['--db-driver', 'postgresql+psycopg', '--no-pre-ping']),
+    'psycopg-pre-ping':     ({'driver': 'postgresql+psycopg', 'pre_ping': True},        ['--db-driver', 'postgresql+psycopg', '--pre-ping']),
+}
+
+DRIVER_MODULES = {
+    'postgresql+psycopg2':  'psycopg2',
+    'postgresql+psycopg':   'psycopg',
+}
+
+POOL_STATS_LINE = re.compile(r'Pool stats (\{.*\})')
+
+
+def driver_installed(driver: str) -> bool:
+    return importlib.util.find_spec(DRIVER_MODULES.get(driver, driver)) is not None
+
+
+def replay_sessions(options: EngineOptions, sessions: int) -> Dict[str, float]:
+    '''
+    Opens `sessions` short sessions one after another, like the tasks of run all.
+    '''
+    engine = engine_from_env(options)
+    stats = instrument_pool(engine)
+
+    start = time.perf_counter()
+    for _ in range(sessions):
+        with Session(engine) as session:
+            session.execute(text('SELECT 1'))
+    wall_ms = (time.perf_counter() - start) * 1000
+    engine.dispose()
+
+    return {**stats.summary(), 'wall_ms': round(wall_ms, 3)}
+
+
+# history written by --writes, days before any real data
+WRITES_FIRST_DAY = date(1990, 1, 1)
+
+
+def replay_writes(options: EngineOptions, codes: int, rows: int) -> Dict[str, float]:
+    '''
+    Writes `rows` days of history for `codes` stocks, one transaction per code
+    like load_individual_stock_daily_hist, with and without the pipeline.
+    '''
+    engine = engine_from_env(options)
+    days = [WRITES_FIRST_DAY + timedelta(days=i) for i in range(rows)]
+
+    def history(code: str) -> List[StockDaily]:
+        return [
+            StockDaily(code=code, trade_day=day, open=10, high=11, low=9, close=10, volume=1, turnover=10)
+            for day in days
+        ]
+
+    def plain(session: Session, stock_objs: List[StockDaily]) -> None:
+        session.add_all(stock_objs)
+        session.flush()
+        bump_version(session, StockDaily.__tablename__, [obj.trade_day for obj in stock_objs])
+
+    result: Dict[str, float] = {}
+    with Session(engine) as session:
+        stock_codes = session.execute(select(Stock.code).order_by(Stock.code).limit(codes)).scalars().all()
+        for name, write in (('plain', plain), ('pipeline', add_stock_daily_hist)):
+            histories = [history(code) for code in stock_codes]
+            start = time.perf_counter()
+            for stock_objs in histories:
+                write(session, stock_objs)
+                session.rollback()
+            result[f'{name}_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    engine.dispose()
+
+    return {'codes': len(stock_codes), 'rows': rows, **result}
+
+
+def run_all(args: List[str], trade_day: str) -> Optional[Dict[str, float]]:
+    '''
+    Pool stats of a full `run -t all` in a subprocess.
+    '''
+    env = dict(os.environ)
+    env.setdefault('PYTHONPATH', os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, MAIN, '--pool-stats', *args, 'run', '-t', 'all', '--date', trade_day, '-y', '-s'],
+        capture_output=True, text=True, env=env, stdin=subprocess.DEVNULL,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    match = POOL_STATS_LINE.search(proc.stdout + proc.stderr)
+    if match is None:
+        return None
+    return {**json.loads(match.group(1)), 'wall_ms': round(wall_ms, 3), 'returncode': proc.returncode}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Connect/checkout latency of the database pool per configuration')
+    parser.add_argument('--sessions', type=int, default=12, help='Sessions to replay per configuration')
+    parser.add_argument('--run-all', metavar='DATE', help='Run the full run -t all task for DATE instead of replaying sessions')
+    parser.add_argument('--writes', type=int, metavar='CODES', help='Replay the history writes of CODES stocks instead of sessions')
+    parser.add_argument('--rows', type=int, default=500, help='Days of history per code written by --writes')
+    parser.add_argument('--json', action='store_true', default=False, help='Print machine-readable results')
+    args = parser.parse_args()
+
+    base = EngineOptions.from_env()
+    results: Dict[str, Dict[str, object]] = {}
+    for name, (overrides, cli_args) in CONFIGS.items():
+        options = base.override(**overrides)
+        if not driver_installed(options.driver):
+            results[name] = {'skipped': f'{DRIVER_MODULES[options.driver]} not installed'}
+            continue
+        try:
+            if args.run_all:
+                result = run_all(cli_args, args.run_all)
+            elif args.writes:
+                result = replay_writes(options, args.writes, args.rows)
+            else:
+                result = replay_sessions(options, args.sessions)
+            results[name] = result if result is not None else {'skipped': 'no pool stats logged'}
+        except Exception as e:
+            results[name] = {'skipped': repr(e)}
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        for name, result in results.items():
+            if 'skipped' in result:
+                print(f"{name:20} skipped: {result['skipped']}")
+                continue
+            if args.writes:
+                print(
+                    f"{name:20} {result['codes']:4} codes x {result['rows']:4} rows  "
+                    f"plain {result['plain_ms']:10.1f}ms  pipeline {result['pipeline_ms']:10.1f}ms"
+                )
+                continue
+            print(
+                f"{name:20} connects {result['connects']:3}  checkouts {result['checkouts']:4}  "
+                f"connect p50 {result['connect_ms_p50']:8.3f}ms  checkout p50 {result['checkout_ms_p50']:8.3f}ms  "
+                f"p95 {result['checkout_ms_p95']:8.3f}ms  wall {result['wall_ms']:10.1f}ms"
+            )
@@ -0,0 +1,221 @@
+"""
+End-to-end timings of the daily pipeline on a synthetic universe.
+
+Generates a synthetic market (benchmarks/synthetic.py) into a dedicated local
+PostgreSQL database, then times each stage of `run -t all` against it, with
+the fake data provider serving the same market in place of akshare:
+
+    populate                            COPY of the history, not a pipeline stage
+    load_individual_stock_daily_hist    --hist-codes codes missing their last --hist-days
+    refresh_stock_daily                 the day's snapshot upserted
+    refresh_collection_daily
+    calculate_ma250
+    create_mv_with_trade_day            the previous day's materialized view
+    filter_desired[mv]                  filter on the materialized view
+    filter_desired[lateral]             filter with LATERAL subqueries
+    refresh_feed_daily_table
+
+The database (--database, default BENCH_POSTGRES_DATABASE or
+stock_picker_bench) is created if missing and its public schema is dropped,
+so it must not be the one in POSTGRES_DATABASE.
+
+Usage:
+    PYTHONPATH=. python benchmarks/pipeline.py [--codes 5000] [--years 3] [--json] [-o results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import sqlalchemy
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+import app.db.ingest as ingest
+from app.backtest.feed import refresh_feed_daily_table
+from app.constant.collection import CollectionType
+from app.data.fake import FakeProvider
+from app.data.provider import use_provider
+from app.db.engine import EngineOptions, engine_from_env
+from app.db.materialized_view import daily_create_mv
+from app.filter.tail_scraper import filter_desired
+from app.profile.tracer import tracer
+from app.utils.reset import reset_db_content
+from app.utils.update import calculate_ma250
+from benchmarks.synthetic import SyntheticMarket, populate
+
+
+DEFAULT_DATABASE = 'stock_picker_bench'
+
+
+def prepare_database(options: EngineOptions) -> Engine:
+    '''
+    Creates the benchmark database if missing and resets its schema.
+    '''
+    admin = engine_from_env(options.override(database='postgres'), isolation_level='AUTOCOMMIT')
+    with admin.connect() as connection:
+        exists = connection.execute(text("SELECT 1 FROM pg_database WHERE datname = :name"), {'name': options.database}).scalar()
+        if not exists:
+            connection.execute(text(f'CREATE DATABASE "{options.database}"'))
+    admin.dispose()
+
+    engine = engine_from_env(options)
+    with engine.begin() as connection:
+        connection.execute(text("DROP SCHEMA IF EXISTS public CASCADE"))
+        connection.execute(text("CREATE SCHEMA public"))
+    reset_db_content(engine)
+    return engine
+
+
+def count_rows(engine: Engine, table: str) -> int:
+    with engine.connect() as connection:
+        return connection.execute(text(f"SELECT count(*) FROM {table}")).scalar_one()
+
+
+def timed(func: Callable[[], Any], repeat: int = 1) -> Dict[str, Any]:
+    runs: List[float] = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        runs.append(time.perf_counter() - start)
+    return {
+        'seconds':  round(min(runs), 4),
+        'runs':     [round(r, 4) for r in runs],
+        'result':   result,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_pipeline(engine: Engine, market: SyntheticMarket, hist_codes: int, hist_days: int, repeat: int) -> Dict[str, Dict[str, Any]]:
+    trade_day = market.trade_days[-1]
+    previous_day = market.trade_days[-2]
+
+    # codes listed throughout that miss their last hist_days, loaded back by the hist stage
+    stop_index = len(market.trade_days) - 2 - hist_days
+    candidates = [c for i, c in enumerate(market.codes) if market.present[stop_index:-1, i].all()]
+    stop_days = {code: market.trade_days[stop_index] for code in candidates[:hist_codes]}
+    start_day_map = {code: market.trade_days[stop_index + 1] for code in stop_days}
+
+    stages: Dict[str, Dict[str, Any]] = {}
+
+    stage = timed(lambda: populate(engine, market, previous_day, stop_days, collection_days=[previous_day]))
+    stages['populate'] = {**stage, 'rows': stage.pop('result')}
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text("ANALYZE"))
+
+    with use_provider(FakeProvider(market=market, trade_day=trade_day)):
+        before = count_rows(engine, 'stock_daily')
+        stages['load_individual_stock_daily_hist'] = timed(lambda: ingest.load_individual_stock_daily_hist(engine, start_day_map, previous_day))
+        stages['load_individual_stock_daily_hist']['rows'] = count_rows(engine, 'stock_daily') - before
+
+        before = count_rows(engine, 'stock_daily')
+        stages['refresh_stock_daily'] = timed(lambda: ingest.refresh_stock_daily(engine, trade_day))
+        stages['refresh_stock_daily']['rows'] = count_rows(engine, 'stock_daily') - before
+
+        stages['refresh_collection_daily'] = timed(lambda: ingest.refresh_collection_daily(engine, CollectionType.INDUSTRY_BOARD, trade_day))
+
+    stages['calculate_ma250'] = timed(lambda: calculate_ma250(engine, trade_day))
+    stages['create_mv_with_trade_day'] = timed(lambda: daily_create_mv(engine, trade_day, previous=True))
+
+    stage = timed(lambda: filter_desired(engine, trade_day, materialized=True, mv_exists=True), repeat)
+    fds = stage.pop('result')
+    stages['filter_desired[mv]'] = {**stage, 'rows': len(fds)}
+
+    stage = timed(lambda: filter_desired(engine, trade_day, materialized=False), repeat)
+    stages['filter_desired[lateral]'] = {**stage, 'rows': len(stage.pop('result'))}
+
+    # nothing to insert when the synthetic day has no picks
+    if fds:
+        stages['refresh_feed_daily_table'] = timed(lambda: refresh_feed_daily_table(engine, fds, trade_day))
+        stages['refresh_feed_daily_table']['rows'] = len(fds)
+
+    for stage in stages.values():
+        stage.pop('result', None)
+    return stages
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the daily pipeline stages on a synthetic universe')
+    parser.add_argument('--codes', type=int, default=5000, help='Stocks in the universe')
+    parser.add_argument('--years', type=float, default=3, help='Years of history')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--hist-codes', type=int, default=200, help='Codes whose recent history is loaded code by code')
+    parser.add_argument('--hist-days', type=int, default=20, help='Trade days of history those codes miss')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of the read-only filter stages, the fastest is reported')
+    parser.add_argument('--database', default=os.getenv('BENCH_POSTGRES_DATABASE') or DEFAULT_DATABASE, help='Benchmark database, reset on every run')
+    parser.add_argument('--json', action='store_true', default=False, help='Print machine-readable results')
+    parser.add_argument('-o', '--output', default=None, help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+
+    options = EngineOptions.from_env()
+    if args.database == options.database:
+        sys.exit(f"Refusing to reset {args.database}, it is POSTGRES_DATABASE")
+    options = options.override(database=args.database)
+
+    generate = timed(lambda: SyntheticMarket(args.codes, args.years, seed=args.seed))
+    market = generate['result']
+    engine = prepare_database(options)
+
+    tracer.enable()
+    stages = run_pipeline(engine, market, args.hist_codes, args.hist_days, args.repeat)
+
+    with engine.connect() as connection:
+        server_version = connection.execute(text("SHOW server_version")).scalar()
+
+    results = {
+        'benchmark':    'pipeline',
+        'created':      datetime.now().isoformat(timespec='seconds'),
+        'revision':     git_revision(),
+        'params': {
+            'codes':        args.codes,
+            'years':        args.years,
+            'seed':         args.seed,
+            'hist_codes':   args.hist_codes,
+            'hist_days':    args.hist_days,
+            'repeat':       args.repeat,
+        },
+        'environment': {
+            'python':       platform.python_version(),
+            'sqlalchemy':   sqlalchemy.__version__,
+            'driver':       engine.dialect.driver,
+            'postgresql':   server_version,
+        },
+        'data': {
+            'trade_days':       len(market.trade_days),
+            'trade_day':        market.trade_days[-1].isoformat(),
+            'stock_daily_rows': count_rows(engine, 'stock_daily'),
+            'generate_seconds': generate['seconds'],
+        },
+        'stages':       stages,
+        'spans':        tracer.summary(),
+    }
+    engine.dispose()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print(f"{args.codes} codes x {len(market.trade_days)} trade days, {results['data']['stock_daily_rows']:_} stock_daily rows")
+        for name, stage in stages.items():
+            rows = stage.get('rows')
+            print(f"{name:36} {stage['seconds']:10.3f}s  {'' if rows is None else f'{rows:>10_} rows'}")
@@ -0,0 +1,121 @@
+"""
+Startup budget of each subcommand.
+
+Every case runs app/main.py in a fresh interpreter with `-X importtime`, sums the
+import time, checks the modules that must stay unimported and measures the time
+to the first line of output. Exits non-zero when a budget is exceeded.
+
+Usage:
+    PYTHONPATH=. python benchmarks/startup.py [--json] [--scale 1.5]
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+
+MAIN = os.path.join(os.path.dirname(__file__), '..', 'app', 'main.py')
+
+HEAVY_MODULES = ('akshare', 'gspread', 'gspread_formatting', 'google', 'pandas', 'numpy')
+
+# name: (argv, import budget ms, first output budget ms, modules that must not be imported)
+CASES: Dict[str, Tuple[List[str], float, float, Tuple[str, ...]]] = {
+    'version':          (['--version'],                 250,    400,    HEAVY_MODULES + ('sqlalchemy',)),
+    'help':             (['--help'],                    250,    400,    HEAVY_MODULES + ('sqlalchemy',)),
+    'run-help':         (['run', '--help'],             250,    400,    HEAVY_MODULES + ('sqlalchemy',)),
+    'init-dryrun':      (['-vv', 'init', '--dryrun'],   600,    800,    HEAVY_MODULES),
+}
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def parse_importtime(stderr: str) -> Tuple[float, List[str]]:
+    '''
+    Total self import time in ms and every imported module name.
+    '''
+    total_us = 0
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            total_us += int(match.group(1))
+            modules.append(match.group(4))
+    return total_us / 1000, modules
+
+
+def run_case(argv: List[str]) -> Dict[str, object]:
+    env = dict(os.environ)
+    env.setdefault('PYTHONPATH', os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+    # stderr to a file, a full pipe would block the child before its first output
+    with tempfile.TemporaryFile(mode='w+') as stderr_file:
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, '-X', 'importtime', MAIN, *argv],
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            stdin=subprocess.DEVNULL,
+            text=True,
+            env=env,
+        )
+        assert proc.stdout is not None
+        first_line = proc.stdout.readline()
+        first_output_ms = (time.perf_counter() - start) * 1000
+        proc.communicate()
+        wall_ms = (time.perf_counter() - start) * 1000
+
+        stderr_file.seek(0)
+        stderr = stderr_file.read()
+
+    import_ms, modules = parse_importtime(stderr)
+    return {
+        'returncode':       proc.returncode,
+        'first_line':       first_line.strip(),
+        'first_output_ms':  round(first_output_ms, 1),
+        'wall_ms':          round(wall_ms, 1),
+        'import_ms':        round(import_ms, 1),
+        'modules':          modules,
+    }
+
+
+def check(scale: float = 1.0) -> Dict[str, Dict[str, object]]:
+    results = {}
+    for name, (argv, import_budget, output_budget, forbidden) in CASES.items():
+        result = run_case(argv)
+        top_level = {m.split('.')[0] for m in result.pop('modules')} # type: ignore
+        imported = sorted(top_level.intersection(forbidden))
+
+        failures = []
+        if result['import_ms'] > import_budget * scale: # type: ignore
+            failures.append(f"import {result['import_ms']}ms > {import_budget * scale}ms")
+        if result['first_output_ms'] > output_budget * scale: # type: ignore
+            failures.append(f"first output {result['first_output_ms']}ms > {output_budget * scale}ms")
+        if imported:
+            failures.append(f"imported {imported}")
+
+        results[name] = {**result, 'argv': argv, 'failures': failures}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check startup budgets of each subcommand')
+    parser.add_argument('--json', action='store_true', default=False, help='Print machine-readable results')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply every time budget, e.g. on slow CI')
+    args = parser.parse_args()
+
+    results = check(args.scale)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        for name, result in results.items():
+            status = 'FAIL' if result['failures'] else 'ok'
+            print(f"{name:16} {status:4} import {result['import_ms']:8.1f}ms  first output {result['first_output_ms']:8.1f}ms  {'; '.join(result['failures'])}") # type: ignore
+
+    sys.exit(1 if any(r['failures'] for r in results.values()) else 0)
@@ -0,0 +1,106 @@
+"""
+Synthetic A-share universe loaded into a database for benchmarks.
+
+The universe itself, app.data.synthetic.SyntheticMarket, is also what the fake
+data provider serves; populate() bulk loads its history with COPY.
+
+Usage:
+    PYTHONPATH=. python benchmarks/synthetic.py --codes 5000 --years 2
+"""
+
+import argparse
+import io
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+from pandas import DataFrame
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.constant.collection import CollectionType
+from app.data.synthetic import SyntheticMarket
+from app.db.models import Collection, CollectionDaily, Market, RelationCollectionStock, Stock, StockDaily
+
+
+MARKETS = [
+    Market(id=1, name='Shanghai Stock Exchange',    name_short='SSE',   country='CN', currency='CNY'),
+    Market(id=2, name='Shenzhen Stock Exchange',    name_short='SZSE',  country='CN', currency='CNY'),
+    Market(id=3, name='Beijing Stock Exchange',     name_short='BSE',   country='CN', currency='CNY'),
+]
+
+
+def copy_frame(engine: Engine, table: str, df: DataFrame) -> None:
+    '''
+    COPY df into table, with psycopg2 or psycopg (v3).
+    '''
+    buffer = io.StringIO()
+    df.to_csv(buffer, header=False, index=False, float_format='%.10g')
+    buffer.seek(0)
+    columns = ', '.join(df.columns)
+    sql = f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)"
+
+    with engine.begin() as connection:
+        dbapi_connection = connection.connection.dbapi_connection
+        cursor = dbapi_connection.cursor() # type: ignore
+        if engine.dialect.driver == 'psycopg':
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+        else:
+            cursor.copy_expert(sql, buffer)
+        cursor.close()
+
+
+def populate(
+    engine: Engine,
+    market: SyntheticMarket,
+    end_day: date,
+    stop_days: Optional[Dict[str, date]] = None,
+    collection_days: Iterable[date] = (),
+) -> int:
+    '''
+    Loads markets, stocks, boards and the stock_daily history up to end_day,
+    returns the stock_daily rows loaded.
+    '''
+    with Session(engine) as session:
+        session.add_all([Market(**{c.key: getattr(m, c.key) for c in Market.__table__.columns}) for m in MARKETS])
+        session.flush()
+        session.execute(insert(Stock), market.stocks[['code', 'name', 'market_id']].to_dict(orient='records'))
+        session.execute(insert(Collection), [
+            {'code': code, 'name': name, 'type': CollectionType.INDUSTRY_BOARD}
+            for code, name in zip(market.boards['code'], market.boards['name'])
+        ])
+        session.execute(insert(RelationCollectionStock), [
+            {'collection_code': board, 'stock_code': code}
+            for code, board in zip(market.stocks['code'], market.stocks['board'])
+        ])
+        for day in collection_days:
+            session.execute(insert(CollectionDaily), [
+                {**row, 'trade_day': day} for row in market.collection_frame(day).to_dict(orient='records')
+            ])
+        session.commit()
+
+    rows = 0
+    for df in market.stock_daily_frames(end_day, stop_days):
+        if engine.dialect.name == 'postgresql':
+            copy_frame(engine, StockDaily.__tablename__, df)
+        else:
+            with Session(engine) as session:
+                session.execute(insert(StockDaily), df.to_dict(orient='records'))
+                session.commit()
+        rows += df.shape[0]
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summary of a synthetic universe')
+    parser.add_argument('--codes', type=int, default=5000)
+    parser.add_argument('--years', type=float, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    market = SyntheticMarket(args.codes, args.years, seed=args.seed)
+    last_day = market.trade_days[-1]
+    print(f"{len(market.trade_days)} trade days to {last_day}, {market.present.sum():_} stock days")
+    print(market.stocks.groupby('market_id').size().to_dict(), f"{market.stocks['name'].str.contains('ST').sum()} ST")
+    print(market.daily_frame(last_day).describe().T[['mean', 'min', 'max']])
@@ -0,0 +1,108 @@
+import os
+from datetime import date
+
+import numpy as np
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.backtest.panel import PricePanel, load_price_panel
+from app.constant.schedule import trade_calendar
+from app.db.archive import (
+    MIN_KEEP_DAYS,
+    archive_cutoff,
+    archive_stock_daily,
+    archived_months,
+    partition_path,
+    read_stock_daily,
+)
+from app.db.models import Stock, StockDaily
+
+
+TRADE_DAY = date(2025, 3, 10)
+
+
+# --- Pytest Fixtures ---
+
+@pytest.fixture
+def engine(engine):
+    '''
+    300 trade days of 600000 and 600001, 600002 suspended since its tenth day.
+    '''
+    calendar = trade_calendar()
+    days = calendar.range(calendar.offset(TRADE_DAY, -299), TRADE_DAY)
+
+    with Session(engine) as session:
+        session.add_all([
+            Stock(code='600001', name='B', market_id=1),
+            Stock(code='600002', name='C', market_id=1),
+        ])
+        for i, day in enumerate(days):
+            for code in ('600000', '600001', '600002')[:3 if i < 10 else 2]:
+                session.add(StockDaily(
+                    code=code, trade_day=day, open=10 + i / 100, high=11, low=9,
+                    close=10 + i / 1000, volume=1000 + i, ma_250=None if i % 2 else 10.5,
+                ))
+        session.commit()
+    return engine
+
+
+def everything(engine, directory):
+    return read_stock_daily(engine, date(2023, 1, 1), TRADE_DAY, ['open', 'close', 'volume', 'ma_250'], directory=directory)
+
+
+# --- Test Functions ---
+
+def test_archive_and_read_back(engine, tmp_path):
+    directory = str(tmp_path)
+    before = archive_cutoff(TRADE_DAY)
+    original = everything(engine, directory)
+    assert original.shape[0] == 2 * 300 + 10
+
+    # a dry run moves nothing
+    counts = archive_stock_daily(engine, before, directory=directory, dryrun=True)
+    assert sum(counts.values()) == 2 * 40 + 9 and archived_months(directory) == []
+
+    counts = archive_stock_daily(engine, before, directory=directory)
+    assert sum(counts.values()) == 2 * 40 + 9
+    months = archived_months(directory)
+    assert months == sorted(counts) and months[0] == original['trade_day'][0].replace(day=1)
+    assert all(os.path.exists(partition_path(directory, m)) for m in months)
+
+    with Session(engine) as session:
+        assert session.execute(select(func.min(StockDaily.trade_day)).where(StockDaily.code == '600000')).scalar() == before
+        # the suspended stock's latest row stays
+        assert session.execute(select(func.count()).where(StockDaily.code == '600002')).scalar() == 1
+
+    # the archive and the table read as one, the same values and types
+    assert everything(engine, directory).equals(original)
+
+    # again, nothing but the suspended stock's row to move, merged into its month
+    archive_stock_daily(engine, before, directory=directory)
+    assert archived_months(directory) == months
+    assert everything(engine, directory).equals(original)
+
+    # a range of archived days only, of some codes
+    df = read_stock_daily(engine, original['trade_day'][0], original['trade_day'][0], ['close'], codes=['600001'], directory=directory)
+    assert df[['code', 'close']].values.tolist() == [['600001', original['close'][1]]]
+
+
+def test_price_panel_reads_the_archive(engine, tmp_path, monkeypatch):
+    monkeypatch.setenv('ARCHIVE_PATH', str(tmp_path))
+    start_day = trade_calendar().offset(TRADE_DAY, -299)
+
+    before = PricePanel.from_frame(everything(engine, str(tmp_path)))
+    archive_stock_daily(engine, archive_cutoff(TRADE_DAY))
+    after = load_price_panel(engine, start_day, TRADE_DAY)
+
+    assert after.shape == before.shape == (300, 3)
+    for field in ('open', 'close', 'volume'):
+        np.testing.assert_array_equal(after.fields[field], before.fields[field])
+
+
+def test_keeps_the_daily_window(engine, tmp_path):
+    with pytest.raises(ValueError):
+        archive_cutoff(TRADE_DAY, keep=MIN_KEEP_DAYS - 1)
+    with pytest.raises(ValueError):
+        archive_stock_daily(engine, trade_calendar().offset(TRADE_DAY, -10), directory=str(tmp_path))
+    assert archived_months(str(tmp_path)) == []
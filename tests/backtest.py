@@ -0,0 +1,229 @@
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from app.backtest.engine import BacktestConfig, run_backtest, simulate_trades
+from app.backtest.panel import PricePanel
+
+
+# --- Pytest Fixtures ---
+
+@pytest.fixture
+def panel():
+    """Three trade days, two codes, 'BBB' suspended on the second day."""
+    days = [date(2025, 3, 3), date(2025, 3, 4), date(2025, 3, 5)]
+    return PricePanel.from_frame(pd.DataFrame({
+        'code':         ['AAA', 'AAA', 'AAA', 'BBB', 'BBB'],
+        'trade_day':    [days[0], days[1], days[2], days[0], days[2]],
+        'open':         [10.0, 10.5, 11.0, 20.0, 19.0],
+        'close':        [10.0, 11.0, 11.5, 20.0, 19.5],
+    }))
+
+
+@pytest.fixture
+def picks():
+    return pd.DataFrame({
+        'filter_id':                [1, 1],
+        'trade_day':                [date(2025, 3, 3), date(2025, 3, 3)],
+        'code':                     ['AAA', 'BBB'],
+        'collection_performance':   [2.0, 1.0],
+    })
+
+
+@pytest.fixture
+def config():
+    return BacktestConfig(
+        capital=100_000.0,
+        position_size=0.1,
+        max_positions=5,
+        commission_rate=0.0,
+        min_commission=0.0,
+        stamp_tax_rate=0.0,
+    )
+
+
+# --- Test Functions ---
+
+def test_panel_from_frame(panel):
+    assert panel.shape == (3, 2)
+    assert np.isnan(panel.close[1, 1])
+    assert panel.day_index([date(2025, 3, 4), date(2025, 3, 6)]).tolist() == [1, -1]
+    assert panel.next_valid_index('close')[:, 1].tolist() == [2, 2, 3]
+
+
+def test_sell_at_next_open_skips_suspension(panel, picks, config):
+    trades = simulate_trades(picks, panel, config)
+
+    aaa = trades[trades['code'] == 'AAA'].iloc[0]
+    assert aaa['sell_day'] == date(2025, 3, 4)
+    assert aaa['shares'] == 1000
+    assert aaa['pnl'] == pytest.approx(500.0)
+
+    # suspended on 3-4, T+1 sell falls to the next bar
+    bbb = trades[trades['code'] == 'BBB'].iloc[0]
+    assert bbb['sell_day'] == date(2025, 3, 5)
+    assert bbb['shares'] == 500
+    assert bbb['pnl'] == pytest.approx(-500.0)
+
+
+def test_max_positions_ranks_by_collection_performance(panel, picks, config):
+    config.max_positions = 1
+    trades = simulate_trades(picks, panel, config)
+
+    assert trades['code'].tolist() == ['AAA']
+
+
+def test_fees_and_equity(panel, picks):
+    config = BacktestConfig(capital=100_000.0, exit='next_close')
+    results = run_backtest(picks, panel, config)
+
+    result = results[1]
+    trades = result.trades
+    expected_fee = (
+        max(10_000 * 0.00025, 5.0) + max(11_000 * 0.00025, 5.0) + 11_000 * 0.0005
+        + max(10_000 * 0.00025, 5.0) + max(9_750 * 0.00025, 5.0) + 9_750 * 0.0005
+    )
+    assert trades['fee'].sum() == pytest.approx(expected_fee)
+    assert result.stats['trades'] == 2
+    assert result.stats['win_rate'] == pytest.approx(0.5)
+    assert result.equity.iloc[-1] == pytest.approx(100_000.0 + trades['pnl'].sum())
+
+
+def test_open_position_marked_to_last_close(panel, config):
+    picks = pd.DataFrame({
+        'filter_id':                [1],
+        'trade_day':                [date(2025, 3, 5)],
+        'code':                     ['AAA'],
+        'collection_performance':   [0.0],
+    })
+    trades = simulate_trades(picks, panel, config)
+
+    assert not trades['closed'].iloc[0]
+    assert trades['pnl'].iloc[0] == pytest.approx(0.0)
+
+
+def test_split_windows():
+    from app.backtest.walk_forward import split_windows
+
+    assert split_windows(10, 2, train=4, test=2) == [(2, 6, 8), (4, 8, 10)]
+    assert split_windows(10, 2, train=4, test=2, step=3) == [(2, 6, 8)]
+
+
+def test_unknown_objective_is_rejected(panel):
+    from app.backtest.walk_forward import walk_forward, walk_forward_from_db
+
+    # before a panel loads or a worker starts
+    with pytest.raises(ValueError, match="max_drawdown"):
+        walk_forward_from_db(None, date(2025, 3, 3), date(2025, 3, 5), objective='max_drawdown')
+    with pytest.raises(ValueError, match="sharp "):
+        walk_forward(panel, objective='sharp')
+
+
+def test_rolling_mean_requires_full_window():
+    from app.backtest.walk_forward import rolling_mean
+
+    values = np.array([[1.0], [2.0], [np.nan], [4.0], [5.0], [6.0]])
+    result = rolling_mean(values, 2)[:, 0]
+
+    assert np.isnan(result[[0, 2, 3]]).all()
+    assert result[[1, 4, 5]].tolist() == [1.5, 4.5, 5.5]
+
+    # a window with a gap counts with enough rows
+    result = rolling_mean(values, 3, min_rows=2)[:, 0]
+    assert np.isnan(result[0])
+    assert result[1:].tolist() == [1.5, 1.5, 3.0, 4.5, 5.0]
+
+
+def test_poisson_batch_is_seeded_and_ragged():
+    from app.utils.backtest import simulate_poisson_events_batch
+
+    events = simulate_poisson_events_batch(0.7, 20_000, duration=30, seed=7)
+    again = simulate_poisson_events_batch(0.7, 20_000, duration=30, seed=7)
+
+    assert len(events) == 20_000
+    assert np.array_equal(events.values, again.values)
+    assert events.offsets[-1] == len(events.values)
+    assert ((events.values > 0) & (events.values <= 30)).all()
+    assert all(np.all(np.diff(events[i]) > 0) for i in range(100))
+    assert (events.counts > 0).mean() == pytest.approx(0.7, abs=0.02)
+
+
+def test_incremental_state_matches_full_recompute(panel, config):
+    from app.backtest.state import apply_trades, empty_state, state_stats, _positions_frame
+
+    days = panel.days.tolist()
+    picks = pd.DataFrame({
+        'filter_id':                [1, 1, 1],
+        'trade_day':                [days[0], days[0], days[1]],
+        'code':                     ['AAA', 'BBB', 'AAA'],
+        'collection_performance':   [2.0, 1.0, 0.0],
+    })
+
+    full = apply_trades(empty_state(), simulate_trades(picks, panel, config), days, config)
+
+    # day by day, carrying open positions
+    state = empty_state()
+    for i, day in enumerate(days):
+        todays = pd.concat([_positions_frame(state), picks[picks['trade_day'] == day]], ignore_index=True)
+        start = min(todays['trade_day']) if todays.shape[0] else day
+        sliced = panel.slice_days(days.index(start), i + 1)
+        state = apply_trades(state, simulate_trades(todays, sliced, config), [day], config)
+
+    assert state['equity'] == full['equity']
+    assert state['positions'] == full['positions']
+    assert state_stats(state, config) == pytest.approx(state_stats(full, config))
+
+
+def test_state_recomputed_from_another_start(engine, config):
+    from sqlalchemy.orm import Session
+
+    from app.backtest.state import extend_backtest_state
+    from app.db.models import BacktestState, FeedDaily, StockDaily
+
+    days = [date(2025, 3, 3), date(2025, 3, 4), date(2025, 3, 5), date(2025, 3, 6)]
+    with Session(engine) as session:
+        session.add_all([StockDaily(code='600000', trade_day=day, open=10 + i, high=11 + i, low=9 + i, close=10 + i, volume=1) for i, day in enumerate(days)])
+        session.add_all([
+            FeedDaily(
+                code='600000', trade_day=day, filter_id=1, name='A', previous_close=10, close=10,
+                previous_volume=1, volume=1, gain=0, volume_gain=0, collection_performance=1,
+            )
+            for day in days[:3]
+        ])
+        session.commit()
+
+    first = extend_backtest_state(engine, days[-1], filter_id=1, config=config, start_day=days[0])
+    later = extend_backtest_state(engine, days[-1], filter_id=1, config=config, start_day=days[1])
+    assert later['trades'] == first['trades'] - 1
+
+    with Session(engine) as session:
+        assert [row.start_day for row in session.query(BacktestState)] == [days[1]]
+    # no start keeps the state's
+    assert extend_backtest_state(engine, days[-1], filter_id=1, config=config) == later
+
+
+def test_state_keeps_days_without_picks(engine, config):
+    from sqlalchemy.orm import Session
+
+    from app.backtest.state import extend_backtest_state
+    from app.db.models import BacktestState, FeedDaily, StockDaily
+
+    # 2025-03-08/09 is a weekend, nothing is held after 03-04 or picked after 03-03
+    days = [date(2025, 3, 3), date(2025, 3, 4), date(2025, 3, 5), date(2025, 3, 6), date(2025, 3, 7), date(2025, 3, 10)]
+    with Session(engine) as session:
+        session.add_all([StockDaily(code='600000', trade_day=day, open=10 + i, high=11 + i, low=9 + i, close=10 + i, volume=1) for i, day in enumerate(days[:2])])
+        session.add(FeedDaily(
+            code='600000', trade_day=days[0], filter_id=1, name='A', previous_close=10, close=10,
+            previous_volume=1, volume=1, gain=0, volume_gain=0, collection_performance=1,
+        ))
+        session.commit()
+
+    extend_backtest_state(engine, days[3], filter_id=1, config=config, start_day=days[0])
+    stats = extend_backtest_state(engine, days[-1], filter_id=1, config=config)
+    assert stats['trades'] == 1
+
+    with Session(engine) as session:
+        state = session.query(BacktestState).one().state
+    assert [day for day, _ in state['equity']] == [day.isoformat() for day in days]
+    assert state['stats']['days'] == len(days)
@@ -0,0 +1,38 @@
+from datetime import time
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.db.engine import engine_mock
+from app.db.models import Market, MetadataBase, Stock
+
+
+# --- Pytest Fixtures ---
+
+@pytest.fixture
+def empty_engine():
+    '''
+    An in-memory database with every table and no rows.
+    '''
+    engine = engine_mock()
+    MetadataBase.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def engine(empty_engine):
+    '''
+    The Shanghai market, closing at 15:00, and its stock 600000. Test modules
+    add their own rows by overriding it:
+
+        @pytest.fixture
+        def engine(engine):
+            ...
+            return engine
+    '''
+    with Session(empty_engine) as session:
+        session.add(Market(id=1, name='Shanghai', name_short='SSE', country='CN', close=time(15, 0)))
+        session.flush()
+        session.add(Stock(code='600000', name='A', market_id=1))
+        session.commit()
+    return empty_engine
@@ -0,0 +1,73 @@
+from argparse import Namespace
+from datetime import date
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+import app.db.load as load
+import app.display.tdx as tdx
+from app.db.context import RunContext
+from app.db.models import Market, MetadataBase, Stock, TradeDay
+from app.main import run_task
+
+
+# --- Test Functions ---
+
+def test_run_context_trade_days(engine):
+    # a sunday resolves to the friday before
+    with RunContext.create(engine, date(2025, 3, 9)) as ctx:
+        assert ctx.trade_day == date(2025, 3, 7)
+        assert ctx.previous_day == date(2025, 3, 6)
+
+
+def test_run_context_shares_one_connection(engine):
+    ctx = RunContext.create(engine, date(2025, 3, 10))
+    connection = ctx.bind
+    assert ctx.bind is connection
+
+    with Session(ctx.bind) as session:
+        assert session.get(Stock, '600000') is not None
+
+    ctx.close()
+    assert connection.closed
+    assert ctx.bind is not connection
+    ctx.close()
+
+
+def test_run_context_catalog_without_postgresql(engine):
+    with RunContext.create(engine, date(2025, 3, 10)) as ctx:
+        assert not ctx.mv_procedure_exists()
+        assert not ctx.mv_exists(previous=True)
+        assert not ctx.mv_exists(previous=False)
+
+
+def test_run_context_code_market_map(engine, monkeypatch):
+    monkeypatch.setattr(tdx, '_code_market', None)
+
+    with RunContext.create(engine, date(2025, 3, 10)) as ctx:
+        markets = ctx.code_market_map()
+    assert markets.to_dict() == {'600000': 'SSE'}
+    # later callers get the cached map without a query
+    assert tdx.code_market_map(engine) is markets
+
+
+def test_run_context_writes_survive_close(tmp_path, monkeypatch):
+    # a file, so the run's connection and the writers' are not the same
+    engine = create_engine(f"sqlite:///{tmp_path / 'run.db'}")
+    MetadataBase.metadata.create_all(engine)
+
+    def load_market(engine):
+        with Session(engine) as session:
+            session.add(Market(id=1, name='Shanghai', name_short='SSE'))
+            session.commit()
+
+    monkeypatch.setattr(load, 'load_market', load_market)
+
+    with RunContext.create(engine, date(2025, 3, 10)) as ctx:
+        # a lookup leaves the run's connection in a transaction
+        assert ctx.bind.execute(select(func.count()).select_from(Market)).scalar() == 0
+        ctx.ensure_trade_calendar()
+        run_task(Namespace(task='load', load='market', dryrun=False), ctx)
+
+    with Session(engine) as session:
+        assert session.execute(select(func.count()).select_from(Market)).scalar() == 1
+        assert session.execute(select(func.count()).select_from(TradeDay)).scalar() > 0
@@ -0,0 +1,126 @@
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from app.db.context import RunContext
+from app.profile.tracer import span, tracer
+from app.utils.dag import TaskFailed, TaskGraph
+from app.utils.pipeline import build_run_graph
+
+
+def sleeper(secs, log=None, name=None):
+    def func():
+        if log is not None:
+            log.append((name, 'start'))
+        time.sleep(secs)
+        if log is not None:
+            log.append((name, 'end'))
+        return name
+    return func
+
+
+# --- Test Functions ---
+
+def test_dependencies_from_inputs_and_outputs():
+    graph = TaskGraph()
+    graph.add('a', sleeper(0), outputs=['x'])
+    graph.add('b', sleeper(0), outputs=['y'])
+    graph.add('c', sleeper(0), inputs=['x'], outputs=['z'])
+    # writes what c reads
+    graph.add('d', sleeper(0), outputs=['x'])
+    graph.add('e', sleeper(0), after=['b'])
+
+    assert graph.tasks['a'].depends_on == set()
+    assert graph.tasks['b'].depends_on == set()
+    assert graph.tasks['c'].depends_on == {'a'}
+    assert graph.tasks['d'].depends_on == {'a', 'c'}
+    assert graph.tasks['e'].depends_on == {'b'}
+    assert graph.dependents('a') == {'c', 'd'}
+
+    with pytest.raises(ValueError):
+        graph.add('a', sleeper(0))
+    with pytest.raises(ValueError):
+        graph.add('f', sleeper(0), after=['g'])
+
+
+def test_independent_tasks_run_concurrently():
+    log = []
+    graph = TaskGraph()
+    graph.add('stock', sleeper(0.2, log, 'stock'), outputs=['stock_daily'])
+    graph.add('board', sleeper(0.2, log, 'board'), outputs=['collection_daily'])
+    graph.add('filter', sleeper(0.1, log, 'filter'), inputs=['stock_daily', 'collection_daily'], outputs=['picks'])
+    graph.add('sheet', sleeper(0.1, log, 'sheet'), inputs=['picks'])
+    graph.add('tdx', sleeper(0.1, log, 'tdx'), inputs=['picks'])
+
+    report = graph.run(workers=4)
+    assert report.wall < 0.55
+    assert report.critical_path[0] in ('stock', 'board') and report.critical_path[1:2] == ['filter']
+    assert report.critical_seconds == pytest.approx(0.4, abs=0.1)
+    assert report.busy_seconds == pytest.approx(0.7, abs=0.1)
+    assert graph.results['sheet'] == 'sheet'
+
+    # filter starts once both inputs are written
+    assert log.index(('filter', 'start')) > max(log.index(('stock', 'end')), log.index(('board', 'end')))
+
+    sequential = TaskGraph()
+    for task in graph.tasks.values():
+        sequential.add(task.name, task.func, task.inputs, task.outputs)
+    assert sequential.run(workers=1).wall >= 0.7
+
+
+def test_failure_skips_dependents():
+    ran = []
+    graph = TaskGraph()
+
+    def fail():
+        raise ConnectionError('dropped')
+
+    graph.add('stock', fail, outputs=['stock_daily'])
+    graph.add('board', lambda: ran.append('board'), outputs=['collection_daily'])
+    graph.add('filter', lambda: ran.append('filter'), inputs=['stock_daily', 'collection_daily'], outputs=['picks'])
+    graph.add('display', lambda: ran.append('display'), inputs=['picks'])
+
+    with pytest.raises(TaskFailed) as e:
+        graph.run(workers=2)
+    assert isinstance(e.value.__cause__, ConnectionError)
+    assert ran == ['board']
+
+
+def test_task_spans_nest_under_the_caller():
+    tracer.reset()
+    tracer.enable()
+    threads = set()
+    try:
+        graph = TaskGraph()
+        graph.add('a', lambda: threads.add(threading.current_thread().name))
+        graph.add('b', lambda: threads.add(threading.current_thread().name))
+        with span('run'):
+            graph.run(workers=2)
+    finally:
+        tracer.disable()
+
+    records = {r.name: r for r in tracer.spans}
+    assert records['dag.a'].parent == 'run' and records['dag.a'].depth == records['run'].depth + 1
+    assert all(name.startswith('dag') for name in threads)
+    tracer.reset()
+
+
+def test_pipeline_graph(engine):
+    with RunContext.create(engine, date(2025, 3, 10)) as ctx:
+        graph = build_run_graph(ctx, yes=True)
+        tasks = graph.tasks
+
+        # sqlite has no materialized views
+        assert 'update.mv_previous' not in tasks
+        assert tasks['ingest.collection_daily'].depends_on == set()
+        assert tasks['ingest.stock_daily'].depends_on == {'ingest.history'}
+        assert tasks['filter'].depends_on == {'ingest.history', 'ingest.stock_daily', 'ingest.collection_daily', 'update.ma250'}
+        assert tasks['display'].depends_on == {'feed'}
+        assert tasks['label'].depends_on == {'ingest.history', 'ingest.stock_daily', 'feed'}
+        assert 'display' not in graph.dependents('label')
+
+        graph = build_run_graph(ctx, skip_hist_fill=True, dryrun=True, yes=True)
+        assert 'ingest.history' not in graph.tasks and 'label' not in graph.tasks
+        assert graph.tasks['display'].depends_on == {'feed'}
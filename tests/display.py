@@ -0,0 +1,98 @@
+import pytest
+import numpy as np
+import pandas as pd
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+
+from app.display.fanout import Sink, display_sinks, run_sinks
+from app.display.utils import (
+    color_channels,
+    fixed_format_series,
+    ten_thousand_format,
+    ten_thousand_format_series,
+)
+
+
+# --- Test Functions ---
+
+@pytest.mark.parametrize("values", [
+    [0, 5, 1234, 12345, -123456789, 10**18],
+    [12345.5, -0.5, float('nan'), 1e20, 123456789.25],
+    [],
+])
+def test_ten_thousand_format_series(values):
+    series = pd.Series(values)
+    assert ten_thousand_format_series(series).tolist() == [ten_thousand_format(v) for v in series]
+
+
+def test_fixed_format_series():
+    floats = pd.Series([1.005, -0.001, 12.3456, float('nan')])
+    assert fixed_format_series(floats, 2, '%').tolist() == [format(v, '.2f') + '%' for v in floats]
+
+    # Decimal rounds half to even on the exact value
+    decimals = pd.Series([Decimal('10.135'), Decimal('10.125')], dtype=object)
+    assert fixed_format_series(decimals, 2).tolist() == ['10.14', '10.12']
+
+
+def test_color_channels():
+    series = pd.Series([10.0, 0.0, -5.0, 20.0, -10.0])
+    channels = color_channels(series)
+
+    assert channels.shape == (5, 3)
+    assert channels[1].tolist() == [1.0, 1.0, 1.0]
+    # max of positives and min of negatives reach the strongest shade
+    assert channels[3].tolist() == [1.0, round(1 - np.log10(3), 3), round(1 - np.log10(3), 3)]
+    assert channels[4].tolist() == [round(1 - np.log10(3), 3), 1.0, round(1 - np.log10(3), 3)]
+    # positives are scaled between min and max of the whole column
+    assert channels[0].tolist() == [1.0, round(1 - np.log10(2 * 20 / 30 + 1), 3), round(1 - np.log10(2 * 20 / 30 + 1), 3)]
+
+
+def test_run_sinks_isolates_slow_and_failing_sinks():
+    done = []
+
+    def slow():
+        time.sleep(0.5)
+        done.append('slow')
+
+    def fast():
+        done.append('fast')
+
+    def failing():
+        raise RuntimeError('sheets down')
+
+    start = time.perf_counter()
+    results = {r.name: r for r in run_sinks([
+        Sink('slow', slow, timeout=0.1),
+        Sink('failing', failing, timeout=1.0),
+        Sink('fast', fast, timeout=1.0),
+    ])}
+
+    # the fast sink is not delayed by the slow one and nothing waits past the timeouts
+    assert done[0] == 'fast'
+    assert time.perf_counter() - start < 0.4
+    assert results['fast'].ok and results['fast'].elapsed < 0.1
+    assert results['slow'].timed_out and not results['slow'].ok
+    assert not results['failing'].ok and 'sheets down' in (results['failing'].error or '')
+
+
+def test_sheet_confirmation_is_asked_before_fan_out(monkeypatch):
+    from app.display import google_sheet
+
+    asked, published = [], []
+    monkeypatch.setattr(google_sheet, 'get_worksheet_properties', lambda refresh=False: {'2025-03-10': {'sheetId': 1}})
+    monkeypatch.setattr(google_sheet, 'confirms_execution', lambda action, **kwargs: asked.append(threading.current_thread()))
+    monkeypatch.setattr(google_sheet, 'add_df_to_new_sheet', lambda trade_day, df, yes: published.append(yes))
+
+    sinks = display_sinks(None, date(2025, 3, 10), pd.DataFrame({'code': ['600000']}), names=['sheet'])
+    assert asked == [threading.main_thread()]
+    sinks[0].func()
+    assert published == [True]
+
+    # a declined confirmation in a sink is reported like any failure
+    def declined():
+        exit()
+
+    results = run_sinks([Sink('sheet', declined, timeout=1.0)])
+    assert not results[0].ok and 'SystemExit' in (results[0].error or '')
@@ -0,0 +1,90 @@
+import pytest
+from datetime import date, datetime
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.db.models import FeedDaily, StockDaily
+from app.db.version import bump_version, snapshot
+from app.display.cache import ResultCache, feed_for_display
+from app.filter.tail_scraper import filter_inputs
+
+
+# --- Pytest Fixtures ---
+
+@pytest.fixture
+def engine(engine):
+    with Session(engine) as session:
+        session.add_all([
+            StockDaily(code='600000', trade_day=date(2025, 3, 10), close=10, last_updated=datetime(2025, 3, 10, 15)),
+            FeedDaily(
+                code='600000', trade_day=date(2025, 3, 10), filter_id=1, name='A',
+                previous_close=10, close=11, previous_volume=1, volume=2, gain=10, volume_gain=100,
+                last_updated=datetime(2025, 3, 10, 16),
+            ),
+        ])
+        bump_version(session, 'stock_daily', [date(2025, 3, 10)])
+        bump_version(session, 'feed_daily', [date(2025, 3, 10)], inputs=snapshot(session, filter_inputs(date(2025, 3, 10))))
+        session.commit()
+    return engine
+
+
+# --- Test Functions ---
+
+def test_feed_for_display_cache(engine):
+    cache = ResultCache(maxsize=2)
+
+    df = feed_for_display(engine, date(2025, 3, 10), filter_id=1, cache=cache)
+    assert df['code'].tolist() == ['600000']
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    feed_for_display(engine, date(2025, 3, 10), filter_id=1, cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # stock_daily of that day changed, new version and the feed is now stale,
+    # which falls back to the filter, postgresql only
+    with Session(engine) as session:
+        session.execute(update(StockDaily).values(close=12, last_updated=datetime(2025, 3, 10, 17)))
+        bump_version(session, 'stock_daily', [date(2025, 3, 10)])
+        session.commit()
+    with pytest.raises(Exception, match="Not implemented"):
+        feed_for_display(engine, date(2025, 3, 10), filter_id=1, cache=cache)
+    assert cache.misses == 2
+
+
+def test_refiltered_picks_are_persisted(engine, monkeypatch):
+    from app.filter import tail_scraper
+
+    def filter_desired(engine, trade_day, materialized):
+        return [FeedDaily(
+            code='600000', trade_day=trade_day, filter_id=1, name='A',
+            previous_close=10, close=12, previous_volume=1, volume=2, gain=20, volume_gain=100,
+        )] if trade_day == date(2025, 3, 10) else []
+
+    with Session(engine) as session:
+        bump_version(session, 'stock_daily', [date(2025, 3, 10)])
+        session.commit()
+    monkeypatch.setattr(tail_scraper, 'filter_desired', filter_desired)
+    assert feed_for_display(engine, date(2025, 3, 10), filter_id=1, cache=ResultCache())['close'].tolist() == [12]
+    # a day without picks too
+    assert feed_for_display(engine, date(2025, 3, 11), filter_id=1, cache=ResultCache()).shape[0] == 0
+
+    # another process reads them from feed_daily
+    def not_again(**kwargs):
+        raise AssertionError("filtered again")
+
+    monkeypatch.setattr(tail_scraper, 'filter_desired', not_again)
+    assert feed_for_display(engine, date(2025, 3, 10), filter_id=1, cache=ResultCache())['close'].tolist() == [12]
+    assert feed_for_display(engine, date(2025, 3, 11), filter_id=1, cache=ResultCache()).shape[0] == 0
+
+
+def test_result_cache_evicts_least_recently_used():
+    import pandas as pd
+
+    cache = ResultCache(maxsize=2)
+    for day in range(3):
+        cache.put((date(2025, 3, day + 1), 1, ()), pd.DataFrame({'a': [day]}))
+
+    assert len(cache) == 2
+    assert cache.get((date(2025, 3, 1), 1, ())) is None
+    cache.invalidate(date(2025, 3, 2))
+    assert len(cache) == 1
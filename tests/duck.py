@@ -0,0 +1,105 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from app.constant.collection import CollectionType
+from app.constant.schedule import trade_calendar
+from app.db.duck import EXPORT_TABLES, duckdb_ddl, export_to_duckdb
+from app.db.models import (
+    Collection,
+    CollectionDaily,
+    RelationCollectionStock,
+    Stock,
+    StockDaily,
+)
+from app.db.trade_calendar import refresh_trade_calendar
+from app.filter.tail_scraper import build_stmt_duckdb
+
+
+TRADE_DAY = date(2025, 3, 10)
+
+
+# --- Pytest Fixtures ---
+
+@pytest.fixture
+def source(engine):
+    '''
+    Two stocks of one board, 600000 matching the tail scraper on TRADE_DAY, 600001 gaining too much.
+    '''
+    refresh_trade_calendar(engine)
+
+    calendar = trade_calendar()
+    days = calendar.range(calendar.offset(TRADE_DAY, -260), TRADE_DAY)
+    previous = days[-2]
+
+    with Session(engine) as session:
+        session.add_all([
+            Stock(code='600001', name='B', market_id=1),
+            Collection(code='BK0001', name='Banks', type=CollectionType.INDUSTRY_BOARD),
+            RelationCollectionStock(collection_code='BK0001', stock_code='600000'),
+            RelationCollectionStock(collection_code='BK0001', stock_code='600001'),
+            CollectionDaily(code='BK0001', trade_day=TRADE_DAY, change_rate=1.0),
+        ])
+        for code, close in (('600000', 10.4), ('600001', 10.8)):
+            for day in days:
+                session.add(StockDaily(
+                    code=code,
+                    trade_day=day,
+                    open=10.0,
+                    low=10.1 if day == TRADE_DAY else 10.0,
+                    high=close if day == TRADE_DAY else 10.0,
+                    close=close if day == TRADE_DAY else 10.0,
+                    volume=2000 if day == TRADE_DAY else (900 if day == previous else 1000),
+                    circulation_capital=5_000_000_000,
+                    quantity_relative_ratio=1.5,
+                    turnover_rate=6.0,
+                ))
+        session.commit()
+    return engine
+
+
+# --- Test Functions ---
+
+def test_duckdb_ddl():
+    dialect = postgresql.dialect()
+    ddls = {t.name: duckdb_ddl(t, dialect) for t in EXPORT_TABLES}
+
+    assert all('PRIMARY KEY' not in ddl and 'REFERENCES' not in ddl for ddl in ddls.values())
+    assert ddls['collection'] == 'CREATE OR REPLACE TABLE collection (code VARCHAR(30), name VARCHAR, type VARCHAR)'
+    assert 'close NUMERIC(10, 3)' in ddls['stock_daily'] and 'ma_250 FLOAT' in ddls['stock_daily']
+
+    # plain joins, no lateral
+    sql = str(build_stmt_duckdb(TRADE_DAY).compile(dialect=dialect))
+    assert 'LATERAL' not in sql and 'GROUP BY "window".code' in sql
+
+
+def test_update_and_filter_on_duckdb(source, tmp_path):
+    pytest.importorskip("duckdb_engine")
+    from app.db.engine import engine_duckdb
+    from app.filter.tail_scraper import filter_desired
+    from app.utils.update import calculate_ma250
+
+    target = engine_duckdb(path=str(tmp_path / 'test.duckdb'))
+    counts = export_to_duckdb(source, target, since=date(2024, 1, 1), parquet=str(tmp_path / 'parquet'), chunk_rows=100)
+    assert counts['stock_daily'] == 2 * 261 and counts['collection'] == 1
+
+    calculate_ma250(target, TRADE_DAY)
+    with Session(target) as session:
+        ma_250 = session.execute(
+            text("SELECT ma_250 FROM stock_daily WHERE code = '600000' AND trade_day = :day"), {'day': TRADE_DAY}
+        ).scalar()
+    assert ma_250 == pytest.approx((249 * 10.0 + 10.4) / 250)
+
+    fds = filter_desired(target, TRADE_DAY)
+    assert [fd.code for fd in fds] == ['600000']
+    assert fds[0].collection_name == 'Banks'
+    assert float(fds[0].gain) == pytest.approx(4.0)
+    assert fds[0].previous_volume == 900
+
+    # the Parquet copy, attached as views
+    attached = engine_duckdb(path=str(tmp_path / 'attached.duckdb'), parquet=str(tmp_path / 'parquet'))
+    with attached.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM stock_daily")).scalar() == 2 * 261
@@ -0,0 +1,78 @@
+import importlib
+import pytest
+import pandas as pd
+from datetime import date
+
+from app.display.fake_sheets import FakeSheetsServer
+
+
+# --- Pytest Fixtures ---
+
+@pytest.fixture
+def fake_server():
+    with FakeSheetsServer(latency=0.01) as server:
+        yield server
+
+
+@pytest.fixture
+def google_sheet(fake_server, monkeypatch):
+    """Imports google_sheet against the fake endpoint, with a fresh handle cache."""
+    monkeypatch.setenv("GOOGLE_SHEETS_ENDPOINT", fake_server.url)
+    monkeypatch.setenv("GOOGLE_SHEET_ID", "fake-sheet")
+    import app.display.google_sheet as module
+    return importlib.reload(module)
+
+
+@pytest.fixture
+def feed_df():
+    return pd.DataFrame({
+        'trade_day':                [date(2025, 3, 10)] * 3,
+        'code':                     ['000001', '000002', '600000'],
+        'name':                     ['A', 'B', 'C'],
+        'collection_name':          ['x', 'y', 'z'],
+        'collection_performance':   [1.5, 1.5, -0.5],
+        'previous_close':           [10.0, 11.0, 12.0],
+        'close':                    [10.4, 11.5, 12.5],
+        'gain':                     [4.0, 4.5, 4.2],
+        'previous_volume':          [1000, 20000, 300000],
+        'volume':                   [2000, 30000, 400000],
+        'volume_gain':              [100.0, 50.0, 33.3],
+    })
+
+
+# --- Test Functions ---
+
+def test_publish_is_one_batch_per_day(google_sheet, fake_server, feed_df):
+    google_sheet.add_df_to_new_sheet(date(2025, 3, 10), feed_df.copy(), yes=True)
+
+    # open_by_key and the cached sheet properties
+    assert fake_server.requests['get'] == 2
+    assert fake_server.requests['batchUpdate'] == 1
+
+    google_sheet.add_df_to_new_sheet(date(2025, 3, 10), feed_df.copy(), yes=True)
+    google_sheet.add_df_to_new_sheet(date(2025, 3, 11), feed_df.copy(), yes=True)
+
+    # handle reused, no metadata fetch
+    assert fake_server.requests['get'] == 2
+    assert fake_server.requests['batchUpdate'] == 3
+
+    spreadsheet = fake_server.spreadsheet("fake-sheet")
+    titles = sorted(p['title'] for p in spreadsheet.sheets.values())
+    assert titles == ['2025-03-10', '2025-03-11', 'Sheet1']
+
+    sheet_id = next(i for i, p in spreadsheet.sheets.items() if p['title'] == '2025-03-10')
+    cells = spreadsheet.cells[sheet_id]
+    assert cells[(0, 1)]['userEnteredValue']['stringValue'] == '股票代码'
+    assert cells[(3, 2)]['userEnteredValue']['stringValue'] == 'C'
+
+
+def test_merge_color_runs(google_sheet):
+    from gspread_formatting import Color # type: ignore
+
+    red = Color(red=1.0, green=0.5, blue=0.5)
+    white = Color(red=1.0, green=1.0, blue=1.0)
+    color_df = pd.DataFrame({'gain': [red, red, white, red]})
+
+    runs = google_sheet.merge_color_runs(color_df, {'gain': 7})
+
+    assert runs == [(7, 0, 2, (1.0, 0.5, 0.5)), (7, 3, 4, (1.0, 0.5, 0.5))]
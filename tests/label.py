@@ -0,0 +1,75 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from app.backtest.label import LABEL_COLUMNS, LABEL_GRACE_DAYS, ensure_label_columns, label_feed_daily
+from app.constant.schedule import trade_calendar
+from app.db.engine import engine_mock
+from app.db.models import FeedDaily, Market, MetadataBase, Stock, StockDaily
+
+
+PICK_DAY = date(2025, 3, 3)
+
+
+# --- Pytest Fixtures ---
+
+@pytest.fixture
+def engine(engine):
+    '''
+    Picks of 600000 and 600001 on PICK_DAY, 600001 delisted 5 trade days later.
+    '''
+    calendar = trade_calendar()
+    days = calendar.range(PICK_DAY, calendar.offset(PICK_DAY, 60))
+
+    with Session(engine) as session:
+        session.add(Stock(code='600001', name='B', market_id=1))
+        session.flush()
+        for i, day in enumerate(days):
+            for code in ('600000', '600001')[:2 if i <= 5 else 1]:
+                session.add(StockDaily(code=code, trade_day=day, open=10 + i, high=11 + i, low=8 + i, close=10 + i, volume=1))
+        for code in ('600000', '600001'):
+            session.add(FeedDaily(
+                code=code, trade_day=PICK_DAY, filter_id=1, name=code, previous_close=10, close=10,
+                previous_volume=1, volume=1, gain=0, volume_gain=0,
+            ))
+        session.commit()
+    return engine
+
+
+def labels(engine, code):
+    with Session(engine) as session:
+        return session.execute(
+            text(f"SELECT next_open, return_1d, return_5d, return_20d, max_drawdown FROM feed_daily WHERE code = '{code}'")
+        ).one()
+
+
+# --- Test Functions ---
+
+def test_label_feed_daily(engine):
+    calendar = trade_calendar()
+
+    assert label_feed_daily(engine, calendar.offset(PICK_DAY, 25)) == 2
+    next_open, return_1d, return_5d, return_20d, max_drawdown = labels(engine, '600000')
+    assert (float(next_open), return_1d, return_5d, return_20d) == (11.0, 10.0, 50.0, 200.0)
+    # the next day's low of 9 against the pick's close of 10
+    assert max_drawdown == pytest.approx(10.0)
+
+    # the delisted pick stops at its last trade day
+    assert labels(engine, '600001')[1:4] == (10.0, 50.0, None)
+
+    # matured picks are done, the partial one is relabeled within the grace days only
+    assert label_feed_daily(engine, calendar.offset(PICK_DAY, 25)) == 1
+    assert label_feed_daily(engine, calendar.offset(PICK_DAY, 20 + LABEL_GRACE_DAYS + 1)) == 0
+
+
+def test_ensure_label_columns():
+    engine = engine_mock()
+    MetadataBase.metadata.create_all(engine, tables=[Market.__table__, Stock.__table__])
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE feed_daily (code VARCHAR NOT NULL, trade_day DATE NOT NULL)"))
+
+    assert ensure_label_columns(engine) is True
+    assert set(LABEL_COLUMNS) <= {c['name'] for c in inspect(engine).get_columns('feed_daily')}
+    assert ensure_label_columns(engine) is False
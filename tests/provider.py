@@ -0,0 +1,163 @@
+import time
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.constant.collection import CollectionType
+from app.data.fake import FakeProvider, RecordingProvider
+from app.data.provider import AkshareProvider, DataProvider, ProviderError, get_provider, pull_stock_daily, set_provider, use_provider
+from app.data.synthetic import SyntheticMarket
+from app.db.ingest import load_individual_stock_daily_hist, refresh_stock_daily
+from app.db.models import Market, Stock, StockDaily
+
+
+TRADE_DAY = date(2025, 3, 10)
+
+
+# --- Pytest Fixtures ---
+
+@pytest.fixture(scope='module')
+def market():
+    return SyntheticMarket(codes=200, years=0.5, end_day=TRADE_DAY, seed=7)
+
+
+@pytest.fixture
+def provider(market):
+    return FakeProvider(market=market)
+
+
+# --- Test Functions ---
+
+def test_default_provider_is_akshare(monkeypatch):
+    monkeypatch.delenv('DATA_PROVIDER', raising=False)
+    set_provider(None)
+    assert isinstance(get_provider(), AkshareProvider)
+
+    with use_provider(FakeProvider(codes=10, years=0.1, trade_day=TRADE_DAY)) as fake:
+        assert get_provider() is fake
+    assert isinstance(get_provider(), AkshareProvider)
+    set_provider(None)
+
+
+def test_fake_frames_match_akshare_pulls(provider, market):
+    spot = provider.pull_stock_daily()
+    assert list(spot.columns) == [
+        'code', 'open', 'high', 'low', 'close', 'volume', 'turnover', 'capital',
+        'circulation_capital', 'quantity_relative_ratio', 'turnover_rate',
+    ]
+    assert isinstance(spot['close'].iloc[0], Decimal)
+    assert spot['code'].is_unique
+
+    code = spot['code'].iloc[0]
+    hist = provider.pull_stock_daily_hist(code, date(2025, 3, 3), TRADE_DAY)
+    assert list(hist.columns) == ['trade_day', 'open', 'high', 'low', 'close', 'volume', 'turnover']
+    assert hist['trade_day'].max() <= TRADE_DAY and hist.shape[0] <= 6
+
+    assert set(provider.pull_stocks('SSE')['code']) | set(provider.pull_stocks('SZSE')['code']) | set(provider.pull_stocks('BSE')['code']) == set(market.codes)
+    assert provider.pull_stocks('HKEX').empty
+
+    boards = provider.pull_collections(CollectionType.INDUSTRY_BOARD)
+    members = provider.pull_stocks_in_collection(CollectionType.INDUSTRY_BOARD, boards['name'].iloc[0])
+    assert set(members['code']) <= set(market.codes)
+    assert provider.pull_collection_daily(CollectionType.INDUSTRY_BOARD).shape[0] <= boards.shape[0]
+
+    with pytest.raises(KeyError):
+        provider.pull_stock_daily_hist('999999', date(2025, 3, 3), TRADE_DAY)
+
+
+def test_fake_is_deterministic(market):
+    a = FakeProvider(codes=50, years=0.2, trade_day=TRADE_DAY, seed=3).pull_stock_daily()
+    b = FakeProvider(codes=50, years=0.2, trade_day=TRADE_DAY, seed=3).pull_stock_daily()
+    assert a.equals(b)
+
+
+def test_latency_and_error_injection(market):
+    provider = FakeProvider(market=market, latency_ms=20, error_rate=0.5, seed=1)
+    codes = market.codes[:20]
+
+    start = time.perf_counter()
+    failed = []
+    for code in codes:
+        try:
+            provider.pull_stock_daily_hist(code, date(2025, 3, 3), TRADE_DAY)
+        except ProviderError:
+            failed.append(code)
+    assert time.perf_counter() - start >= 20 * 0.02
+    assert 0 < len(failed) < len(codes)
+    assert provider.errors['pull_stock_daily_hist'] == len(failed)
+
+    # the same seed fails the same calls, retries are new attempts
+    again = FakeProvider(market=market, error_rate=0.5, seed=1)
+    replay = []
+    for code in codes:
+        try:
+            again.pull_stock_daily_hist(code, date(2025, 3, 3), TRADE_DAY)
+        except ProviderError:
+            replay.append(code)
+    assert replay == failed
+    assert again.calls['pull_stock_daily_hist'] == len(codes)
+
+
+def test_recorded_frames_are_replayed(provider, tmp_path):
+    recorder = RecordingProvider(provider, str(tmp_path))
+    recorded = recorder.pull_stock_daily()
+
+    other = FakeProvider(codes=30, years=0.2, trade_day=TRADE_DAY, seed=99, recorded=str(tmp_path))
+    replayed = other.pull_stock_daily()
+    assert replayed['code'].tolist() == recorded['code'].tolist()
+    assert replayed['close'].tolist() == recorded['close'].tolist()
+    # not recorded, served from the synthetic market
+    assert other.pull_stocks('SSE').shape[0] < 30
+
+
+def test_ingest_through_fake_provider(market, empty_engine):
+    engine = empty_engine
+    with Session(engine) as session:
+        session.add_all([Market(id=i, name=str(i)) for i in (1, 2, 3)])
+        session.add_all([Stock(code=c, name=n, market_id=m) for c, n, m in market.stocks[['code', 'name', 'market_id']].itertuples(index=False)])
+        session.commit()
+
+    with use_provider(FakeProvider(market=market)):
+        assert pull_stock_daily().shape[0] == market.present[-1].sum()
+        refresh_stock_daily(engine, TRADE_DAY)
+        load_individual_stock_daily_hist(engine, {market.codes[0]: date(2025, 3, 3)}, date(2025, 3, 7))
+
+    with Session(engine) as session:
+        days = dict(session.execute(select(StockDaily.trade_day, func.count()).group_by(StockDaily.trade_day)).all())
+    assert days[TRADE_DAY] == market.present[-1].sum()
+    assert sum(n for d, n in days.items() if d < TRADE_DAY) <= 5
+
+
+def test_ingest_retries_and_skips_failing_codes(market, empty_engine):
+    engine = empty_engine
+    with Session(engine) as session:
+        session.add_all([Market(id=i, name=str(i)) for i in (1, 2, 3)])
+        session.add_all([Stock(code=c, name=n, market_id=m) for c, n, m in market.stocks[['code', 'name', 'market_id']].itertuples(index=False)])
+        session.commit()
+
+    codes = market.codes[:3]
+    pulls = []
+
+    class FlakyProvider(FakeProvider):
+        # the first pull of every code fails, all of codes[1]'s
+        def pull_stock_daily_hist(self, symbol, start_date, end_date, adjust='qfq'):
+            pulls.append(symbol)
+            if pulls.count(symbol) == 1 or symbol == codes[1]:
+                raise ProviderError(f"dropped {symbol}")
+            return super().pull_stock_daily_hist(symbol, start_date, end_date, adjust)
+
+    with use_provider(FlakyProvider(market=market)):
+        load_individual_stock_daily_hist(engine, {code: date(2025, 3, 3) for code in codes}, date(2025, 3, 7))
+
+    assert [pulls.count(code) for code in codes] == [2, 3, 2]
+    with Session(engine) as session:
+        loaded = set(session.execute(select(StockDaily.code).distinct()).scalars())
+    assert loaded == {codes[0], codes[2]}
+
+
+def test_provider_is_abstract():
+    with pytest.raises(TypeError):
+        DataProvider()                                                  # type: ignore
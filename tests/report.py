@@ -0,0 +1,54 @@
+import zipfile
+import pytest
+from datetime import date, timedelta
+from decimal import Decimal
+from sqlalchemy.orm import Session
+
+from app.db.models import FeedDaily, Stock
+from app.display.report import report_from_db
+
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+# --- Pytest Fixtures ---
+
+@pytest.fixture
+def engine(engine):
+    days = [date(2025, 3, 3) + timedelta(days=i) for i in range(3)]
+    with Session(engine) as session:
+        session.add(Stock(code='600001', name='B', market_id=1))
+        session.add_all([
+            FeedDaily(
+                code=code, trade_day=day, filter_id=0, name=code, collection_name='x',
+                collection_performance=gain / 2, previous_close=Decimal('10.125'), close=Decimal('10.5'),
+                previous_volume=12345, volume=123456789, gain=gain, volume_gain=gain * 10,
+            )
+            for day in days
+            for code, gain in [('600000', 4.0), ('600001', -2.0)]
+        ])
+        session.commit()
+    return engine
+
+
+# --- Test Functions ---
+
+def test_report_from_db(engine, tmp_path):
+    xlsx_path, parquet_path = report_from_db(engine, date(2025, 3, 3), date(2025, 3, 5), report_path=str(tmp_path))
+
+    # a sheet per day
+    with zipfile.ZipFile(xlsx_path) as xlsx:
+        workbook = xlsx.read('xl/workbook.xml').decode()
+        styles = xlsx.read('xl/styles.xml').decode()
+    assert [f'name="2025-03-0{d}"' in workbook for d in range(3, 6)] == [True] * 3
+    # the largest gain shaded red, the smallest green, numbers right aligned
+    assert '<fgColor rgb="FFFF8585"/>' in styles
+    assert '<fgColor rgb="FF85FF85"/>' in styles
+    assert 'horizontal="right"' in styles
+
+    # a row group per day, exact decimals
+    parquet = pq.ParquetFile(parquet_path)
+    assert parquet.num_row_groups == 3
+    table = parquet.read()
+    assert table.num_rows == 6
+    assert table.column('previous_close').to_pylist()[0] == Decimal('10.125')
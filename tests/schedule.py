@@ -0,0 +1,102 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.constant.schedule import (
+    TradeCalendar,
+    is_stock_market_open,
+    load_holidays,
+    next_trade_day,
+    previous_trade_day,
+    set_trade_calendar,
+    trade_calendar,
+)
+
+
+# --- Pytest Fixtures ---
+
+@pytest.fixture
+def calendar():
+    return TradeCalendar.from_csv()
+
+
+# --- Test Functions ---
+
+def test_matches_walking_the_days(calendar):
+    holidays = set(load_holidays())
+    assert date(2025, 2, 4) in holidays and date(2024, 10, 1) in holidays
+
+    def walk(day, step):
+        while day.weekday() >= 5 or day in holidays:
+            day += timedelta(days=step)
+        return day
+
+    day = date(2023, 1, 1)
+    while day <= date(2025, 12, 31):
+        assert calendar.is_open(day) == (day.weekday() < 5 and day not in holidays)
+        assert calendar.previous(day) == walk(day, -1)
+        assert calendar.previous(day, inclusive=False) == walk(day - timedelta(days=1), -1)
+        assert calendar.next(day) == walk(day, 1)
+        assert calendar.next(day, inclusive=False) == walk(day + timedelta(days=1), 1)
+        day += timedelta(days=1)
+
+
+def test_ordinal_arithmetic(calendar):
+    day = date(2025, 3, 10)
+    back = calendar.offset(day, -250)
+    assert calendar.is_open(back)
+    assert calendar.count(back, day) == 251
+    assert calendar.offset(back, 250) == day
+
+    # from a non-trade day, counted from the trade day before
+    assert calendar.offset(date(2025, 3, 9), 1) == day
+    assert calendar.offset(date(2025, 3, 9), 0) == date(2025, 3, 7)
+
+    days = calendar.range(date(2025, 1, 27), date(2025, 2, 10))
+    assert days == [date(2025, 1, 27), date(2025, 2, 5), date(2025, 2, 6), date(2025, 2, 7), date(2025, 2, 10)]
+    assert calendar.count(date(2025, 1, 27), date(2025, 2, 10)) == len(days)
+    assert calendar.count(date(2025, 2, 10), date(2025, 1, 27)) == 0
+
+    with pytest.raises(ValueError):
+        calendar.offset(date(1990, 1, 3), -10)
+
+
+def test_covers_the_years_of_the_data(calendar):
+    years = {d.year for d in load_holidays()}
+    assert calendar.first_year == min(years) and calendar.last_year == max(years)
+    assert calendar.covers(date(2026, 10, 1)) and not calendar.is_open(date(2026, 10, 1))
+    assert not calendar.covers(date(max(years) + 1, 1, 1))
+
+    with pytest.raises(ValueError):
+        calendar.previous(date(min(years) - 1, 12, 31))
+
+
+def test_extends_past_the_data(calendar):
+    last_year = calendar.last_year
+    day = date(last_year + 3, 6, 2)
+    assert calendar.offset(day, 500) > day
+    assert calendar.last_year > last_year + 3
+    # weekdays only without holiday rows
+    assert calendar.count(date(last_year + 2, 1, 1), date(last_year + 2, 12, 31)) == sum(
+        1 for i in range(366)
+        if (d := date(last_year + 2, 1, 1) + timedelta(days=i)).year == last_year + 2 and d.weekday() < 5
+    )
+
+
+def test_custom_holidays_file(tmp_path):
+    path = tmp_path / 'holidays.csv'
+    path.write_text("day,market,name\n2030-01-01,CN,New Year's Day\n2030-01-01,HK,New Year's Day\n2030-01-02,HK,Test\n")
+
+    set_trade_calendar(TradeCalendar.from_csv(str(path)))
+    try:
+        assert not is_stock_market_open(date(2030, 1, 1))
+        assert is_stock_market_open(date(2030, 1, 2))
+        assert next_trade_day(date(2030, 1, 1)) == date(2030, 1, 2)
+        # the calendar starts with the data
+        with pytest.raises(ValueError):
+            previous_trade_day(date(2030, 1, 1))
+    finally:
+        set_trade_calendar(None)
+
+    assert TradeCalendar.from_csv(str(path), market='HK').next(date(2030, 1, 1)) == date(2030, 1, 3)
+    assert trade_calendar().is_open(date(2025, 2, 4)) is False
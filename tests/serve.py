@@ -0,0 +1,148 @@
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.constant.schedule import trade_calendar
+from app.data.fake import FakeProvider
+from app.data.provider import use_provider
+from app.db.context import RunContext
+from app.db.market import market_close_times
+from app.db.models import Market
+from app.utils.serve import Scheduler, last_closed_day, next_triggers
+
+
+CST = ZoneInfo('Asia/Shanghai')
+HKT = ZoneInfo('Asia/Hong_Kong')
+
+CLOSES = {
+    'SSE':  time(15, 0, tzinfo=CST),
+    'SZSE': time(15, 0, tzinfo=CST),
+    'HKEX': time(16, 0, tzinfo=HKT),
+}
+
+
+# --- Pytest Fixtures ---
+
+@pytest.fixture
+def engine(engine):
+    with Session(engine) as session:
+        session.add(Market(id=2, name='Shenzhen', name_short='SZSE', country='CN', close=time(15, 0)))
+        session.commit()
+    return engine
+
+
+# --- Test Functions ---
+
+def test_next_triggers():
+    delay = timedelta(minutes=10)
+    calendar = trade_calendar()
+
+    triggers = next_triggers(CLOSES, datetime(2025, 3, 7, 14, 0, tzinfo=CST), delay, calendar)
+    assert [(t.at, t.trade_day, t.markets) for t in triggers] == [
+        (datetime(2025, 3, 7, 15, 10, tzinfo=CST), date(2025, 3, 7), ('SSE', 'SZSE')),
+        (datetime(2025, 3, 7, 16, 10, tzinfo=HKT), date(2025, 3, 7), ('HKEX',)),
+    ]
+
+    # after the close, over the weekend
+    triggers = next_triggers(CLOSES, datetime(2025, 3, 7, 15, 10, tzinfo=CST), delay, calendar)
+    assert [(t.trade_day, t.markets) for t in triggers] == [(date(2025, 3, 7), ('HKEX',)), (date(2025, 3, 10), ('SSE', 'SZSE'))]
+
+    # over the spring festival, from a host in UTC
+    now = datetime(2025, 1, 27, 7, 30, tzinfo=ZoneInfo('UTC'))
+    assert next_triggers({'SSE': CLOSES['SSE']}, now, delay, calendar)[0].trade_day == date(2025, 2, 5)
+
+    assert last_closed_day(CLOSES, datetime(2025, 3, 10, 15, 5, tzinfo=CST), delay, calendar) == date(2025, 3, 7)
+    assert last_closed_day(CLOSES, datetime(2025, 3, 10, 16, 30, tzinfo=CST), delay, calendar) == date(2025, 3, 10)
+
+
+def test_close_times_and_run_context(engine):
+    closes = market_close_times(engine)
+    assert closes['SSE'] == time(15, 0) and closes['SSE'].tzinfo == CST
+    # not in the market table
+    assert closes['BSE'] == time(15, 0, tzinfo=CST)
+
+    with RunContext.create(engine, date(2025, 3, 10)) as ctx:
+        assert not ctx.market_closed(now=datetime(2025, 3, 10, 14, 59, tzinfo=CST))
+        assert ctx.market_closed(now=datetime(2025, 3, 10, 8, 0, tzinfo=ZoneInfo('UTC')))
+
+
+def test_serve_runs_at_close(engine):
+    trigger = datetime(2025, 3, 10, 15, 0, tzinfo=CST)
+    offset = trigger - timedelta(seconds=0.3) - datetime.now(CST)
+    runs = []
+    attempts = []
+
+    def run(trade_day, close_times):
+        attempts.append(trade_day)
+        if len(attempts) == 1:
+            raise ConnectionError('dropped')
+        runs.append((trade_day, datetime.now(CST) + offset, set(close_times)))
+
+    scheduler = Scheduler(engine, run, delay_minutes=0, retries=1, retry_minutes=0, clock=lambda: datetime.now(CST) + offset)
+    with use_provider(FakeProvider(codes=10, years=0.1, trade_day=date(2025, 3, 7))):
+        scheduler.serve(now=True, max_runs=2)
+
+    # --now ran the last closed day, retried once, then the trigger at the close
+    assert attempts == [date(2025, 3, 7), date(2025, 3, 7), date(2025, 3, 10)]
+    assert [r[0] for r in runs] == [date(2025, 3, 7), date(2025, 3, 10)]
+    assert runs[-1][1] >= trigger
+    assert runs[-1][2] == {'SSE', 'SZSE', 'BSE'}
+    assert (scheduler.runs, scheduler.failures) == (2, 0)
+
+
+def test_stop_and_reload(engine):
+    scheduler = Scheduler(engine, lambda *_: None, delay_minutes=0)
+    with use_provider(FakeProvider(codes=10, years=0.1, trade_day=date(2025, 3, 7))):
+        scheduler.warm()
+    scheduler.reload()
+    assert not scheduler._sleep_until(datetime.now(CST) + timedelta(hours=1))
+
+    scheduler.stop()
+    scheduler.serve()
+    assert scheduler.runs == 0
+
+
+def test_failed_reload_keeps_warm_state(engine, monkeypatch):
+    from app.constant import schedule
+    from app.utils import serve
+
+    scheduler = Scheduler(engine, lambda *_: None, delay_minutes=0, retries=1, retry_minutes=0)
+    with use_provider(FakeProvider(codes=10, years=0.1, trade_day=date(2025, 3, 7))):
+        scheduler.warm()
+        calendar, close_times = schedule.trade_calendar(), scheduler.close_times
+
+        attempts = []
+        def market_close_times(engine):
+            attempts.append(engine)
+            # both attempts of the first reload, the first of the second
+            if len(attempts) <= 3:
+                raise ConnectionError('dropped')
+            return {'SSE': CLOSES['SSE']}
+
+        monkeypatch.setattr(serve, 'market_close_times', market_close_times)
+        assert not scheduler.rewarm()
+        assert len(attempts) == 2
+        assert scheduler.close_times is close_times and schedule.trade_calendar() is calendar
+
+        # the retry succeeds
+        assert scheduler.rewarm()
+        assert len(attempts) == 4 and scheduler.close_times == {'SSE': CLOSES['SSE']}
+
+
+def test_spans_dropped_after_each_run(engine, tmp_path):
+    from app.profile.tracer import span, tracer
+
+    def run(trade_day, close_times):
+        with span('task'):
+            pass
+
+    scheduler = Scheduler(engine, run, delay_minutes=0, trace_out=str(tmp_path / 'tracing.json'))
+    tracer.enable()
+    try:
+        assert scheduler.run_day(date(2025, 3, 7))
+        assert tracer.spans == []
+    finally:
+        tracer.disable()
+    assert (tmp_path / 'tracing-2025-03-07.json').exists()
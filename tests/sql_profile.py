@@ -0,0 +1,88 @@
+import json
+from datetime import date
+
+import pytest
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+import app.profile.tracer as tracer_module
+from app.db.models import Stock, StockDaily
+from app.profile.sql import fingerprint, instrument_sql, normalize
+from app.profile.tracer import Tracer, span
+
+
+# --- Pytest Fixtures ---
+
+@pytest.fixture
+def engine(engine):
+    with Session(engine) as session:
+        session.add(Stock(code='600001', name='B', market_id=1))
+        session.commit()
+    return engine
+
+
+@pytest.fixture
+def tracer(monkeypatch):
+    tracer = Tracer()
+    tracer.enable()
+    monkeypatch.setattr(tracer_module, 'tracer', tracer)
+    return tracer
+
+
+# --- Test Functions ---
+
+def test_normalize_groups_literals_and_lists():
+    assert normalize("SELECT *  FROM stock\n WHERE code = '600000' AND id > 3") == "SELECT * FROM stock WHERE code = ? AND id > ?"
+    assert normalize("SELECT * FROM mv_stock_daily_20250310 WHERE x = %(x_1)s::date") == "SELECT * FROM mv_stock_daily_20250310 WHERE x = ?::date"
+    assert fingerprint("SELECT 1 WHERE code IN (%s, %s)") == fingerprint("SELECT 2 WHERE code IN (%s, %s, %s)")
+    assert fingerprint("INSERT INTO t VALUES (?, ?), (?, ?)") == fingerprint("INSERT INTO t VALUES (?, ?), (?, ?), (?, ?)")
+    assert fingerprint("SELECT a FROM t") != fingerprint("SELECT b FROM t")
+
+
+def test_statements_are_aggregated_per_task(engine, tracer):
+    profiler = instrument_sql(engine, slow_ms=None)
+
+    with span('filter.filter_desired'):
+        for code in ('600000', '600001', '600002'):
+            with Session(engine) as session:
+                session.execute(select(Stock).where(Stock.code == code)).all()
+
+    with span('utils.update.calculate_ma250'):
+        with Session(engine) as session:
+            session.execute(
+                update(StockDaily).where(StockDaily.trade_day == date(2025, 3, 10)).values(ma_250=1)
+            )
+            session.execute(update(Stock).where(Stock.market_id == 1).values(market_id=1))
+            session.commit()
+
+    top = profiler.top(n=10, sort='count')
+    select_stats = top[0]
+    assert select_stats['count'] == 3
+    assert select_stats['tasks'] == {'filter.filter_desired': 3}
+    assert select_stats['statement'].startswith('SELECT stock.code')
+
+    update_stock = next(s for s in top if s['statement'].startswith('UPDATE stock '))
+    assert update_stock['rows'] == 2
+    assert update_stock['tasks'] == {'utils.update.calculate_ma250': 1}
+    assert all(s['plan'] is None for s in top)
+
+
+def test_slow_statements_get_a_plan(engine, tracer, tmp_path):
+    profiler = instrument_sql(engine, slow_ms=0)
+
+    with Session(engine) as session:
+        session.execute(select(Stock).where(Stock.code == '600000')).all()
+        session.execute(select(Stock).where(Stock.code == '600001')).all()
+
+    (stats,) = [s for s in profiler.top() if s['statement'].startswith('SELECT stock.code')]
+    assert stats['count'] == 2
+    # captured once, sqlite reports the plan of the primary key lookup
+    assert 'stock' in stats['plan'].lower()
+
+    table = profiler.format_table(n=5)
+    assert stats['fingerprint'] in table
+    assert f"Plan of {stats['fingerprint']}" in table
+
+    path = profiler.write_json(str(tmp_path / 'profile.json'))
+    with open(path) as f:
+        assert any(s['plan'] for s in json.load(f))
@@ -0,0 +1,55 @@
+import pytest
+from datetime import date, timedelta
+from sqlalchemy.orm import Session
+
+import app.display.tdx as tdx
+from app.db.models import FeedDaily, Market, Stock
+
+
+# --- Pytest Fixtures ---
+
+@pytest.fixture
+def engine(engine):
+    days = [date(2025, 3, 3) + timedelta(days=i) for i in range(4)]
+    with Session(engine) as session:
+        session.add(Market(id=2, name='Shenzhen', name_short='SZSE'))
+        session.flush()
+        session.add(Stock(code='000001', name='B', market_id=2))
+        session.add_all([
+            FeedDaily(
+                code=code, trade_day=day, filter_id=0, name=name,
+                previous_close=1, close=1, previous_volume=1, volume=1, gain=0, volume_gain=0,
+            )
+            for i, day in enumerate(days)
+            for code, name in [('600000', 'A'), ('000001', 'B')][:1 + i % 2]
+        ])
+        session.commit()
+    return engine
+
+
+@pytest.fixture
+def tdx_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(tdx, 'TDX_PATH', tmp_path)
+    monkeypatch.setattr(tdx, '_code_market', None)
+    return tmp_path
+
+
+# --- Test Functions ---
+
+def test_export_tdx_range(engine, tdx_path):
+    paths = tdx.export_tdx_range(engine, date(2025, 3, 3), date(2025, 3, 6), rolling_days=2)
+
+    assert [p.name for p in paths] == [f"tdx-stock-2025-03-0{d}.blk" for d in range(3, 7)]
+    assert (tdx_path / 'tdx-stock-2025-03-04.blk').read_text().splitlines() == ['0000001,B', '1600000,A']
+
+    # 03-05 and 03-06 only, 600000 once at 03-06
+    assert (tdx_path / 'tdx-stock-last2.blk').read_text().splitlines() == ['0000001,B', '1600000,A']
+    assert (tdx_path / 'tdx-stock-last2.days').read_text().splitlines() == ['2025-03-05 1', '2025-03-06 2']
+
+
+def test_rolling_block_rerun_replaces_last_day(engine, tdx_path):
+    tdx.export_tdx_range(engine, date(2025, 3, 3), date(2025, 3, 4), rolling_days=3)
+    tdx.add_to_tdx_path(engine, trade_day=date(2025, 3, 4), rolling_days=3)
+
+    assert (tdx_path / 'tdx-stock-last3.days').read_text().splitlines() == ['2025-03-03 1', '2025-03-04 2']
+    assert (tdx_path / 'tdx-stock-last3.blk').read_text().splitlines() == ['0000001,B', '1600000,A']
@@ -0,0 +1,97 @@
+import json
+import threading
+
+import pytest
+
+from app.profile.tracer import Tracer, annotate, span, trace_elapsed
+import app.profile.tracer as tracer_module
+
+
+# --- Pytest Fixtures ---
+
+@pytest.fixture
+def tracer(monkeypatch):
+    tracer = Tracer()
+    monkeypatch.setattr(tracer_module, 'tracer', tracer)
+    return tracer
+
+
+@trace_elapsed(name='load')
+def _load(rows: int) -> int:
+    with span('load.fetch', rows=rows):
+        pass
+    annotate(rows=rows)
+    return rows
+
+
+# --- Test Functions ---
+
+def test_trace_elapsed_keeps_function_metadata():
+    assert _load.__name__ == '_load'
+    assert _load.__wrapped__(3) == 3 # type: ignore
+
+
+def test_disabled_tracer_records_nothing(tracer):
+    assert _load(5) == 5
+    with span('idle') as s:
+        s.set(rows=1)
+    assert tracer.spans == []
+
+
+def test_spans_nest_with_attributes(tracer):
+    tracer.enable()
+    with span('run.all'):
+        _load(5)
+        _load(7)
+
+    by_name = {}
+    for record in tracer.spans:
+        by_name.setdefault(record.name, []).append(record)
+
+    root = by_name['run.all'][0]
+    loads = by_name['load']
+    fetches = by_name['load.fetch']
+    assert root.depth == 0 and root.parent is None
+    assert [r.depth for r in loads] == [1, 1]
+    assert {r.parent for r in loads} == {'run.all'}
+    assert [r.attrs['rows'] for r in loads] == [5, 7]
+    assert [(r.depth, r.parent) for r in fetches] == [(2, 'load')] * 2
+    assert all(root.start_ns <= r.start_ns and r.end_ns <= root.end_ns for r in loads)
+
+
+def test_span_records_error(tracer):
+    tracer.enable()
+    with pytest.raises(ValueError):
+        with span('failing'):
+            raise ValueError
+    assert tracer.spans[0].attrs == {'error': 'ValueError'}
+
+
+def test_summary_and_chrome_trace(tracer, tmp_path):
+    tracer.enable()
+    for rows in range(20):
+        _load(rows)
+
+    def sink():
+        with span('display.sink.tdx'):
+            pass
+
+    thread = threading.Thread(target=sink)
+    thread.start()
+    thread.join()
+
+    summary = tracer.summary()
+    assert summary['load']['count'] == 20
+    assert summary['load.fetch']['count'] == 20
+    stats = summary['load']
+    assert 0 <= stats['p50_ms'] <= stats['p95_ms'] <= stats['max_ms'] <= stats['total_ms']
+
+    path = tracer.write_chrome_trace(str(tmp_path / 'trace' / 'run.json'))
+    with open(path) as f:
+        events = json.load(f)['traceEvents']
+    assert len(events) == 41
+    assert {e['ph'] for e in events} == {'X'}
+    assert all(e['dur'] >= 0 and e['ts'] >= 0 for e in events)
+    # sinks run on their own threads, shown as their own timeline rows
+    assert len({e['tid'] for e in events}) == 2
+    assert [e['args']['rows'] for e in events if e['name'] == 'load.fetch'][:3] == [0, 1, 2]
@@ -0,0 +1,108 @@
+from datetime import date
+
+import numpy as np
+import pytest
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app.constant.schedule import TradeCalendar, load_holidays, set_trade_calendar, trade_calendar
+from app.data.synthetic import SyntheticMarket
+from app.db.models import Market, Stock, StockDaily, TradeDay
+from app.db.trade_calendar import ensure_trade_calendar, load_trade_calendar, min_window_rows, window_start
+from app.utils.update import build_stmt_postgresql
+
+
+TRADE_DAY = date(2025, 3, 10)
+
+
+# --- Pytest Fixtures ---
+
+@pytest.fixture
+def engine(empty_engine):
+    # markets and stocks of the synthetic market
+    return empty_engine
+
+
+@pytest.fixture(scope='module')
+def market():
+    return SyntheticMarket(codes=40, years=1.3, end_day=TRADE_DAY, seed=5, suspension_share=0.2)
+
+
+# --- Test Functions ---
+
+def test_ensure_and_load(engine):
+    TradeDay.__table__.drop(engine)
+    assert ensure_trade_calendar(engine, TRADE_DAY)
+    assert not ensure_trade_calendar(engine, TRADE_DAY)
+
+    with engine.connect() as connection:
+        assert not ensure_trade_calendar(connection, TRADE_DAY)
+
+    calendar = load_trade_calendar(engine)
+    assert calendar.days == trade_calendar().days[:len(calendar)]
+    assert calendar.offset(TRADE_DAY, -249) == trade_calendar().offset(TRADE_DAY, -249)
+
+    with Session(engine) as session:
+        assert session.execute(select(window_start(TRADE_DAY, 250))).scalar() == trade_calendar().offset(TRADE_DAY, -249)
+        assert session.execute(select(window_start(TRADE_DAY, 1))).scalar() == TRADE_DAY
+        assert session.execute(select(func.count()).select_from(TradeDay)).scalar() == len(calendar)
+
+
+def test_ensure_follows_holidays_csv(engine):
+    assert ensure_trade_calendar(engine, TRADE_DAY)
+
+    # a holiday added to the file rewrites the table, ordinals after it shift
+    holiday = date(2025, 3, 3)
+    set_trade_calendar(TradeCalendar(set(load_holidays()) | {holiday}))
+    try:
+        assert ensure_trade_calendar(engine, TRADE_DAY)
+        assert not ensure_trade_calendar(engine, TRADE_DAY)
+        with Session(engine) as session:
+            assert session.execute(select(TradeDay).where(TradeDay.day == holiday)).first() is None
+            assert session.execute(select(window_start(TRADE_DAY, 250))).scalar() == trade_calendar().offset(TRADE_DAY, -249)
+    finally:
+        set_trade_calendar(None)
+    assert ensure_trade_calendar(engine, TRADE_DAY)
+
+    # a year without holiday data fails the run
+    with pytest.raises(ValueError, match='No holiday data'):
+        ensure_trade_calendar(engine, date(trade_calendar().last_year + 1, 3, 2))
+
+
+def test_ma250_window_by_date(engine, market):
+    ensure_trade_calendar(engine, TRADE_DAY)
+    with Session(engine) as session:
+        session.add_all([Market(id=i, name=str(i)) for i in (1, 2, 3)])
+        session.add_all([Stock(code=c, name=n, market_id=m) for c, n, m in market.stocks[['code', 'name', 'market_id']].itertuples(index=False)])
+        session.commit()
+    for df in market.stock_daily_frames(TRADE_DAY):
+        df.to_sql('stock_daily', engine, if_exists='append', index=False)
+
+    # a code traded on every day of the window misses two of them
+    window = market.present[-250:].copy()
+    full = next(i for i in range(len(market.codes)) if window[:, i].all())
+    with Session(engine) as session:
+        session.execute(delete(StockDaily).where(
+            StockDaily.code == market.codes[full],
+            StockDaily.trade_day.in_(market.trade_days[-20:-18]),
+        ))
+        session.commit()
+    window[-20:-18, full] = False
+
+    # the statement is plain SQL but for the dialect gate in calculate_ma250
+    with Session(engine) as session:
+        got = {row.code: row.ma_250 for row in session.execute(build_stmt_postgresql(TRADE_DAY))}
+
+    # traded on nearly all of the last 250 trade days, averaged over those traded
+    expected = {
+        code: float(np.mean(market.close[-250:, i][window[:, i]]))
+        for i, code in enumerate(market.codes)
+        if window[:, i].sum() >= min_window_rows(250)
+    }
+    assert len(expected) < len(market.codes) and market.codes[full] in expected
+    assert got.keys() == expected.keys()
+    for code, value in expected.items():
+        assert got[code] == pytest.approx(value, abs=1e-3)
+
+    with Session(engine) as session:
+        assert session.execute(select(func.count()).select_from(StockDaily)).scalar() == market.present.sum() - 2
@@ -0,0 +1,137 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from app.backtest import panel as panel_module
+from app.backtest.panel import load_price_panel
+from app.db.engine import engine_mock
+from app.db.models import BacktestState, DataVersion, MetadataBase, StockDaily
+from app.db.version import bump_version, ensure_data_version, is_fresh, recorded_inputs, snapshot
+from app.filter.tail_scraper import filter_inputs
+
+
+DAYS = [date(2025, 3, 7), date(2025, 3, 10), date(2025, 3, 11)]
+
+
+# --- Pytest Fixtures ---
+
+@pytest.fixture
+def engine(engine):
+    with Session(engine) as session:
+        session.add_all([StockDaily(code='600000', trade_day=day, open=10, high=10, low=10, close=10, volume=1) for day in DAYS])
+        bump_version(session, StockDaily.__tablename__, DAYS)
+        session.commit()
+    return engine
+
+
+# --- Test Functions ---
+
+def test_bump_and_snapshot(engine):
+    inputs = {'stock_daily': (DAYS[0], DAYS[-1]), 'collection_daily': (DAYS[0], DAYS[-1])}
+    assert snapshot(engine, inputs) == {'collection_daily': 0, 'stock_daily': 3}
+
+    with Session(engine) as session:
+        # the same day twice is one write
+        bump_version(session, StockDaily.__tablename__, [DAYS[1], DAYS[1]])
+        bump_version(session, StockDaily.__tablename__, [])
+        session.commit()
+        versions = dict(session.execute(
+            text("SELECT trade_day, version FROM data_version WHERE table_name = 'stock_daily'")
+        ).all())
+    assert sorted(versions.values()) == [1, 1, 2]
+    assert snapshot(engine, inputs)['stock_daily'] == 4
+    assert snapshot(engine, {'stock_daily': (DAYS[0], DAYS[0])}) == {'stock_daily': 1}
+
+
+def test_is_fresh(engine):
+    inputs = {'stock_daily': (DAYS[0], DAYS[1])}
+    # never recorded
+    assert is_fresh(engine, 'feed_daily', DAYS[1], inputs) is None
+
+    with Session(engine) as session:
+        bump_version(session, 'feed_daily', [DAYS[1]], inputs=snapshot(session, inputs))
+        session.commit()
+    assert recorded_inputs(engine, 'feed_daily', DAYS[1]) == {'stock_daily': 2}
+    assert is_fresh(engine, 'feed_daily', DAYS[1], inputs) is True
+
+    # a write after the inputs' range leaves it fresh, one inside does not
+    with Session(engine) as session:
+        bump_version(session, StockDaily.__tablename__, [DAYS[2]])
+        session.commit()
+    assert is_fresh(engine, 'feed_daily', DAYS[1], inputs) is True
+
+    with Session(engine) as session:
+        bump_version(session, StockDaily.__tablename__, [DAYS[0]])
+        session.commit()
+    assert is_fresh(engine, 'feed_daily', DAYS[1], inputs) is False
+
+    # rebuilding records the new versions
+    with Session(engine) as session:
+        bump_version(session, 'feed_daily', [DAYS[1]], inputs=snapshot(session, inputs))
+        session.commit()
+    assert is_fresh(engine, 'feed_daily', DAYS[1], inputs) is True
+
+
+def test_filter_inputs_cover_the_materialized_window(engine):
+    day = DAYS[-1]
+    with Session(engine) as session:
+        for materialized in (True, False):
+            bump_version(session, f'feed_daily.{materialized}', [day], inputs=snapshot(session, filter_inputs(day, materialized)))
+        session.commit()
+
+    # a backfill older than the 5 day volume window, which the previous day's view averages over
+    backfill = filter_inputs(day, materialized=True)['stock_daily'][0]
+    with Session(engine) as session:
+        bump_version(session, StockDaily.__tablename__, [backfill])
+        session.commit()
+
+    assert is_fresh(engine, 'feed_daily.True', day, filter_inputs(day, materialized=True)) is False
+    assert is_fresh(engine, 'feed_daily.False', day, filter_inputs(day, materialized=False)) is True
+
+
+def test_ensure_data_version():
+    engine = engine_mock()
+    tables = [t for t in MetadataBase.metadata.sorted_tables if t.name not in (DataVersion.__tablename__, BacktestState.__tablename__)]
+    MetadataBase.metadata.create_all(engine, tables=tables)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE backtest_state (filter_id INTEGER NOT NULL, PRIMARY KEY (filter_id))"))
+
+    assert ensure_data_version(engine) is True
+    inspector = inspect(engine)
+    assert inspector.has_table(DataVersion.__tablename__)
+    assert 'data_versions' in {c['name'] for c in inspector.get_columns(BacktestState.__tablename__)}
+
+    assert ensure_data_version(engine) is False
+
+
+def test_ensure_data_version_creates_backtest_state():
+    from app.backtest.state import extend_backtest_state
+
+    # initialized before the backtest state existed
+    engine = engine_mock()
+    tables = [t for t in MetadataBase.metadata.sorted_tables if t.name not in (DataVersion.__tablename__, BacktestState.__tablename__)]
+    MetadataBase.metadata.create_all(engine, tables=tables)
+
+    assert ensure_data_version(engine) is True
+    assert inspect(engine).has_table(BacktestState.__tablename__)
+    assert ensure_data_version(engine) is False
+    # no picks yet, but the task runs
+    assert extend_backtest_state(engine, DAYS[-1], filter_id=1) == {}
+
+
+def test_price_panel_cached_by_version(engine, monkeypatch):
+    monkeypatch.setattr(panel_module, '_panel_cache', type(panel_module._panel_cache)())
+
+    panel = load_price_panel(engine, DAYS[0], DAYS[-1])
+    panel.fields['extra'] = panel.close
+    cached = load_price_panel(engine, DAYS[0], DAYS[-1])
+    assert cached.close is panel.close and 'extra' not in cached.fields
+
+    with Session(engine) as session:
+        session.query(StockDaily).filter(StockDaily.trade_day == DAYS[1]).update({'close': 11})
+        bump_version(session, StockDaily.__tablename__, [DAYS[1]])
+        session.commit()
+    reloaded = load_price_panel(engine, DAYS[0], DAYS[-1])
+    assert float(reloaded.close[1, 0]) == 11